@@ -0,0 +1,141 @@
+"""
+Clustering Engine Benchmark
+Measures wall-clock time and peak memory of the K-Means engines by customer count
+
+For each customer count a synthetic RFM table is written to Parquet, and
+each engine clusters it from the file in a fresh process: 'kmeans' loads
+the table and fits full-batch K-Means, 'minibatch' streams it in chunks.
+Peak memory is the growth of the process's maximum resident set size
+during the run (Linux/macOS only).
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clustering import CLUSTER_ENGINES, DEFAULT_CHUNK_ROWS, cluster_rfm  # noqa: E402
+from storage import write_table  # noqa: E402
+
+DEFAULT_SIZES = [100_000, 300_000, 1_000_000]
+
+
+def synthetic_rfm(num_customers, seed=42):
+    """
+    RFM table with the skew of real customer data
+
+    Args:
+        num_customers (int): Number of customers
+        seed (int): Random seed
+
+    Returns:
+        pd.DataFrame: customer_id, recency, frequency, monetary
+    """
+    rng = np.random.default_rng(seed)
+    frequency = rng.poisson(4, num_customers) + 1
+    return pd.DataFrame({
+        'customer_id': np.char.add('CUST', np.arange(1, num_customers + 1).astype(str)),
+        'recency': np.minimum(rng.exponential(150, num_customers), 1000).astype(np.int64),
+        'frequency': frequency,
+        'monetary': np.round(frequency * rng.lognormal(4.5, 0.8, num_customers), 2),
+    })
+
+
+def _rss_bytes():
+    """Current resident set size"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _max_rss_bytes():
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def _run_case(task):
+    """Cluster one file with one engine; runs in a fresh worker process"""
+    path, engine, n_clusters, chunksize = task
+    start_rss = _rss_bytes() if os.path.exists('/proc/self/statm') else _max_rss_bytes()
+    start = time.perf_counter()
+    result = cluster_rfm(path, n_clusters, engine=engine, chunksize=chunksize)
+    elapsed = time.perf_counter() - start
+    history = result['history'] or {}
+    return {
+        'seconds': elapsed,
+        'peak_mb': max(_max_rss_bytes() - start_rss, 0) / 1e6,
+        'inertia': result['inertia'],
+        'epochs': history.get('epochs'),
+    }
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, engines=CLUSTER_ENGINES, n_clusters=8,
+                  chunksize=DEFAULT_CHUNK_ROWS, workdir=None):
+    """
+    Time every engine at every customer count
+
+    Args:
+        sizes (list): Customer counts
+        engines (list): Engines to compare
+        n_clusters (int): Number of clusters
+        chunksize (int): Customers per chunk for the streaming engine
+        workdir (str): Directory for the synthetic files (default: a
+            temporary directory)
+
+    Returns:
+        pd.DataFrame: One row per (customers, engine)
+    """
+    rows = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, f'rfm_{size}.parquet')
+            write_table(synthetic_rfm(size), path)
+            for engine in engines:
+                # A new process per case so peak memory is not inherited
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    stats = pool.submit(_run_case, (path, engine, n_clusters, chunksize)).result()
+                rows.append({'customers': size, 'engine': engine, **stats})
+                print(f"  {size:>10,} customers  {engine:9s}  {stats['seconds']:8.2f}s  "
+                      f"{stats['peak_mb']:8.1f} MB peak  inertia={stats['inertia']:,.0f}")
+    return pd.DataFrame(rows)
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark clustering engines against customer count'
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Customer counts (default: 100000 300000 1000000)')
+    parser.add_argument('--engines', type=str, nargs='+', default=list(CLUSTER_ENGINES),
+                        choices=CLUSTER_ENGINES, help='Engines to compare (default: all)')
+    parser.add_argument('--clusters', type=int, default=8,
+                        help='Number of clusters (default: 8)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f'Customers per chunk for minibatch (default: {DEFAULT_CHUNK_ROWS:,})')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Optional CSV file for the results')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("CLUSTERING ENGINE BENCHMARK")
+    print("="*70 + "\n")
+    results = run_benchmark(args.sizes, args.engines, args.clusters, args.chunksize)
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"\n✓ Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Segment Service Load Test
+Drives segment_service.py with concurrent keep-alive clients and reports latency
+
+Each client holds one HTTP/1.1 connection and sends requests back to back
+for the test duration, drawing from a mix of single lookups, bulk lookups
+and /score requests. With --spawn the service is started in-process on a
+free port from the given results file and model directory.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segment_service import DEFAULT_HOST, DEFAULT_PORT, SegmentService  # noqa: E402
+from segmentation_model import MODEL_DIR  # noqa: E402
+from storage import read_table  # noqa: E402
+
+# Share of each request type in the mix
+DEFAULT_MIX = {'customer': 0.6, 'lookup': 0.1, 'score': 0.3}
+
+
+async def _request(reader, writer, method, path, payload=None):
+    body = b'' if payload is None else json.dumps(payload).encode()
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    length = next(int(line.split(':', 1)[1]) for line in lines[1:]
+                  if line.lower().startswith('content-length'))
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def _client(host, port, customer_ids, deadline, mix, bulk_size, seed, latencies):
+    rng = np.random.default_rng(seed)
+    kinds, weights = list(mix), np.array(list(mix.values()), dtype=float)
+    reader, writer = await asyncio.open_connection(host, port)
+    errors = 0
+    try:
+        while time.perf_counter() < deadline:
+            kind = kinds[rng.choice(len(kinds), p=weights / weights.sum())]
+            if kind == 'customer':
+                args = ('GET', f"/customers/{customer_ids[rng.integers(len(customer_ids))]}")
+            elif kind == 'lookup':
+                ids = customer_ids[rng.integers(len(customer_ids), size=bulk_size)].tolist()
+                args = ('POST', '/customers/lookup', {'customer_ids': ids})
+            else:
+                row = [int(rng.integers(1, 1000)), int(rng.integers(1, 30)),
+                       round(float(rng.random() * 5000), 2)]
+                args = ('POST', '/score', {'rows': [row]})
+            start = time.perf_counter()
+            status, _ = await _request(reader, writer, *args)
+            latencies[kind].append(time.perf_counter() - start)
+            errors += status >= 400
+    finally:
+        writer.close()
+    return errors
+
+
+async def run_load_test(host, port, customer_ids, concurrency=32, duration=10.0,
+                        mix=DEFAULT_MIX, bulk_size=100):
+    """
+    Run concurrent clients against a running service
+
+    Args:
+        host (str): Service host
+        port (int): Service port
+        customer_ids (np.ndarray): IDs to look up
+        concurrency (int): Number of concurrent connections
+        duration (float): Test length in seconds
+        mix (dict): Request type -> share of requests
+        bulk_size (int): IDs per bulk lookup
+
+    Returns:
+        dict: Total requests, errors, throughput and per-type latency
+            percentiles
+    """
+    latencies = {kind: [] for kind in mix}
+    start = time.perf_counter()
+    deadline = start + duration
+    errors = await asyncio.gather(*[
+        _client(host, port, customer_ids, deadline, mix, bulk_size, seed, latencies)
+        for seed in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(values) for values in latencies.values())
+    report = {'requests': total, 'errors': int(sum(errors)), 'seconds': round(elapsed, 2),
+              'requests_per_s': round(total / elapsed, 1), 'latency_ms': {}}
+    for kind, values in latencies.items():
+        if values:
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+            report['latency_ms'][kind] = {'count': len(values), 'p50': round(p50, 3),
+                                          'p95': round(p95, 3), 'p99': round(p99, 3)}
+    return report
+
+
+async def _spawn_and_run(args, customer_ids):
+    service = SegmentService(args.results, args.model, reload_interval=0)
+    ready = asyncio.get_running_loop().create_future()
+    server = asyncio.create_task(service.serve(args.host, 0, ready))
+    port = await ready
+    try:
+        report = await run_load_test(args.host, port, customer_ids, args.concurrency,
+                                     args.duration, bulk_size=args.bulk_size)
+    finally:
+        server.cancel()
+    report['server_metrics'] = service.metrics()
+    return report
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Load test the segment lookup service'
+    )
+    parser.add_argument('--results', type=str, default='rfm_analysis_results.csv',
+                        help='Results file: source of customer IDs (and served with --spawn)')
+    parser.add_argument('--model', type=str, default=MODEL_DIR,
+                        help=f'Model directory for --spawn (default: {MODEL_DIR})')
+    parser.add_argument('--spawn', action='store_true',
+                        help='Start the service in-process instead of using a running one')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST,
+                        help=f'Service host (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f'Service port (default: {DEFAULT_PORT})')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='Concurrent connections (default: 32)')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='Test length in seconds (default: 10)')
+    parser.add_argument('--bulk-size', type=int, default=100,
+                        help='Customer IDs per bulk lookup (default: 100)')
+    args = parser.parse_args()
+
+    customer_ids = read_table(args.results, columns=['customer_id'])['customer_id'].astype(str).to_numpy()
+
+    print("="*70)
+    print("SEGMENT SERVICE LOAD TEST")
+    print("="*70)
+    print(f"\nConcurrency: {args.concurrency}  Duration: {args.duration:g}s")
+
+    if args.spawn:
+        report = asyncio.run(_spawn_and_run(args, customer_ids))
+    else:
+        report = asyncio.run(run_load_test(args.host, args.port, customer_ids, args.concurrency,
+                                           args.duration, bulk_size=args.bulk_size))
+
+    print(f"\nRequests: {report['requests']:,}  Errors: {report['errors']:,}  "
+          f"Throughput: {report['requests_per_s']:,.1f} req/s")
+    for kind, stats in report['latency_ms'].items():
+        print(f"  {kind:9s} n={stats['count']:7,d}  p50={stats['p50']:.2f}ms  "
+              f"p95={stats['p95']:.2f}ms  p99={stats['p99']:.2f}ms")
+    if 'server_metrics' in report:
+        batches = report['server_metrics']['micro_batches']
+        print(f"\nScoring micro-batches: {batches['batches']:,} "
+              f"(mean {batches['mean_batch_rows']} rows per batch)")
+
+
+if __name__ == "__main__":
+    main()
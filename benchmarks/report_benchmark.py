@@ -0,0 +1,138 @@
+"""
+Report Rendering Benchmark
+Aggregation and rendering cost of the segmentation charts by customer count
+
+For each customer count a synthetic RFM table (bench_clustering.synthetic_rfm)
+gets segment names from recency and frequency thresholds. The benchmark
+times report_renderer.aggregate_report over the table (one pass per chunk,
+scaling with the customer count) and render_report of all figures from the
+aggregates, in this process so its peak resident set size is measured
+(instrumentation.py 'rss' mode). Fixed K results are passed so the elbow
+and silhouette charts do not add a K evaluation to the aggregation time.
+
+Rendering works from aggregates of a fixed size, so its time and memory
+should stay flat while the customer count grows.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import gc
+import json
+import os
+import pickle
+import platform
+import sys
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_clustering import synthetic_rfm  # noqa: E402
+from instrumentation import RunReport  # noqa: E402
+from k_selection import K_RANGE  # noqa: E402
+from report_renderer import DPI, aggregate_report, render_report  # noqa: E402
+
+DEFAULT_SIZES = [100_000, 1_000_000, 10_000_000]
+RANDOM_SEED = 42
+
+SEGMENTS = np.array(['Champions', 'Loyal Customers', 'Potential Loyalists', 'At Risk', 'Hibernating'])
+
+# Stand-in K results so the K charts are drawn without evaluating K
+K_RESULTS = [{'k': k, 'inertia': 1e6 / k, 'score': 0.5 - 0.02 * abs(k - 4)} for k in K_RANGE]
+
+
+def segmented_rfm(customers):
+    """Synthetic RFM table with a categorical segment column"""
+    rfm = synthetic_rfm(customers, RANDOM_SEED)
+    codes = np.select([(rfm['recency'] < 60) & (rfm['frequency'] >= 6),
+                       rfm['frequency'] >= 6,
+                       rfm['recency'] < 60,
+                       rfm['recency'] < 300],
+                      [0, 1, 2, 3], default=4)
+    rfm['segment'] = pd.Categorical.from_codes(codes, SEGMENTS)
+    return rfm
+
+
+def benchmark_size(customers, output_dir, dpi=DPI):
+    """
+    Aggregate and render the report for one customer count
+
+    Args:
+        customers (int): Synthetic customers
+        output_dir (str): Directory for the PNG files
+        dpi (int): PNG resolution
+
+    Returns:
+        dict: Timings, peak memory and aggregate size
+    """
+    rfm = segmented_rfm(customers)
+    report = RunReport('report_benchmark', memory='rss')
+    with report.stage('aggregate', rows_in=customers):
+        aggregates = aggregate_report(rfm, k_results=K_RESULTS)
+    del rfm
+    gc.collect()
+    with report.stage('render'):
+        rendered = render_report(aggregates, output_dir, workers=1, dpi=dpi)
+    aggregate, render = report.stages
+    return {
+        'customers': customers,
+        'aggregate_seconds': aggregate['seconds'],
+        'aggregate_peak_mb': aggregate.get('peak_mb'),
+        'aggregates_kb': round(len(pickle.dumps(aggregates)) / 1e3, 1),
+        'render_seconds': render['seconds'],
+        'render_peak_mb': render.get('peak_mb'),
+        'figures': {name: round(seconds, 3) for name, (path, seconds) in rendered.items()},
+    }
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark aggregation and rendering of the segmentation charts'
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Customer counts (default: 100000 1000000 10000000)')
+    parser.add_argument('--dpi', type=int, default=DPI, help=f'PNG resolution (default: {DPI})')
+    parser.add_argument('--output', type=str, default='report_benchmark.json',
+                        help='JSON results file (default: report_benchmark.json)')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("REPORT RENDERING BENCHMARK")
+    print("="*70 + "\n")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Warm-up: matplotlib imports and font cache are not part of rendering
+        render_report(aggregate_report(segmented_rfm(1_000), k_results=K_RESULTS), tmp, workers=1, dpi=args.dpi)
+        for customers in args.sizes:
+            result = benchmark_size(customers, tmp, args.dpi)
+            results.append(result)
+            print(f"  {customers:>12,} customers: aggregate {result['aggregate_seconds']:7.2f}s "
+                  f"({result['aggregates_kb']:,.0f} KB)  render {result['render_seconds']:5.2f}s, "
+                  f"peak {result['render_peak_mb']} MB")
+
+    report = {
+        'environment': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'dpi': args.dpi,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
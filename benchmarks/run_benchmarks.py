@@ -0,0 +1,303 @@
+"""
+Pipeline Benchmark Suite
+Times every analysis stage at several customer counts and checks for regressions
+
+For each customer count, transactions are generated with a fixed seed and
+each stage runs in a fresh worker process: synthetic generation, CSV and
+Parquet load, RFM aggregation, qcut scoring, feature scaling, K-Means,
+sampled silhouette and the summary/CSV export. Stages read their inputs
+from files written by earlier stages, and write their own output for
+later stages after the timed run, so every measurement covers only its
+own load or computation (generation and export, whose work is writing
+files, include their writes).
+
+Each result records wall time (best of --repeat runs), throughput, the
+worker's peak resident set size and its growth during the stage. Results
+are written as JSON; with --baseline they are compared with an earlier
+results file and any stage slower than the baseline by more than the
+threshold is reported as a regression (exit status 1). Everything runs
+offline.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clustering import FEATURES, cluster_rfm  # noqa: E402
+from data_generation import generate_transactions  # noqa: E402
+from k_selection import sampled_silhouette  # noqa: E402
+from pipeline import segment_summary_table  # noqa: E402
+from rfm import compute_rfm, score_rfm  # noqa: E402
+from storage import RFM_COLUMNS, read_table, read_transactions, write_table  # noqa: E402
+
+DEFAULT_SIZES = [25_000, 250_000, 2_500_000]
+RANDOM_SEED = 42
+N_CLUSTERS = 8
+
+# Stages slower than the baseline by more than this fraction are regressions
+DEFAULT_THRESHOLD = 0.20
+
+# Stages faster than this in the baseline are too noisy to compare
+MIN_COMPARE_SECONDS = 0.05
+
+# Customers per generated block, so generation memory stays bounded at
+# large sizes
+GENERATION_CHUNK = 250_000
+
+
+def _rss_bytes():
+    """Current resident set size"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _max_rss_bytes():
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+# -- stages -------------------------------------------------------------------
+# Each stage function takes the file paths of one customer count, does its
+# untimed setup and returns (timed callable, rows processed, save). The
+# callable returns the stage output; save, if not None, writes it for later
+# stages after timing. Rows of None are counted from the output.
+
+def _stage_generate(paths, customers):
+    # Generation streams its blocks to the CSV, so the write is part of it
+    def run():
+        generate_transactions(customers, output_file=paths['csv'], seed=RANDOM_SEED,
+                              chunk_customers=GENERATION_CHUNK, verbose=False)
+    return run, customers, None
+
+
+def _stage_load_csv(paths, customers):
+    def run():
+        return read_transactions(paths['csv'], columns=RFM_COLUMNS)
+    return run, None, lambda transactions: write_table(transactions, paths['parquet'])
+
+
+def _stage_load_parquet(paths, customers):
+    def run():
+        return read_transactions(paths['parquet'], columns=RFM_COLUMNS)
+    return run, None, None
+
+
+def _stage_rfm(paths, customers):
+    transactions = read_transactions(paths['parquet'], columns=RFM_COLUMNS)
+    return (lambda: compute_rfm(transactions), len(transactions),
+            lambda rfm_df: write_table(rfm_df, paths['rfm']))
+
+
+def _stage_score(paths, customers):
+    rfm_df = read_table(paths['rfm'])
+    return (lambda: score_rfm(rfm_df), len(rfm_df),
+            lambda scored: write_table(scored, paths['scored']))
+
+
+def _stage_scale(paths, customers):
+    from sklearn.preprocessing import StandardScaler
+    X = read_table(paths['rfm'], columns=FEATURES).to_numpy()
+    return (lambda: StandardScaler().fit_transform(X), len(X),
+            lambda X_scaled: np.save(paths['scaled'], X_scaled))
+
+
+def _stage_kmeans(paths, customers):
+    rfm_df = read_table(paths['rfm'], columns=FEATURES)
+    return (lambda: cluster_rfm(rfm_df, N_CLUSTERS, random_state=RANDOM_SEED)['labels'], len(rfm_df),
+            lambda labels: np.save(paths['labels'], labels))
+
+
+def _stage_silhouette(paths, customers):
+    X_scaled = np.load(paths['scaled'])
+    labels = np.load(paths['labels'])
+    return lambda: sampled_silhouette(X_scaled, labels, seed=RANDOM_SEED), len(labels), None
+
+
+def _stage_export(paths, customers):
+    rfm_df = read_table(paths['scored'])
+    rfm_df['segment'] = np.load(paths['labels'])
+
+    # Writing the summary and results is what this stage measures
+    def run():
+        segment_summary_table(rfm_df).to_csv(paths['summary'])
+        write_table(rfm_df, paths['results'])
+    return run, len(rfm_df), None
+
+
+# Stage name -> function, in run order
+STAGES = {
+    'generate': _stage_generate,
+    'load_csv': _stage_load_csv,
+    'load_parquet': _stage_load_parquet,
+    'rfm': _stage_rfm,
+    'score': _stage_score,
+    'scale': _stage_scale,
+    'kmeans': _stage_kmeans,
+    'silhouette': _stage_silhouette,
+    'export': _stage_export,
+}
+
+
+def _run_stage(task):
+    """Set up and time one stage; runs in a fresh worker process"""
+    stage, paths, customers, repeat = task
+    run, rows, save = STAGES[stage](paths, customers)
+    start_rss = _rss_bytes() if os.path.exists('/proc/self/statm') else _max_rss_bytes()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = run()
+        times.append(time.perf_counter() - start)
+    rows = rows if rows is not None else len(output)
+    stage_mb = max(_max_rss_bytes() - start_rss, 0)
+    peak_rss = _max_rss_bytes()
+    if save is not None:
+        save(output)
+    seconds = min(times)
+    return {
+        'seconds': round(seconds, 4),
+        'rows': int(rows),
+        'rows_per_s': round(rows / seconds, 1) if seconds > 0 else None,
+        'peak_rss_mb': round(peak_rss / 1e6, 1),
+        'stage_mb': round(stage_mb / 1e6, 1),
+    }
+
+
+def _environment():
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'seed': RANDOM_SEED,
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, stages=None, repeat=1, workdir=None):
+    """
+    Run the stages at every customer count
+
+    Args:
+        sizes (list): Customer counts
+        stages (list): Stage names to time (default: all of STAGES); the
+            stages before them still run to produce their inputs
+        repeat (int): Runs per stage; the fastest is reported
+        workdir (str): Directory for the intermediate files (default: a
+            temporary directory)
+
+    Returns:
+        dict: 'environment' and 'results' (one entry per customer count
+            and stage)
+    """
+    stages = list(STAGES) if stages is None else stages
+    last = max(list(STAGES).index(stage) for stage in stages)
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for customers in sizes:
+            paths = {name: os.path.join(tmp, f'{name}_{customers}.{ext}') for name, ext in [
+                ('csv', 'csv'), ('parquet', 'parquet'), ('rfm', 'parquet'), ('scored', 'parquet'),
+                ('scaled', 'npy'), ('labels', 'npy'), ('summary', 'csv'), ('results', 'csv')]}
+            for stage in list(STAGES)[:last + 1]:
+                timed = stage in stages
+                # A new process per stage so peak memory is not inherited
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    stats = pool.submit(_run_stage, (stage, paths, customers,
+                                                     repeat if timed else 1)).result()
+                if not timed:
+                    continue
+                results.append({'customers': customers, 'stage': stage, **stats})
+                print(f"  {customers:>10,}  {stage:13s} {stats['seconds']:9.3f}s  "
+                      f"{stats['rows_per_s'] or 0:>14,.0f} rows/s  "
+                      f"{stats['peak_rss_mb']:8.1f} MB peak  (+{stats['stage_mb']:.1f} MB)")
+    return {'environment': _environment(), 'results': results}
+
+
+def compare_with_baseline(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare stage times with a baseline report
+
+    Args:
+        report (dict): Output of run_benchmarks
+        baseline (dict): Earlier output of run_benchmarks
+        threshold (float): Allowed slowdown as a fraction of the baseline
+
+    Returns:
+        pd.DataFrame: One row per stage present in both, with the time
+            ratio and a regression flag
+    """
+    key = ['customers', 'stage']
+    current = pd.DataFrame(report['results'])
+    previous = pd.DataFrame(baseline['results'])
+    if current.empty or previous.empty:
+        return pd.DataFrame(columns=key + ['baseline_s', 'seconds', 'ratio', 'regression'])
+    merged = current[key + ['seconds']].merge(
+        previous[key + ['seconds']].rename(columns={'seconds': 'baseline_s'}), on=key)
+    merged['ratio'] = (merged['seconds'] / merged['baseline_s']).round(3)
+    merged['regression'] = ((merged['baseline_s'] >= MIN_COMPARE_SECONDS)
+                            & (merged['ratio'] > 1 + threshold))
+    return merged[key + ['baseline_s', 'seconds', 'ratio', 'regression']]
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark the RFM pipeline stages at several customer counts'
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Customer counts (default: 25000 250000 2500000)')
+    parser.add_argument('--stages', type=str, nargs='+', default=None, choices=list(STAGES),
+                        help='Stages to time (default: all)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Runs per stage; the fastest is reported (default: 1)')
+    parser.add_argument('--output', type=str, default='benchmark_results.json',
+                        help='JSON results file (default: benchmark_results.json)')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='Earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Allowed slowdown vs the baseline (default: {DEFAULT_THRESHOLD:.0%})')
+    parser.add_argument('--workdir', type=str, default=None,
+                        help='Directory for intermediate files (default: system temp)')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("RFM PIPELINE BENCHMARK")
+    print("="*70 + "\n")
+    report = run_benchmarks(args.sizes, args.stages, args.repeat, args.workdir)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results saved to '{args.output}'")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison = compare_with_baseline(report, json.load(f), args.threshold)
+        print(f"\nComparison with '{args.baseline}' (threshold +{args.threshold:.0%}):")
+        print(comparison.to_string(index=False))
+        regressions = comparison[comparison['regression']]
+        if len(regressions):
+            print(f"\n✗ {len(regressions)} stage(s) regressed")
+            sys.exit(1)
+        print("\n✓ No regressions")
+
+
+if __name__ == "__main__":
+    main()
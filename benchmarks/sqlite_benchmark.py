@@ -0,0 +1,166 @@
+"""
+SQLite vs CSV Benchmark
+Compares the SQLite store with the pandas CSV path for writing transactions and computing RFM
+
+For each customer count the generator writes the same transactions (same
+seed, streaming mode) once as CSV and once into SQLite (batched
+executemany, then the (customer_id, transaction_date) index). RFM is then
+computed both ways: read_transactions + compute_rfm on the CSV, and the
+pushed-down grouped query of sqlite_store.compute_rfm_sql. Every step runs
+in a fresh worker process and records wall time and peak resident set
+size; the two RFM tables are checked for equal customers, recency and
+frequency and monetary to the cent.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_generation import generate_transactions  # noqa: E402
+from rfm import compute_rfm  # noqa: E402
+from sqlite_store import compute_rfm_sql  # noqa: E402
+from storage import RFM_COLUMNS, read_table, read_transactions, write_table  # noqa: E402
+
+DEFAULT_SIZES = [1_000_000]
+RANDOM_SEED = 42
+GENERATION_CHUNK = 250_000
+
+
+def _max_rss_mb():
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def _generate(paths, customers, fmt):
+    generate_transactions(customers, output_file=paths[fmt], seed=RANDOM_SEED,
+                          chunk_customers=GENERATION_CHUNK, verbose=False)
+
+
+def _rfm_csv(paths, customers, fmt):
+    rfm_df = compute_rfm(read_transactions(paths['csv'], columns=RFM_COLUMNS))
+    write_table(rfm_df, paths['rfm_csv'])
+
+
+def _rfm_sqlite(paths, customers, fmt):
+    rfm_df, _ = compute_rfm_sql(paths['sqlite'])
+    write_table(rfm_df, paths['rfm_sqlite'])
+
+
+# Step name -> (function, storage), in run order
+STEPS = {
+    'generate_csv': (_generate, 'csv'),
+    'generate_sqlite': (_generate, 'sqlite'),
+    'rfm_csv': (_rfm_csv, 'csv'),
+    'rfm_sqlite': (_rfm_sqlite, 'sqlite'),
+}
+
+
+def _run_step(task):
+    """Time one step; runs in a fresh worker process"""
+    step, paths, customers = task
+    function, fmt = STEPS[step]
+    start = time.perf_counter()
+    function(paths, customers, fmt)
+    return {'seconds': round(time.perf_counter() - start, 3), 'peak_rss_mb': round(_max_rss_mb(), 1)}
+
+
+def _check(paths):
+    """The two RFM tables agree (monetary to the cent)"""
+    csv_rfm = read_table(paths['rfm_csv'])
+    sql_rfm = read_table(paths['rfm_sqlite'])
+    return bool(
+        len(csv_rfm) == len(sql_rfm)
+        and (csv_rfm['customer_id'].astype(str).to_numpy() == sql_rfm['customer_id'].astype(str).to_numpy()).all()
+        and (csv_rfm['recency'].to_numpy() == sql_rfm['recency'].to_numpy()).all()
+        and (csv_rfm['frequency'].to_numpy() == sql_rfm['frequency'].to_numpy()).all()
+        and np.allclose(csv_rfm['monetary'].to_numpy(), sql_rfm['monetary'].to_numpy(), rtol=0, atol=0.005)
+    )
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, workdir=None):
+    """
+    Time the CSV and SQLite paths at every customer count
+
+    Args:
+        sizes (list): Customer counts
+        workdir (str): Directory for the generated files (default: a
+            temporary directory)
+
+    Returns:
+        dict: 'environment' and 'results' (one entry per customer count)
+    """
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for customers in sizes:
+            paths = {name: os.path.join(tmp, f'{name}_{customers}.{ext}') for name, ext in [
+                ('csv', 'csv'), ('sqlite', 'db'), ('rfm_csv', 'parquet'), ('rfm_sqlite', 'parquet')]}
+            entry = {'customers': customers}
+            for step in STEPS:
+                # A new process per step so peak memory is not inherited
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    entry[step] = pool.submit(_run_step, (step, paths, customers)).result()
+                print(f"  {customers:>10,}  {step:16s} {entry[step]['seconds']:9.2f}s  "
+                      f"{entry[step]['peak_rss_mb']:8.1f} MB peak")
+            with sqlite3.connect(paths['sqlite']) as conn:
+                entry['transactions'] = conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+            entry['csv_mb'] = round(os.path.getsize(paths['csv']) / 1e6, 1)
+            entry['sqlite_mb'] = round(os.path.getsize(paths['sqlite']) / 1e6, 1)
+            entry['rfm_speedup'] = round(entry['rfm_csv']['seconds'] / entry['rfm_sqlite']['seconds'], 2)
+            entry['rfm_match'] = _check(paths)
+            results.append(entry)
+            print(f"  {entry['transactions']:,} transactions; RFM {entry['rfm_speedup']}x faster from "
+                  f"SQLite; tables match: {entry['rfm_match']}")
+
+    environment = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'sqlite': sqlite3.sqlite_version,
+        'pandas': pd.__version__,
+        'seed': RANDOM_SEED,
+    }
+    return {'environment': environment, 'results': results}
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark the SQLite store against the pandas CSV path'
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Customer counts (default: 1000000)')
+    parser.add_argument('--output', type=str, default='sqlite_benchmark.json',
+                        help='JSON results file (default: sqlite_benchmark.json)')
+    parser.add_argument('--workdir', type=str, default=None,
+                        help='Directory for generated files (default: system temp)')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("SQLITE VS CSV BENCHMARK")
+    print("="*70 + "\n")
+    report = run_benchmark(args.sizes, args.workdir)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
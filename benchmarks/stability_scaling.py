@@ -0,0 +1,106 @@
+"""
+Cluster Stability Scaling Benchmark
+Wall time of the bootstrap stability analysis by number of worker processes
+
+A synthetic RFM table (bench_clustering.synthetic_rfm) is scaled and
+clustered once as the reference; stability_analysis then runs the same
+replicates with 1, 2, 4, ... workers up to the CPU count. Each run
+reports wall time, speedup and parallel efficiency relative to one
+worker, and whether its results are identical to the one-worker run.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_clustering import synthetic_rfm  # noqa: E402
+from cluster_stability import stability_analysis  # noqa: E402
+
+DEFAULT_CUSTOMERS = 200_000
+DEFAULT_REPLICATES = 32
+N_CLUSTERS = 8
+RANDOM_SEED = 42
+
+
+def _worker_counts(limit):
+    counts, workers = [], 1
+    while workers < limit:
+        counts.append(workers)
+        workers *= 2
+    return counts + [limit]
+
+
+def _same(a, b):
+    return (a['clusters'].equals(b['clusters']) and np.array_equal(a['ari'], b['ari'])
+            and np.array_equal(a['confidence'], b['confidence']))
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Time the cluster stability analysis by number of workers'
+    )
+    parser.add_argument('--customers', type=int, default=DEFAULT_CUSTOMERS,
+                        help=f'Synthetic customers (default: {DEFAULT_CUSTOMERS:,})')
+    parser.add_argument('--replicates', type=int, default=DEFAULT_REPLICATES,
+                        help=f'Bootstrap refits per run (default: {DEFAULT_REPLICATES})')
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='Worker counts (default: 1, 2, 4, ... up to the CPU count)')
+    parser.add_argument('--output', type=str, default='stability_scaling.json',
+                        help='JSON results file (default: stability_scaling.json)')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("CLUSTER STABILITY SCALING")
+    print("="*70)
+
+    X_scaled = StandardScaler().fit_transform(
+        synthetic_rfm(args.customers, RANDOM_SEED)[['recency', 'frequency', 'monetary']].to_numpy(dtype=float))
+    reference = KMeans(n_clusters=N_CLUSTERS, random_state=RANDOM_SEED, n_init=10).fit_predict(X_scaled)
+    print(f"\n{args.customers:,} customers, {N_CLUSTERS} clusters, {args.replicates} refits, "
+          f"{os.cpu_count()} CPUs\n")
+
+    results, baseline = [], None
+    for workers in args.workers or _worker_counts(os.cpu_count() or 1):
+        start = time.perf_counter()
+        result = stability_analysis(X_scaled, reference, args.replicates, workers=workers)
+        seconds = time.perf_counter() - start
+        baseline = baseline or (seconds, result)
+        speedup = baseline[0] / seconds
+        entry = {'workers': workers, 'seconds': round(seconds, 2), 'speedup': round(speedup, 2),
+                 'efficiency': round(speedup / workers, 2), 'identical': _same(result, baseline[1])}
+        results.append(entry)
+        print(f"  {workers:>3} workers: {seconds:8.2f}s  speedup {speedup:5.2f}x  "
+              f"efficiency {entry['efficiency']:4.0%}  identical: {entry['identical']}")
+
+    report = {
+        'environment': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'customers': args.customers,
+            'replicates': args.replicates,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
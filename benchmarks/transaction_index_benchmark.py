@@ -0,0 +1,173 @@
+"""
+Transaction Index Benchmark
+Random-access history lookup throughput of the customer transaction index
+
+For each customer count, transactions are generated with a fixed seed and
+loaded once. The benchmark then times building the index (sort and .npy
+writes), opening it, single-customer lookups (TransactionIndex.history)
+and batched lookups (TransactionIndex.histories) for randomly drawn
+customers, against the current approach of filtering the whole
+transactions frame by customer_id. A sample of histories is checked
+against the filtered frame.
+
+The index files are in the page cache right after the build, so lookups
+measure warm access; a cold first read adds one disk read per column.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_generation import generate_transactions  # noqa: E402
+from storage import read_table  # noqa: E402
+from transaction_index import TransactionIndex, build_transaction_index  # noqa: E402
+
+DEFAULT_SIZES = [250_000, 1_000_000]
+RANDOM_SEED = 42
+GENERATION_CHUNK = 250_000
+
+DEFAULT_LOOKUPS = 10_000
+DEFAULT_BATCH = 1_000
+
+# Full-frame filters are slow; a few are enough for their rate
+SCAN_LOOKUPS = 20
+CHECKED_CUSTOMERS = 50
+
+
+def _same(history, transactions, customer_id):
+    expected = transactions[transactions['customer_id'] == customer_id].reset_index(drop=True)
+    return history.astype({'customer_id': str}).equals(expected.astype({'customer_id': str}))
+
+
+def benchmark_size(customers, tmp, lookups=DEFAULT_LOOKUPS, batch=DEFAULT_BATCH):
+    """
+    Build and query an index of one customer count
+
+    Args:
+        customers (int): Customers to generate
+        tmp (str): Directory for the transaction file and index
+        lookups (int): Random single-customer lookups
+        batch (int): Customers per batched lookup
+
+    Returns:
+        dict: Timings and lookup rates
+    """
+    path = os.path.join(tmp, f'transactions_{customers}.parquet')
+    index_dir = os.path.join(tmp, f'index_{customers}')
+    generate_transactions(customers, output_file=path, seed=RANDOM_SEED,
+                          chunk_customers=GENERATION_CHUNK, verbose=False)
+    transactions = read_table(path)
+
+    start = time.perf_counter()
+    build_transaction_index(transactions, index_dir)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    index = TransactionIndex(index_dir)
+    open_seconds = time.perf_counter() - start
+
+    rng = np.random.default_rng(RANDOM_SEED)
+    ids = np.char.decode(index.customer_ids[rng.integers(0, len(index), lookups)], 'utf-8')
+
+    latencies = np.empty(lookups)
+    rows = 0
+    for i, customer_id in enumerate(ids):
+        start = time.perf_counter()
+        rows += len(index.history(customer_id))
+        latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_rows = sum(len(index.histories(ids[i:i + batch])) for i in range(0, lookups, batch))
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for customer_id in ids[:SCAN_LOOKUPS]:
+        transactions[transactions['customer_id'] == customer_id]
+    scan_seconds = (time.perf_counter() - start) / SCAN_LOOKUPS
+
+    checked = all(_same(index.history(customer_id), transactions, customer_id)
+                  for customer_id in ids[:CHECKED_CUSTOMERS])
+    return {
+        'customers': customers,
+        'transactions': index.num_transactions,
+        'index_mb': round(sum(os.path.getsize(os.path.join(index_dir, name))
+                              for name in os.listdir(index_dir)) / 1e6, 1),
+        'build_seconds': round(build_seconds, 3),
+        'open_ms': round(open_seconds * 1000, 2),
+        'single_lookups_per_second': round(lookups / latencies.sum()),
+        'single_p50_ms': round(np.percentile(latencies, 50) * 1000, 3),
+        'single_p99_ms': round(np.percentile(latencies, 99) * 1000, 3),
+        'batch_size': batch,
+        'batch_customers_per_second': round(lookups / batch_seconds),
+        'scan_lookups_per_second': round(1 / scan_seconds, 1),
+        'speedup_vs_scan': round(scan_seconds * lookups / latencies.sum()),
+        'rows_per_lookup': round(rows / lookups, 1),
+        'histories_match': bool(checked and batch_rows == rows),
+    }
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark random-access history lookups of the transaction index'
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Customer counts (default: 250000 1000000)')
+    parser.add_argument('--lookups', type=int, default=DEFAULT_LOOKUPS,
+                        help=f'Random customers looked up (default: {DEFAULT_LOOKUPS})')
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH,
+                        help=f'Customers per batched lookup (default: {DEFAULT_BATCH})')
+    parser.add_argument('--output', type=str, default='transaction_index_benchmark.json',
+                        help='JSON results file (default: transaction_index_benchmark.json)')
+    parser.add_argument('--workdir', type=str, default=None,
+                        help='Directory for generated files (default: system temp)')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("TRANSACTION INDEX BENCHMARK")
+    print("="*70 + "\n")
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.workdir) as tmp:
+        for customers in args.sizes:
+            result = benchmark_size(customers, tmp, args.lookups, args.batch)
+            results.append(result)
+            print(f"  {customers:>10,} customers, {result['transactions']:,} transactions: "
+                  f"build {result['build_seconds']:.2f}s, open {result['open_ms']:.1f} ms")
+            print(f"    single: {result['single_lookups_per_second']:,} lookups/s "
+                  f"(p50 {result['single_p50_ms']:.3f} ms, p99 {result['single_p99_ms']:.3f} ms)")
+            print(f"    batch of {args.batch:,}: {result['batch_customers_per_second']:,} customers/s")
+            print(f"    frame filter: {result['scan_lookups_per_second']:,} lookups/s "
+                  f"({result['speedup_vs_scan']:,}x slower); histories match: {result['histories_match']}")
+
+    report = {
+        'environment': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'seed': RANDOM_SEED,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Cluster Stability Analysis
+Bootstrap refits of K-Means to measure how reproducible each cluster and assignment is
+
+The reference segmentation is one KMeans(random_state=42) fit. To see
+how much of it is structure and how much is the seed, K-Means is refitted
+on N resamples of the customers (bootstrap draws or subsamples without
+replacement), each replicate's centers assign every customer, and the
+replicate is compared with the reference:
+
+- per-cluster Jaccard stability (Hennig's clusterboot): for each reference
+  cluster, the best Jaccard overlap with any replicate cluster among the
+  resampled customers; a mean above 0.75 is commonly read as stable,
+  below 0.5 as dissolved
+- adjusted Rand index of the replicate's assignment of all customers
+  against the reference labels
+- per-customer assignment confidence: the share of replicates in which the
+  customer lands in the replicate cluster matched (Hungarian assignment on
+  the contingency table) to its reference cluster
+
+The scaled feature matrix and the reference labels are saved once as .npy
+files that every worker process memory-maps in its initializer, so a task
+is just a replicate number and seed. Workers keep BLAS and OpenMP to one
+thread, one process per core, and each replicate's seed is spawned from
+the run's seed, so the results are the same for any number of workers and
+the run time falls with the number of cores.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from sklearn.cluster import KMeans
+from sklearn.metrics import adjusted_rand_score
+from threadpoolctl import threadpool_limits
+
+RANDOM_SEED = 42
+RESAMPLING_METHODS = ('bootstrap', 'subsample')
+
+DEFAULT_REPLICATES = 50
+# Share of customers in each subsample (method 'subsample')
+DEFAULT_FRACTION = 0.8
+DEFAULT_N_INIT = 10
+
+# Mean Jaccard at or above which a cluster counts as stable, and below
+# which a replicate counts as having dissolved it
+STABLE_JACCARD = 0.75
+DISSOLVED_JACCARD = 0.5
+CONFIDENCE_LEVEL = 0.95
+
+_worker_X = None
+_worker_reference = None
+
+
+def _init_worker(features_path, reference_path, single_threaded=True):
+    """Memory-map the feature matrix and reference labels once per worker"""
+    global _worker_X, _worker_reference
+    _worker_X = np.load(features_path, mmap_mode='r')
+    _worker_reference = np.load(reference_path, mmap_mode='r')
+    if single_threaded:
+        # One worker process per core: keep BLAS and OpenMP single-threaded
+        threadpool_limits(1)
+
+
+def _contingency(reference, labels, n_clusters):
+    """Customers per (reference cluster, replicate cluster) pair"""
+    pairs = reference.astype(np.int64) * n_clusters + labels
+    return np.bincount(pairs, minlength=n_clusters * n_clusters).reshape(n_clusters, n_clusters)
+
+
+def fit_replicate(X, reference, n_clusters, seed, method='bootstrap', fraction=DEFAULT_FRACTION,
+                  n_init=DEFAULT_N_INIT):
+    """
+    Refit K-Means on one resample and compare it with the reference
+
+    Args:
+        X (np.ndarray): Scaled features of all customers
+        reference (np.ndarray): Reference cluster label per customer
+            (0..n_clusters-1)
+        n_clusters (int): Number of clusters
+        seed (np.random.SeedSequence or int): Seed of this replicate
+        method (str): 'bootstrap' (n draws with replacement) or
+            'subsample' (fraction of the customers without replacement)
+        fraction (float): Subsample share for 'subsample'
+        n_init (int): K-Means initializations
+
+    Returns:
+        tuple: (per-reference-cluster Jaccard array, adjusted Rand index,
+            packed bits of whether each customer's matched cluster equals
+            its reference cluster)
+    """
+    rng = np.random.default_rng(seed)
+    n = len(X)
+    if method == 'bootstrap':
+        sample = rng.integers(0, n, size=n)
+    else:
+        size = min(n, max(n_clusters, int(round(fraction * n))))
+        sample = np.sort(rng.choice(n, size=size, replace=False))
+    model = KMeans(n_clusters=n_clusters, random_state=int(rng.integers(2 ** 31 - 1)), n_init=n_init)
+    model.fit(X[sample])
+    labels = model.predict(X).astype(np.int64)
+
+    # Jaccard among the resampled customers, each counted once
+    sampled = np.unique(sample)
+    overlap = _contingency(reference[sampled], labels[sampled], n_clusters)
+    union = overlap.sum(axis=1)[:, None] + overlap.sum(axis=0)[None, :] - overlap
+    with np.errstate(invalid='ignore', divide='ignore'):
+        jaccard = np.where(union > 0, overlap / union, 0.0).max(axis=1)
+    jaccard[overlap.sum(axis=1) == 0] = np.nan
+
+    # Replicate cluster -> reference cluster with the largest total overlap
+    rows, cols = linear_sum_assignment(-_contingency(reference, labels, n_clusters))
+    mapping = np.empty(n_clusters, dtype=np.int64)
+    mapping[cols] = rows
+    agree = mapping[labels] == reference
+    return jaccard, float(adjusted_rand_score(reference, labels)), np.packbits(agree)
+
+
+def _run_replicate(task):
+    replicate, seed, n_clusters, method, fraction, n_init = task
+    return (replicate,) + fit_replicate(_worker_X, _worker_reference, n_clusters, seed,
+                                        method, fraction, n_init)
+
+
+def stability_analysis(X, reference_labels, n_replicates=DEFAULT_REPLICATES, method='bootstrap',
+                       fraction=DEFAULT_FRACTION, n_init=DEFAULT_N_INIT, workers=None,
+                       seed=RANDOM_SEED, workdir=None, verbose=False):
+    """
+    Bootstrap stability of a K-Means segmentation
+
+    Args:
+        X (np.ndarray): Scaled features the reference was fitted on
+        reference_labels (np.ndarray): Reference cluster label per customer
+        n_replicates (int): Number of resampled refits
+        method (str): One of RESAMPLING_METHODS
+        fraction (float): Subsample share for 'subsample'
+        n_init (int): K-Means initializations per refit
+        workers (int): Worker processes (default: CPU count, at most one
+            per replicate); 1 runs in this process
+        seed (int): Seed the replicate seeds are spawned from
+        workdir (str): Directory for the temporary .npy files
+        verbose (bool): Print progress
+
+    Returns:
+        dict: 'clusters' (per-cluster table), 'confidence' (per-customer
+            share of agreeing replicates), 'ari' (per-replicate adjusted
+            Rand index), 'jaccard' (replicates x clusters), 'n_replicates',
+            'method' and 'seconds'
+    """
+    if method not in RESAMPLING_METHODS:
+        raise ValueError(f"Unknown resampling method '{method}'; expected one of {RESAMPLING_METHODS}")
+    reference = np.asarray(reference_labels, dtype=np.int64)
+    clusters, reference = np.unique(reference, return_inverse=True)
+    n_clusters = len(clusters)
+    if len(X) < 2 * n_clusters:
+        raise ValueError(f"Need at least {2 * n_clusters} customers to resample {n_clusters} clusters")
+
+    workers = min(workers or os.cpu_count() or 1, n_replicates)
+    seeds = np.random.SeedSequence(seed).spawn(n_replicates)
+    tasks = [(i, seeds[i], n_clusters, method, fraction, n_init) for i in range(n_replicates)]
+    if verbose:
+        print(f"  {n_replicates} {method} refits of {n_clusters} clusters, "
+              f"{len(X):,} customers, {workers} workers")
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=workdir) as data_dir:
+        features_path = os.path.join(data_dir, 'features.npy')
+        reference_path = os.path.join(data_dir, 'reference.npy')
+        np.save(features_path, np.ascontiguousarray(X, dtype=np.float64))
+        np.save(reference_path, reference)
+        if workers <= 1:
+            # Single-threaded here too, so the results match any worker count
+            with threadpool_limits(1):
+                _init_worker(features_path, reference_path, single_threaded=False)
+                outcomes = [_run_replicate(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(features_path, reference_path)) as pool:
+                outcomes = list(pool.map(_run_replicate, tasks))
+    seconds = time.perf_counter() - start
+
+    jaccard = np.empty((n_replicates, n_clusters))
+    ari = np.empty(n_replicates)
+    agreements = np.zeros(len(X), dtype=np.int32)
+    for replicate, replicate_jaccard, replicate_ari, agree in outcomes:
+        jaccard[replicate] = replicate_jaccard
+        ari[replicate] = replicate_ari
+        agreements += np.unpackbits(agree, count=len(X))
+
+    confidence = agreements / n_replicates
+    mean_jaccard = np.nanmean(jaccard, axis=0)
+    table = pd.DataFrame({
+        'cluster': clusters,
+        'customers': np.bincount(reference, minlength=n_clusters),
+        'mean_jaccard': mean_jaccard.round(4),
+        'std_jaccard': np.nanstd(jaccard, axis=0).round(4),
+        'dissolved_share': (jaccard < DISSOLVED_JACCARD).mean(axis=0).round(4),
+        'mean_confidence': np.bincount(reference, weights=confidence, minlength=n_clusters)
+                           / np.bincount(reference, minlength=n_clusters),
+        'stable': mean_jaccard >= STABLE_JACCARD,
+    })
+    table['mean_confidence'] = table['mean_confidence'].round(4)
+    return {'clusters': table, 'confidence': confidence, 'ari': ari, 'jaccard': jaccard,
+            'n_replicates': n_replicates, 'method': method, 'seconds': seconds}
+
+
+def print_stability(result, segment_mapping=None):
+    """
+    Print the per-cluster stability table and the ARI summary
+
+    Args:
+        result (dict): Output of stability_analysis
+        segment_mapping (dict): Optional cluster -> segment name
+    """
+    tail = (1 - CONFIDENCE_LEVEL) / 2 * 100
+    low, high = np.percentile(result['ari'], [tail, 100 - tail])
+    print(f"\nCluster stability ({result['n_replicates']} {result['method']} refits, "
+          f"{result['seconds']:.1f}s):")
+    for row in result['clusters'].itertuples(index=False):
+        name = f" {segment_mapping[row.cluster]:<20s}" if segment_mapping else ''
+        print(f"  Cluster {row.cluster}{name} n={row.customers:>8,}  Jaccard {row.mean_jaccard:.3f} "
+              f"± {row.std_jaccard:.3f}  dissolved {row.dissolved_share:5.1%}  "
+              f"confidence {row.mean_confidence:.3f}  {'stable' if row.stable else 'UNSTABLE'}")
+    print(f"  ARI vs reference: {result['ari'].mean():.4f} ({CONFIDENCE_LEVEL:.0%} interval {low:.4f}-{high:.4f})")
+    print(f"  Customers assigned consistently in >= 90% of refits: {(result['confidence'] >= 0.9).mean():.1%}")
+
+
+def main():
+    """Main execution function"""
+    from sklearn.preprocessing import StandardScaler
+    from storage import read_table, write_table
+
+    parser = argparse.ArgumentParser(
+        description='Bootstrap stability of the K-Means clusters in an RFM results file'
+    )
+    parser.add_argument('--input', type=str, default='rfm_analysis_results.csv',
+                        help='File with customer_id, recency, frequency, monetary and cluster '
+                             '(default: rfm_analysis_results.csv)')
+    parser.add_argument('--replicates', type=int, default=DEFAULT_REPLICATES,
+                        help=f'Resampled refits (default: {DEFAULT_REPLICATES})')
+    parser.add_argument('--method', type=str, default='bootstrap', choices=RESAMPLING_METHODS,
+                        help='Resampling method (default: bootstrap)')
+    parser.add_argument('--fraction', type=float, default=DEFAULT_FRACTION,
+                        help=f'Subsample share for --method subsample (default: {DEFAULT_FRACTION})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--seed', type=int, default=RANDOM_SEED,
+                        help=f'Random seed (default: {RANDOM_SEED})')
+    parser.add_argument('--output', type=str, default='cluster_stability.csv',
+                        help='Per-cluster stability table (default: cluster_stability.csv)')
+    parser.add_argument('--confidence-output', type=str, default=None,
+                        help='Optional file for customer_id, cluster and assignment_confidence')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("CLUSTER STABILITY")
+    print("="*70)
+
+    rfm_df = read_table(args.input)
+    X_scaled = StandardScaler().fit_transform(rfm_df[['recency', 'frequency', 'monetary']].to_numpy(dtype=float))
+    segment_mapping = None
+    if 'segment' in rfm_df.columns:
+        segments = rfm_df[['cluster', 'segment']].drop_duplicates('cluster')
+        segment_mapping = dict(zip(segments['cluster'], segments['segment'].astype(str)))
+
+    result = stability_analysis(X_scaled, rfm_df['cluster'].to_numpy(), args.replicates, args.method,
+                                args.fraction, workers=args.workers, seed=args.seed, verbose=True)
+    print_stability(result, segment_mapping)
+
+    write_table(result['clusters'], args.output)
+    print(f"\n✓ Cluster stability saved to '{args.output}'")
+    if args.confidence_output:
+        write_table(rfm_df[['customer_id', 'cluster']].assign(assignment_confidence=result['confidence']),
+                    args.confidence_output)
+        print(f"✓ Assignment confidence saved to '{args.confidence_output}'")
+
+
+if __name__ == "__main__":
+    main()
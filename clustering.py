@@ -0,0 +1,291 @@
+"""
+Clustering Engines for RFM Features
+Fits K-Means on recency/frequency/monetary either in memory or streamed in chunks
+
+Two engines are available:
+
+- 'kmeans': full-batch KMeans(n_init=10) on the whole scaled matrix, as in
+  the original analysis; kept for parity checks
+- 'minibatch': MiniBatchKMeans trained with partial_fit over chunks of
+  customers, after a StandardScaler fitted with partial_fit in a first
+  pass, so only one chunk of features is in memory at a time
+
+The input can be an RFM DataFrame or an RFM file (CSV, Parquet, Feather)
+read in chunks, which lets the streaming engine segment customer bases
+that do not fit in memory.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+from storage import TableWriter, iter_table, write_table
+
+CLUSTER_ENGINES = ('kmeans', 'minibatch')
+FEATURES = ['recency', 'frequency', 'monetary']
+RANDOM_SEED = 42
+
+# Customers per chunk read from the source, and per partial_fit step
+DEFAULT_CHUNK_ROWS = 500_000
+DEFAULT_BATCH_SIZE = 4096
+
+# Epoch limit and relative inertia change that counts as converged
+DEFAULT_MAX_EPOCHS = 10
+DEFAULT_TOL = 1e-3
+
+# Customers from the first chunk used to initialize the centers
+DEFAULT_INIT_ROWS = 100_000
+
+
+def iter_feature_chunks(source, chunksize=DEFAULT_CHUNK_ROWS, columns=FEATURES):
+    """
+    Read RFM columns chunk by chunk
+
+    Args:
+        source (pd.DataFrame or str): RFM table or file path
+        chunksize (int): Customers per chunk
+        columns (list): Columns to yield
+
+    Yields:
+        pd.DataFrame: Consecutive chunks of the requested columns
+    """
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunksize):
+            yield source[columns].iloc[start:start + chunksize]
+    else:
+        yield from iter_table(source, columns=columns, chunksize=chunksize)
+
+
+def _features(chunk):
+    return chunk[FEATURES].to_numpy(dtype=np.float64)
+
+
+def fit_scaler(source, chunksize=DEFAULT_CHUNK_ROWS):
+    """
+    Fit a StandardScaler in one streaming pass with partial_fit
+
+    Args:
+        source (pd.DataFrame or str): RFM table or file path
+        chunksize (int): Customers per chunk
+
+    Returns:
+        StandardScaler: Scaler fitted on all customers
+    """
+    scaler = StandardScaler()
+    for chunk in iter_feature_chunks(source, chunksize):
+        scaler.partial_fit(_features(chunk))
+    return scaler
+
+
+def fit_minibatch(source, n_clusters, scaler, chunksize=DEFAULT_CHUNK_ROWS,
+                  batch_size=DEFAULT_BATCH_SIZE, max_epochs=DEFAULT_MAX_EPOCHS,
+                  tol=DEFAULT_TOL, random_state=RANDOM_SEED, init_rows=DEFAULT_INIT_ROWS,
+                  verbose=False):
+    """
+    Train MiniBatchKMeans with partial_fit over chunks of scaled features
+
+    The centers start from a full KMeans(n_init=10) fit on a sample of the
+    first chunk, since a single mini-batch is too small for a reliable
+    k-means++ start. Each epoch is one pass over the source. Rows of a
+    chunk are shuffled and fed in mini-batches; training stops when the
+    mean mini-batch inertia of an epoch improves by less than tol
+    (relative) or after max_epochs.
+
+    Args:
+        source (pd.DataFrame or str): RFM table or file path
+        n_clusters (int): Number of clusters
+        scaler (StandardScaler): Fitted scaler (see fit_scaler)
+        chunksize (int): Customers per chunk
+        batch_size (int): Customers per partial_fit step
+        max_epochs (int): Maximum passes over the source
+        tol (float): Relative inertia change that counts as converged
+        random_state (int): Random seed
+        init_rows (int): Customers sampled from the first chunk to
+            initialize the centers
+        verbose (bool): Print one line per epoch
+
+    Returns:
+        tuple: (fitted MiniBatchKMeans, history dict with per-epoch
+            'inertia' and 'center_shift', 'epochs' and 'converged')
+    """
+    rng = np.random.default_rng(random_state)
+    first = scaler.transform(_features(next(iter_feature_chunks(source, chunksize))))
+    if len(first) < n_clusters:
+        raise ValueError(f"Need at least {n_clusters} customers to form {n_clusters} clusters")
+    sample = first[rng.choice(len(first), size=min(init_rows, len(first)), replace=False)]
+    init = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10).fit(sample)
+
+    model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size,
+                            init=init.cluster_centers_, random_state=random_state, n_init=1)
+    history = {'inertia': [], 'center_shift': [], 'epochs': 0, 'converged': False}
+
+    for epoch in range(max_epochs):
+        previous_centers = getattr(model, 'cluster_centers_', init.cluster_centers_).copy()
+        inertia, rows = 0.0, 0
+
+        for chunk in iter_feature_chunks(source, chunksize):
+            X = scaler.transform(_features(chunk))[rng.permutation(len(chunk))]
+            for start in range(0, len(X), batch_size):
+                batch = X[start:start + batch_size]
+                if not hasattr(model, 'cluster_centers_') and len(batch) < n_clusters:
+                    # The first partial_fit call must see at least n_clusters rows
+                    continue
+                model.partial_fit(batch)
+                inertia += model.inertia_
+                rows += len(batch)
+
+        history['inertia'].append(inertia / rows)
+        shift = float(np.sqrt(((model.cluster_centers_ - previous_centers) ** 2).sum(axis=1)).max())
+        history['center_shift'].append(shift)
+        history['epochs'] = epoch + 1
+        if verbose:
+            print(f"  Epoch {epoch + 1}: mean batch inertia={history['inertia'][-1]:.4f}, "
+                  f"max center shift={shift:.4f}")
+
+        if epoch > 0:
+            before, after = history['inertia'][-2], history['inertia'][-1]
+            if abs(before - after) <= tol * before:
+                history['converged'] = True
+                break
+
+    return model, history
+
+
+def iter_cluster_labels(source, model, scaler, chunksize=DEFAULT_CHUNK_ROWS, columns=FEATURES):
+    """
+    Assign clusters chunk by chunk
+
+    Args:
+        source (pd.DataFrame or str): RFM table or file path
+        model: Fitted KMeans or MiniBatchKMeans
+        scaler (StandardScaler): Scaler the model was trained with
+        chunksize (int): Customers per chunk
+        columns (list): Columns to read (must include FEATURES)
+
+    Yields:
+        tuple: (chunk DataFrame, cluster labels, squared distances to the
+            assigned centers)
+    """
+    centers = model.cluster_centers_
+    center_norms = (centers ** 2).sum(axis=1)
+    for chunk in iter_feature_chunks(source, chunksize, columns):
+        X = scaler.transform(_features(chunk))
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, computed for all centers at once
+        distances = center_norms - 2 * X @ centers.T
+        labels = distances.argmin(axis=1)
+        squared = np.maximum(distances[np.arange(len(X)), labels] + (X ** 2).sum(axis=1), 0)
+        yield chunk, labels.astype(np.int32), squared
+
+
+def cluster_rfm(source, n_clusters=8, engine='kmeans', chunksize=DEFAULT_CHUNK_ROWS,
+                batch_size=DEFAULT_BATCH_SIZE, max_epochs=DEFAULT_MAX_EPOCHS,
+                tol=DEFAULT_TOL, random_state=RANDOM_SEED, verbose=False):
+    """
+    Cluster customers on scaled recency, frequency and monetary
+
+    Args:
+        source (pd.DataFrame or str): RFM table, or a file for 'minibatch'
+        n_clusters (int): Number of clusters
+        engine (str): 'kmeans' (full batch, in memory) or 'minibatch'
+            (streaming partial_fit over chunks)
+        chunksize (int): Customers per chunk for 'minibatch'
+        batch_size (int): Customers per partial_fit step
+        max_epochs (int): Maximum passes over the source for 'minibatch'
+        tol (float): Relative inertia change that counts as converged
+        random_state (int): Random seed
+        verbose (bool): Print per-epoch progress
+
+    Returns:
+        dict: 'labels' (one per customer, in source order), 'model',
+            'scaler', 'inertia' (sum of squared distances of all customers
+            to their centers) and 'history' (None for 'kmeans')
+    """
+    if engine not in CLUSTER_ENGINES:
+        raise ValueError(f"Unknown clustering engine '{engine}'; expected one of {CLUSTER_ENGINES}")
+
+    if engine == 'kmeans':
+        rfm_df = source if isinstance(source, pd.DataFrame) else pd.concat(
+            iter_feature_chunks(source, chunksize), ignore_index=True)
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(_features(rfm_df))
+        model = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10)
+        labels = model.fit_predict(X_scaled)
+        return {'labels': labels, 'model': model, 'scaler': scaler,
+                'inertia': float(model.inertia_), 'history': None}
+
+    scaler = fit_scaler(source, chunksize)
+    model, history = fit_minibatch(source, n_clusters, scaler, chunksize, batch_size,
+                                   max_epochs, tol, random_state, verbose=verbose)
+    labels, inertia = [], 0.0
+    for _, chunk_labels, squared in iter_cluster_labels(source, model, scaler, chunksize):
+        labels.append(chunk_labels)
+        inertia += float(squared.sum())
+    return {'labels': np.concatenate(labels), 'model': model, 'scaler': scaler,
+            'inertia': inertia, 'history': history}
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Cluster customers from an RFM file with a selectable K-Means engine'
+    )
+    parser.add_argument('--input', type=str, default='rfm_analysis_results.csv',
+                        help='File with customer_id/recency/frequency/monetary '
+                             '(default: rfm_analysis_results.csv)')
+    parser.add_argument('--output', type=str, default='customer_clusters.csv',
+                        help='Output file with customer_id and cluster '
+                             '(default: customer_clusters.csv)')
+    parser.add_argument('--clusters', type=int, default=8,
+                        help='Number of clusters (default: 8)')
+    parser.add_argument('--engine', type=str, default='minibatch', choices=CLUSTER_ENGINES,
+                        help='Clustering engine (default: minibatch)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f'Customers per chunk (default: {DEFAULT_CHUNK_ROWS:,})')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Customers per mini-batch (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--max-epochs', type=int, default=DEFAULT_MAX_EPOCHS,
+                        help=f'Maximum passes over the input (default: {DEFAULT_MAX_EPOCHS})')
+    args = parser.parse_args()
+
+    print("="*70)
+    print(f"CLUSTERING ({args.engine})")
+    print("="*70)
+
+    if args.engine == 'kmeans':
+        rfm_df = pd.concat(iter_feature_chunks(args.input, args.chunksize, ['customer_id'] + FEATURES),
+                           ignore_index=True)
+        result = cluster_rfm(rfm_df, args.clusters, engine='kmeans')
+        write_table(pd.DataFrame({'customer_id': rfm_df['customer_id'],
+                                  'cluster': result['labels']}), args.output)
+        inertia, counts = result['inertia'], np.bincount(result['labels'], minlength=args.clusters)
+    else:
+        scaler = fit_scaler(args.input, args.chunksize)
+        model, history = fit_minibatch(args.input, args.clusters, scaler, args.chunksize,
+                                       args.batch_size, args.max_epochs, verbose=True)
+        status = 'converged' if history['converged'] else 'stopped at the epoch limit'
+        print(f"\n✓ Training {status} after {history['epochs']} epoch(s)")
+
+        # Label pass: write customer_id and cluster block by block
+        inertia, counts = 0.0, np.zeros(args.clusters, dtype=np.int64)
+        with TableWriter(args.output) as writer:
+            for chunk, labels, squared in iter_cluster_labels(
+                    args.input, model, scaler, args.chunksize, ['customer_id'] + FEATURES):
+                writer.write(pd.DataFrame({'customer_id': chunk['customer_id'].to_numpy(),
+                                           'cluster': labels}))
+                inertia += float(squared.sum())
+                counts += np.bincount(labels, minlength=args.clusters)
+
+    print(f"\nCustomers: {counts.sum():,}  Inertia: {inertia:,.2f}")
+    for cluster, count in enumerate(counts):
+        print(f"  Cluster {cluster}: {count:,} customers ({count / counts.sum() * 100:.1f}%)")
+    print(f"\n✓ Cluster assignments saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
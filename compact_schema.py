@@ -0,0 +1,384 @@
+"""
+Compact Schema for Transactions and RFM Tables
+Fixed-width integer layout with a separate customer ID dictionary
+
+Customer IDs are replaced by dense int32 codes into a sorted
+CustomerDictionary (code order is ID order, so results stay ordered as
+before), dates by days since 1970-01-01 (uint16, valid until 2149),
+amounts by fixed-point cents, scores by uint8 and string labels by
+categoricals. A transaction row takes 21 bytes instead of roughly 95 with
+string columns, and groupby/sort run on small integers.
+
+    transactions, customers = read_compact_transactions('ecommerce_transactions.csv')
+    rfm = compute_rfm_compact(transactions, len(customers))
+    rfm_df = expand_rfm(rfm, customers)      # usual rfm_df layout
+    rfm_df = rfm_table(rfm, customers)       # same columns, compact types
+
+rfm_table keeps the rfm_df column names, so scoring, clustering and
+segmentation run on it unchanged: customer_id is a categorical whose codes
+are the customer codes (IDs become strings only when a file is written)
+and the metrics, scores and cluster keep the storage.COMPACT_DTYPES types.
+
+Cents make amounts exact, so monetary in the expanded table may differ
+from the float sums of compute_rfm in the last floating-point digit.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from storage import compact_dtypes, iter_table, read_table
+
+EPOCH_DAY = np.datetime64('1970-01-01', 'D')
+
+# Compact transaction columns and their types ('category' for labels)
+TRANSACTION_SCHEMA = {
+    'transaction_id': 'uint32',
+    'customer_code': 'int32',
+    'transaction_day': 'uint16',
+    'product_category': 'category',
+    'quantity': 'uint8',
+    'unit_price_cents': 'int32',
+    'amount_cents': 'int32',
+    'true_segment': 'category',
+}
+
+# Compact RFM columns; rfm_score_numeric is not stored (r + f + m)
+RFM_SCHEMA = {
+    'customer_code': 'int32',
+    'recency': 'int16',
+    'frequency': 'int32',
+    'monetary_cents': 'int64',
+    'r_score': 'uint8',
+    'f_score': 'uint8',
+    'm_score': 'uint8',
+    'rfm_score': 'category',
+    'cluster': 'int8',
+    'segment': 'category',
+}
+
+# Source column -> compact column for the renamed transaction columns
+_RENAMED = {
+    'customer_id': 'customer_code',
+    'transaction_date': 'transaction_day',
+    'unit_price': 'unit_price_cents',
+    'total_amount': 'amount_cents',
+}
+
+
+class CustomerDictionary:
+    """
+    Sorted customer IDs; a customer's code is its position
+
+    Args:
+        ids (array-like): Unique customer IDs (sorted here)
+    """
+
+    def __init__(self, ids):
+        self.ids = pd.Index(pd.unique(np.asarray(ids, dtype=object))).sort_values()
+
+    @classmethod
+    def from_series(cls, customer_ids):
+        """Dictionary of the IDs in a (categorical or plain) column"""
+        if isinstance(customer_ids.dtype, pd.CategoricalDtype):
+            return cls(customer_ids.cat.remove_unused_categories().cat.categories)
+        return cls(customer_ids.unique())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, customer_ids):
+        """
+        Codes of customer IDs
+
+        Args:
+            customer_ids (pd.Series): IDs to encode
+
+        Returns:
+            np.ndarray: int32 codes
+        """
+        if isinstance(customer_ids.dtype, pd.CategoricalDtype):
+            categories = customer_ids.cat.categories
+            if categories.equals(self.ids):
+                codes = customer_ids.cat.codes.to_numpy()
+            else:
+                # Map each category once, then gather by category code
+                codes = self.ids.get_indexer(categories)[customer_ids.cat.codes.to_numpy()]
+        else:
+            codes = self.ids.get_indexer(customer_ids)
+        if (codes < 0).any():
+            raise KeyError("Customer IDs missing from the dictionary")
+        return codes.astype(np.int32)
+
+    def decode(self, codes):
+        """Customer IDs of codes"""
+        return self.ids.take(np.asarray(codes))
+
+
+def to_days(dates):
+    """Dates as uint16 days since 1970-01-01"""
+    days = (np.asarray(dates, dtype='datetime64[D]') - EPOCH_DAY).astype(np.int64)
+    return days.astype(np.uint16)
+
+
+def from_days(days):
+    """uint16 days since 1970-01-01 back to datetime64"""
+    return pd.to_datetime(EPOCH_DAY + np.asarray(days, dtype='timedelta64[D]'))
+
+
+def to_cents(amounts, dtype='int32'):
+    """Amounts as fixed-point integer cents"""
+    return np.rint(np.asarray(amounts, dtype=np.float64) * 100).astype(dtype)
+
+
+def compact_transactions(transactions, customers):
+    """
+    Convert transactions to the compact schema
+
+    Args:
+        transactions (pd.DataFrame): Transactions in the generator layout
+            (any subset of its columns)
+        customers (CustomerDictionary): Dictionary covering all customer IDs
+
+    Returns:
+        pd.DataFrame: Columns of TRANSACTION_SCHEMA present in the input
+    """
+    out = {}
+    for col in transactions.columns:
+        series = transactions[col]
+        name = _RENAMED.get(col, col)
+        if col == 'customer_id':
+            out[name] = customers.encode(series)
+        elif col == 'transaction_date':
+            out[name] = to_days(series)
+        elif name.endswith('_cents'):
+            out[name] = to_cents(series, TRANSACTION_SCHEMA[name])
+        elif TRANSACTION_SCHEMA.get(name) == 'category':
+            out[name] = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+        elif name in TRANSACTION_SCHEMA:
+            out[name] = series.to_numpy().astype(TRANSACTION_SCHEMA[name])
+        else:
+            out[name] = series
+    return pd.DataFrame(out)
+
+
+def _concat_chunks(chunks):
+    """Concatenate compact chunks, unifying per-chunk categories"""
+    if not chunks:
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in TRANSACTION_SCHEMA.items()})
+    labels = [col for col in chunks[0].columns if isinstance(chunks[0][col].dtype, pd.CategoricalDtype)]
+    unified = {col: pd.api.types.union_categoricals([chunk[col] for chunk in chunks], sort_categories=True)
+               for col in labels}
+    out = pd.concat([chunk.drop(columns=labels) for chunk in chunks], ignore_index=True)
+    for col in labels:
+        out[col] = unified[col]
+    return out[list(chunks[0].columns)]
+
+
+def read_compact_transactions(path, columns=None, chunksize=None, customers=None, fmt=None):
+    """
+    Load a transaction file straight into the compact schema
+
+    By default the file is loaded with read_table (categorical labels) and
+    converted at once. With chunksize it is read in chunks that are
+    converted as they arrive, so the wider layout never exists for more
+    than one chunk, at the cost of a first pass over customer_id and a
+    slower load.
+
+    Args:
+        path (str): Transaction file (CSV, Parquet or Feather)
+        columns (list): Source columns to load (all if None), e.g. RFM_COLUMNS
+        chunksize (int): Rows per chunk (default: load the file at once)
+        customers (CustomerDictionary): Existing dictionary to encode with
+            (default: built from the file's customer_id column first)
+        fmt (str): Explicit storage format overriding the extension
+
+    Returns:
+        tuple: (compact transactions, CustomerDictionary)
+    """
+    if not chunksize:
+        transactions = read_table(path, columns=columns, fmt=fmt)
+        if customers is None:
+            customers = CustomerDictionary.from_series(transactions['customer_id'])
+        return compact_transactions(transactions, customers), customers
+
+    if customers is None:
+        customers = CustomerDictionary.from_series(
+            read_table(path, columns=['customer_id'], fmt=fmt)['customer_id'])
+    chunks = [compact_transactions(chunk, customers)
+              for chunk in iter_table(path, columns=columns, chunksize=chunksize, fmt=fmt)]
+    return _concat_chunks(chunks), customers
+
+
+def compute_rfm_compact(transactions, num_customers, analysis_day=None):
+    """
+    RFM metrics from compact transactions with integer bin counts
+
+    Args:
+        transactions (pd.DataFrame): Compact transactions with
+            customer_code, transaction_day and amount_cents
+        num_customers (int): Dictionary size (codes are 0..num_customers-1)
+        analysis_day (int): Reference day number (default: the day after
+            the last transaction)
+
+    Returns:
+        pd.DataFrame: Compact RFM table (customer_code, recency, frequency,
+            monetary_cents) for customers with transactions, by code
+    """
+    codes = transactions['customer_code'].to_numpy()
+    days = transactions['transaction_day'].to_numpy()
+    if analysis_day is None:
+        analysis_day = int(days.max()) + 1
+
+    frequency = np.bincount(codes, minlength=num_customers)
+    # Integer cents sum exactly in int64
+    monetary = np.zeros(num_customers, dtype=np.int64)
+    np.add.at(monetary, codes, transactions['amount_cents'].to_numpy().astype(np.int64))
+    last_day = np.zeros(num_customers, dtype=np.int32)
+    np.maximum.at(last_day, codes, days.astype(np.int32))
+
+    present = np.flatnonzero(frequency)
+    return pd.DataFrame({
+        'customer_code': present.astype(np.int32),
+        'recency': (analysis_day - last_day[present]).astype(np.int16),
+        'frequency': frequency[present].astype(np.int32),
+        'monetary_cents': monetary[present],
+    })
+
+
+def compact_rfm(rfm_df, customers):
+    """
+    Convert an rfm_df (metrics, optionally scores and segments) to the compact schema
+
+    Args:
+        rfm_df (pd.DataFrame): RFM table in the usual layout
+        customers (CustomerDictionary): Dictionary covering its customers
+
+    Returns:
+        pd.DataFrame: Columns of RFM_SCHEMA present in the input
+    """
+    out = {'customer_code': customers.encode(rfm_df['customer_id'])}
+    for col, dtype in RFM_SCHEMA.items():
+        if col == 'monetary_cents' and 'monetary' in rfm_df:
+            out[col] = to_cents(rfm_df['monetary'], dtype)
+        elif col in rfm_df and col != 'customer_code':
+            out[col] = rfm_df[col].astype(dtype).to_numpy() if dtype != 'category' else rfm_df[col].astype('category')
+    return pd.DataFrame(out)
+
+
+def expand_rfm(rfm_compact, customers):
+    """
+    Compact RFM table back to the rfm_df layout the analysis code uses
+
+    Args:
+        rfm_compact (pd.DataFrame): Output of compute_rfm_compact or compact_rfm
+        customers (CustomerDictionary): Dictionary the codes refer to
+
+    Returns:
+        pd.DataFrame: customer_id, recency, frequency, monetary (float) and
+            any scores (with rfm_score_numeric), cluster and segment
+    """
+    rfm_df = pd.DataFrame({
+        'customer_id': customers.decode(rfm_compact['customer_code']),
+        'recency': rfm_compact['recency'].to_numpy(dtype=np.int64),
+        'frequency': rfm_compact['frequency'].to_numpy(dtype=np.int64),
+        'monetary': rfm_compact['monetary_cents'].to_numpy() / 100,
+    })
+    for col in ('r_score', 'f_score', 'm_score'):
+        if col in rfm_compact:
+            rfm_df[col] = rfm_compact[col].to_numpy(dtype=np.int64)
+    if 'rfm_score' in rfm_compact:
+        rfm_df['rfm_score'] = rfm_compact['rfm_score'].to_numpy()
+    if {'r_score', 'f_score', 'm_score'} <= set(rfm_df.columns):
+        rfm_df['rfm_score_numeric'] = rfm_df['r_score'] + rfm_df['f_score'] + rfm_df['m_score']
+    for col in ('cluster', 'segment'):
+        if col in rfm_compact:
+            rfm_df[col] = rfm_compact[col].to_numpy()
+    return rfm_df
+
+
+def rfm_table(rfm_compact, customers):
+    """
+    Compact RFM table in the rfm_df column layout, without decoding the IDs
+
+    Args:
+        rfm_compact (pd.DataFrame): Output of compute_rfm_compact
+        customers (CustomerDictionary): Dictionary the codes refer to
+
+    Returns:
+        pd.DataFrame: customer_id (categorical over the dictionary, coded
+            by customer code), recency, frequency (compact integers) and
+            monetary (exact cents / 100)
+    """
+    return compact_dtypes(pd.DataFrame({
+        'customer_id': pd.Categorical.from_codes(rfm_compact['customer_code'].to_numpy(),
+                                                 categories=customers.ids),
+        'recency': rfm_compact['recency'].to_numpy(),
+        'frequency': rfm_compact['frequency'].to_numpy(),
+        'monetary': rfm_compact['monetary_cents'].to_numpy() / 100,
+    }))
+
+
+def memory_mb(df):
+    """Deep memory footprint of a frame in MB"""
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def main():
+    """Main execution function"""
+    from rfm import compute_rfm
+    from storage import RFM_COLUMNS, read_transactions
+
+    parser = argparse.ArgumentParser(
+        description='Compare the compact schema with the standard layout'
+    )
+    parser.add_argument('--input', type=str, default='ecommerce_transactions.csv',
+                        help='Transaction file (default: ecommerce_transactions.csv)')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("COMPACT SCHEMA")
+    print("="*70)
+
+    start = time.perf_counter()
+    standard = read_transactions(args.input)
+    standard_load = time.perf_counter() - start
+    start = time.perf_counter()
+    compact, customers = read_compact_transactions(args.input)
+    compact_load = time.perf_counter() - start
+    labels = [col for col in standard.columns if isinstance(standard[col].dtype, pd.CategoricalDtype)]
+    strings = standard.astype({col: str for col in labels})
+
+    print(f"\n{len(standard):,} transactions, {len(customers):,} customers")
+    print(f"  String labels:      {memory_mb(strings):8.1f} MB")
+    print(f"  Categorical labels: {memory_mb(standard):8.1f} MB  (read_transactions, {standard_load:.2f}s)")
+    print(f"  Compact schema:     {memory_mb(compact):8.1f} MB  ({compact_load:.2f}s, "
+          f"+{memory_mb(customers.ids.to_frame()):.1f} MB customer dictionary)")
+    print(f"  Reduction:          {memory_mb(strings) / memory_mb(compact):8.1f}x vs string labels, "
+          f"{memory_mb(standard) / memory_mb(compact):.1f}x vs categorical")
+    del strings
+
+    standard = standard[RFM_COLUMNS]
+    start = time.perf_counter()
+    rfm_df = compute_rfm(standard)
+    standard_rfm = time.perf_counter() - start
+    start = time.perf_counter()
+    rfm_compact = compute_rfm_compact(compact, len(customers))
+    compact_rfm_seconds = time.perf_counter() - start
+
+    print(f"\nRFM aggregation: standard {standard_rfm:.3f}s, compact {compact_rfm_seconds:.3f}s")
+    print(f"RFM table: standard {memory_mb(rfm_df):.1f} MB, compact {memory_mb(rfm_compact):.1f} MB")
+    expanded = expand_rfm(rfm_compact, customers)
+    same = ((expanded['customer_id'].to_numpy(dtype=object) == rfm_df['customer_id'].to_numpy(dtype=object)).all()
+            and expanded[['recency', 'frequency']].equals(rfm_df[['recency', 'frequency']])
+            and np.allclose(expanded['monetary'], rfm_df['monetary'], rtol=0, atol=0.005))
+    print(f"{'✓' if same else '✗'} Compact RFM matches compute_rfm")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,16 +8,20 @@ Date: November 2025
 
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import argparse
+import json
+import os
+import shutil
 
-# Set seeds for reproducibility
-np.random.seed(42)
-random.seed(42)
+from instrumentation import DISABLED, RunReport
+from storage import TableWriter, detect_format, read_table, write_table
 
 # Configuration
+RANDOM_SEED = 42
 NUM_CUSTOMERS = 25000
+DEFAULT_CHUNK_CUSTOMERS = 100000
 START_DATE = datetime(2023, 1, 1)
 END_DATE = datetime(2025, 11, 15)
 
@@ -98,11 +102,287 @@ CUSTOMER_SEGMENTS = {
 }
 
 
+# Quantity distribution (occasional bulk purchases)
+QUANTITY_CHOICES = (1, 2, 3, 4, 5)
+QUANTITY_WEIGHTS = (70, 15, 8, 5, 2)
+
+
+def _segment_table():
+    """Per-segment behaviour parameters as arrays indexed by segment code"""
+    configs = list(CUSTOMER_SEGMENTS.values())
+    weights = np.array([c['transaction_prob'] for c in configs], dtype=float)
+    return {
+        'weights': weights / weights.sum(),
+        'freq_lo': np.array([c['frequency_range'][0] for c in configs]),
+        'freq_hi': np.array([c['frequency_range'][1] for c in configs]),
+        'mult_lo': np.array([c['value_mult'][0] for c in configs]),
+        'mult_hi': np.array([c['value_mult'][1] for c in configs]),
+        'rec_lo': np.array([c['recency_days'][0] for c in configs]),
+        'rec_hi': np.array([c['recency_days'][1] for c in configs]),
+    }
+
+
+def draw_customer_profiles(rng, num_customers,
+                           start_date=START_DATE,
+                           end_date=END_DATE):
+    """
+    Draw segment, recency and transaction count for a batch of customers
+
+    Args:
+        rng (np.random.Generator): Random generator
+        num_customers (int): Number of customers to draw
+        start_date (datetime): Earliest transaction date
+        end_date (datetime): Latest transaction date
+
+    Returns:
+        dict: Arrays 'segment' (segment codes), 'recency' (days before
+            end_date of the last purchase) and 'num_transactions'
+    """
+    table = _segment_table()
+    segment = rng.choice(len(table['weights']), size=num_customers,
+                         p=table['weights']).astype(np.int8)
+    num_transactions = rng.integers(table['freq_lo'][segment],
+                                    table['freq_hi'][segment], endpoint=True)
+    recency = rng.integers(table['rec_lo'][segment],
+                           table['rec_hi'][segment], endpoint=True)
+
+    # Customers whose last purchase falls on the first day only buy once
+    days_between = (end_date - start_date).days - recency
+    num_transactions = np.where(days_between <= 0, 1, num_transactions)
+
+    return {
+        'segment': segment,
+        'recency': recency.astype(np.int32),
+        'num_transactions': num_transactions.astype(np.int64),
+    }
+
+
+def build_transactions(rng, profiles,
+                       first_customer_id=1,
+                       first_transaction_id=1,
+                       start_date=START_DATE,
+                       end_date=END_DATE):
+    """
+    Expand customer profiles into a transaction DataFrame
+
+    All transactions of all customers are drawn as flat arrays; per-customer
+    values are broadcast with np.repeat over the transaction counts.
+
+    Args:
+        rng (np.random.Generator): Random generator
+        profiles (dict): Output of draw_customer_profiles
+        first_customer_id (int): Numeric ID of the first customer
+        first_transaction_id (int): ID of the first transaction
+        start_date (datetime): Earliest transaction date
+        end_date (datetime): Latest transaction date
+
+    Returns:
+        pd.DataFrame: Transactions sorted by customer and date
+    """
+    table = _segment_table()
+    segment = profiles['segment']
+    counts = profiles['num_transactions']
+    num_customers = len(segment)
+    total = int(counts.sum())
+
+    # Offset of the last purchase from start_date, one value per customer
+    span = (end_date - start_date).days
+    last_day = span - profiles['recency'].astype(np.int64)
+
+    # Per-transaction view of the customer attributes
+    customer_idx = np.repeat(np.arange(num_customers, dtype=np.int32), counts)
+    txn_segment = np.repeat(segment, counts)
+    txn_last_day = np.repeat(last_day, counts)
+
+    # Earlier purchases fall uniformly before the last one; the final
+    # transaction of every customer is the last purchase itself
+    ends = np.cumsum(counts) - 1
+    days = (rng.random(total) * (np.maximum(txn_last_day, 0) + 1)).astype(np.int64)
+    days[ends] = last_day
+
+    # Sort dates within each customer with a single composite-key sort
+    key = customer_idx.astype(np.int64) * (span + 1) + days
+    key.sort()
+    days = key % (span + 1)
+
+    # Product category and purchase amount
+    categories = list(PRODUCT_CATEGORIES.keys())
+    price_lo = np.array([PRODUCT_CATEGORIES[c][0] for c in categories])
+    price_hi = np.array([PRODUCT_CATEGORIES[c][1] for c in categories])
+    category = rng.integers(0, len(categories), size=total, dtype=np.int8)
+    base_price = price_lo[category] + (price_hi - price_lo)[category] * rng.random(total)
+    mult_lo = np.repeat(table['mult_lo'][segment], counts)
+    mult_width = np.repeat((table['mult_hi'] - table['mult_lo'])[segment], counts)
+    value_mult = mult_lo + mult_width * rng.random(total)
+    unit_price = np.round(base_price * value_mult, 2)
+
+    quantity_cdf = np.cumsum(QUANTITY_WEIGHTS) / np.sum(QUANTITY_WEIGHTS)
+    quantity = np.array(QUANTITY_CHOICES)[
+        np.searchsorted(quantity_cdf, rng.random(total), side='right')
+    ]
+    total_amount = np.round(unit_price * quantity, 2)
+
+    customer_ids = pd.Index(np.char.add(
+        'CUST',
+        np.char.zfill(np.arange(first_customer_id,
+                                first_customer_id + num_customers).astype(str), 5)
+    ), dtype=object)
+    dates = np.datetime64(start_date.date(), 'D') + days
+
+    return pd.DataFrame({
+        'transaction_id': np.arange(first_transaction_id,
+                                    first_transaction_id + total),
+        'customer_id': pd.Categorical.from_codes(customer_idx, customer_ids),
+        'transaction_date': dates.astype('datetime64[ns]'),
+        'product_category': pd.Categorical.from_codes(category, categories),
+        'quantity': quantity,
+        'unit_price': unit_price,
+        'total_amount': total_amount,
+        'true_segment': pd.Categorical.from_codes(txn_segment,
+                                                  list(CUSTOMER_SEGMENTS.keys()))
+    })
+
+
+class SummaryAccumulator:
+    """
+    Running dataset statistics that can be updated one block at a time
+
+    Every statistic is a mergeable reduction, so blocks can be folded in
+    without keeping earlier transactions around. The median order value is
+    exact: amounts are counted in a histogram with one bin per cent.
+    """
+
+    def __init__(self):
+        self.num_customers = 0
+        self.num_transactions = 0
+        self.total_revenue = 0.0
+        self.min_date = None
+        self.max_date = None
+        self.min_per_customer = None
+        self.max_per_customer = None
+        self.segment_counts = np.zeros(len(CUSTOMER_SEGMENTS), dtype=np.int64)
+        self.category_counts = np.zeros(len(PRODUCT_CATEGORIES), dtype=np.int64)
+        self.amount_cents = np.zeros(0, dtype=np.int64)
+
+    def update(self, df):
+        """
+        Fold a block of transactions into the running statistics
+
+        Args:
+            df (pd.DataFrame): Transactions covering complete customers
+        """
+        if len(df) == 0:
+            return
+
+        trans_per_cust = df.groupby('customer_id', observed=True).size()
+        first_txn = ~df['customer_id'].duplicated()
+        segment_codes = pd.Categorical(
+            df.loc[first_txn, 'true_segment'], categories=list(CUSTOMER_SEGMENTS.keys())
+        ).codes
+        category_codes = pd.Categorical(
+            df['product_category'], categories=list(PRODUCT_CATEGORIES.keys())
+        ).codes
+
+        self.num_customers += len(trans_per_cust)
+        self.num_transactions += len(df)
+        self.total_revenue += float(df['total_amount'].sum())
+        self.min_date = _min_or_other(self.min_date, df['transaction_date'].min())
+        self.max_date = _max_or_other(self.max_date, df['transaction_date'].max())
+        self.min_per_customer = _min_or_other(self.min_per_customer, int(trans_per_cust.min()))
+        self.max_per_customer = _max_or_other(self.max_per_customer, int(trans_per_cust.max()))
+        self.segment_counts += np.bincount(segment_codes[segment_codes >= 0],
+                                           minlength=len(self.segment_counts))
+        self.category_counts += np.bincount(category_codes[category_codes >= 0],
+                                            minlength=len(self.category_counts))
+
+        cents = np.rint(df['total_amount'].to_numpy() * 100).astype(np.int64)
+        block_hist = np.bincount(cents)
+        if len(block_hist) > len(self.amount_cents):
+            block_hist[:len(self.amount_cents)] += self.amount_cents
+            self.amount_cents = block_hist
+        else:
+            self.amount_cents[:len(block_hist)] += block_hist
+
+    def merge(self, other):
+        """
+        Fold another accumulator (e.g. from a separate shard) into this one
+
+        Args:
+            other (SummaryAccumulator): Statistics of disjoint customers
+        """
+        if other.num_transactions == 0:
+            return
+        self.num_customers += other.num_customers
+        self.num_transactions += other.num_transactions
+        self.total_revenue += other.total_revenue
+        self.min_date = _min_or_other(self.min_date, other.min_date)
+        self.max_date = _max_or_other(self.max_date, other.max_date)
+        self.min_per_customer = _min_or_other(self.min_per_customer, other.min_per_customer)
+        self.max_per_customer = _max_or_other(self.max_per_customer, other.max_per_customer)
+        self.segment_counts += other.segment_counts
+        self.category_counts += other.category_counts
+        size = max(len(self.amount_cents), len(other.amount_cents))
+        merged = np.zeros(size, dtype=np.int64)
+        merged[:len(self.amount_cents)] += self.amount_cents
+        merged[:len(other.amount_cents)] += other.amount_cents
+        self.amount_cents = merged
+
+    def median_amount(self):
+        """Exact median order value from the per-cent histogram"""
+        cumulative = np.cumsum(self.amount_cents)
+        n = self.num_transactions
+        lower = np.searchsorted(cumulative, (n - 1) // 2, side='right')
+        upper = np.searchsorted(cumulative, n // 2, side='right')
+        return (lower + upper) / 200
+
+    def print_report(self):
+        """Print the dataset summary block"""
+        print(f"\n" + "="*70)
+        print("DATASET SUMMARY")
+        print("="*70)
+        print(f"\nTotal Customers: {self.num_customers:,}")
+        print(f"Total Transactions: {self.num_transactions:,}")
+        print(f"Date Range: {self.min_date.date()} to {self.max_date.date()}")
+        print(f"Total Revenue: ${self.total_revenue:,.2f}")
+        print(f"\nAverage Order Value: ${self.total_revenue / self.num_transactions:.2f}")
+        print(f"Median Order Value: ${self.median_amount():.2f}")
+        print(f"\nTransactions per Customer:")
+        print(f"  Mean: {self.num_transactions / self.num_customers:.1f}")
+        print(f"  Min: {self.min_per_customer}")
+        print(f"  Max: {self.max_per_customer}")
+        
+        print(f"\nProduct Category Distribution:")
+        order = np.argsort(-self.category_counts, kind='stable')
+        categories = list(PRODUCT_CATEGORIES.keys())
+        for i in order:
+            count = self.category_counts[i]
+            pct = count / self.num_transactions * 100
+            print(f"  {categories[i]:20s}: {count:6d} ({pct:5.1f}%)")
+
+
+def _min_or_other(current, value):
+    return value if current is None else min(current, value)
+
+
+def _max_or_other(current, value):
+    return value if current is None else max(current, value)
+
+
+def _print_segment_distribution(segment_counts, num_customers):
+    print("\nCustomer Distribution by Segment:")
+    for segment, count in zip(CUSTOMER_SEGMENTS.keys(), segment_counts):
+        pct = count / num_customers * 100
+        print(f"  {segment:20s}: {count:5d} ({pct:5.1f}%)")
+
+
 def generate_transactions(num_customers=NUM_CUSTOMERS, 
                           start_date=START_DATE, 
                           end_date=END_DATE,
                           output_file='ecommerce_transactions.csv',
-                          verbose=True):
+                          seed=RANDOM_SEED,
+                          chunk_customers=None,
+                          verbose=True,
+                          run_report=None):
     """
     Generate synthetic e-commerce transaction data
     
@@ -110,12 +390,20 @@ def generate_transactions(num_customers=NUM_CUSTOMERS,
         num_customers (int): Number of unique customers to generate
         start_date (datetime): Earliest transaction date
         end_date (datetime): Latest transaction date
-        output_file (str): Output CSV filename
+        output_file (str): Output filename; .parquet/.feather select a
+            columnar format, .db/.sqlite a SQLite database (bulk-inserted
+            and indexed), anything else is written as CSV
+        seed (int): Seed for the random generator
+        chunk_customers (int): If set, stream customers to output_file in
+            blocks of this size so only one block is held in memory
         verbose (bool): Print progress information
+        run_report (RunReport): Optional instrumentation report to record
+            the generation stages in
         
     Returns:
-        pd.DataFrame: Generated transaction data
+        pd.DataFrame: Generated transaction data (None in streaming mode)
     """
+    run_report = run_report or DISABLED
     
     if verbose:
         print("="*70)
@@ -126,119 +414,45 @@ def generate_transactions(num_customers=NUM_CUSTOMERS,
         print(f"  Date Range: {start_date.date()} to {end_date.date()}")
         print(f"  Product Categories: {len(PRODUCT_CATEGORIES)}")
         print(f"  Customer Segments: {len(CUSTOMER_SEGMENTS)}")
+        print(f"  Seed: {seed}")
+        if chunk_customers:
+            print(f"  Streaming: {chunk_customers:,} customers per block")
+    
+    rng = np.random.default_rng(seed)
+    
+    if chunk_customers:
+        return _stream_transactions(rng, num_customers, start_date, end_date,
+                                    output_file, chunk_customers, verbose, run_report)
     
     # Assign customers to segments
-    segment_weights = [v['transaction_prob'] for v in CUSTOMER_SEGMENTS.values()]
-    customer_segments = random.choices(
-        list(CUSTOMER_SEGMENTS.keys()), 
-        weights=segment_weights, 
-        k=num_customers
-    )
+    with run_report.stage('generate_profiles', rows_in=num_customers):
+        profiles = draw_customer_profiles(rng, num_customers, start_date, end_date)
     
     if verbose:
-        print("\nCustomer Distribution by Segment:")
-        for segment in CUSTOMER_SEGMENTS.keys():
-            count = customer_segments.count(segment)
-            pct = count / num_customers * 100
-            print(f"  {segment:20s}: {count:5d} ({pct:5.1f}%)")
+        _print_segment_distribution(
+            np.bincount(profiles['segment'], minlength=len(CUSTOMER_SEGMENTS)),
+            num_customers
+        )
     
     # Generate transactions
-    transactions = []
-    transaction_id = 1
-    
     if verbose:
         print(f"\nGenerating transactions...")
     
-    for customer_id in range(1, num_customers + 1):
-        segment = customer_segments[customer_id - 1]
-        segment_config = CUSTOMER_SEGMENTS[segment]
-        
-        # Determine number of transactions
-        num_transactions = random.randint(*segment_config['frequency_range'])
-        
-        # Determine recency (last purchase date)
-        recency_days = random.randint(*segment_config['recency_days'])
-        last_purchase_date = end_date - timedelta(days=recency_days)
-        
-        # Generate transaction dates
-        if num_transactions == 1:
-            transaction_dates = [last_purchase_date]
-        else:
-            days_between = (last_purchase_date - start_date).days
-            if days_between <= 0:
-                transaction_dates = [last_purchase_date]
-            else:
-                # Generate dates with realistic clustering
-                transaction_dates = sorted([
-                    start_date + timedelta(days=random.randint(0, days_between))
-                    for _ in range(num_transactions - 1)
-                ])
-                transaction_dates.append(last_purchase_date)
-        
-        # Generate transactions
-        for trans_date in transaction_dates:
-            # Select product category
-            category = random.choice(list(PRODUCT_CATEGORIES.keys()))
-            price_range = PRODUCT_CATEGORIES[category]
-            
-            # Calculate purchase amount
-            base_price = random.uniform(*price_range)
-            value_mult = random.uniform(*segment_config['value_mult'])
-            purchase_amount = round(base_price * value_mult, 2)
-            
-            # Quantity (occasional bulk purchases)
-            quantity = random.choices(
-                [1, 2, 3, 4, 5], 
-                weights=[70, 15, 8, 5, 2]
-            )[0]
-            
-            total_amount = round(purchase_amount * quantity, 2)
-            
-            transactions.append({
-                'transaction_id': transaction_id,
-                'customer_id': f'CUST{customer_id:05d}',
-                'transaction_date': trans_date,
-                'product_category': category,
-                'quantity': quantity,
-                'unit_price': purchase_amount,
-                'total_amount': total_amount,
-                'true_segment': segment
-            })
-            
-            transaction_id += 1
-        
-        # Progress indicator
-        if verbose and customer_id % 5000 == 0:
-            print(f"  Processed {customer_id:,} customers...")
-    
-    # Create DataFrame
-    df = pd.DataFrame(transactions)
+    with run_report.stage('generate_transactions', rows_in=num_customers) as stage:
+        df = build_transactions(rng, profiles,
+                                start_date=start_date,
+                                end_date=end_date)
+        stage.rows_out = len(df)
     
     if verbose:
         print(f"\n✓ Generated {len(df):,} transactions")
-        print(f"\n" + "="*70)
-        print("DATASET SUMMARY")
-        print("="*70)
-        print(f"\nTotal Customers: {df['customer_id'].nunique():,}")
-        print(f"Total Transactions: {len(df):,}")
-        print(f"Date Range: {df['transaction_date'].min().date()} to {df['transaction_date'].max().date()}")
-        print(f"Total Revenue: ${df['total_amount'].sum():,.2f}")
-        print(f"\nAverage Order Value: ${df['total_amount'].mean():.2f}")
-        print(f"Median Order Value: ${df['total_amount'].median():.2f}")
-        print(f"\nTransactions per Customer:")
-        trans_per_cust = df.groupby('customer_id').size()
-        print(f"  Mean: {trans_per_cust.mean():.1f}")
-        print(f"  Min: {trans_per_cust.min()}")
-        print(f"  Max: {trans_per_cust.max()}")
-        
-        print(f"\nProduct Category Distribution:")
-        category_dist = df['product_category'].value_counts()
-        for cat, count in category_dist.items():
-            pct = count / len(df) * 100
-            print(f"  {cat:20s}: {count:6d} ({pct:5.1f}%)")
+        summary = SummaryAccumulator()
+        summary.update(df)
+        summary.print_report()
     
-    # Save to CSV
-    df.to_csv(output_file, index=False)
+    # Save to CSV (or Parquet/Feather, by extension)
+    with run_report.stage('write_transactions', rows_in=len(df)):
+        write_table(df, output_file)
     
     if verbose:
         print(f"\n✓ Data saved to '{output_file}'")
@@ -247,6 +461,250 @@ def generate_transactions(num_customers=NUM_CUSTOMERS,
     return df
 
 
+def _stream_transactions(rng, num_customers, start_date, end_date,
+                         output_file, chunk_customers, verbose, run_report=DISABLED):
+    """Generate and append transactions one block of customers at a time"""
+    summary = SummaryAccumulator()
+    next_transaction_id = 1
+    
+    if verbose:
+        print(f"\nGenerating transactions...")
+    
+    with TableWriter(output_file) as writer:
+        for first in range(0, num_customers, chunk_customers):
+            block_size = min(chunk_customers, num_customers - first)
+            with run_report.stage('generate_block', rows_in=block_size) as stage:
+                profiles = draw_customer_profiles(rng, block_size, start_date, end_date)
+                block = build_transactions(rng, profiles,
+                                           first_customer_id=first + 1,
+                                           first_transaction_id=next_transaction_id,
+                                           start_date=start_date,
+                                           end_date=end_date)
+                next_transaction_id += len(block)
+                
+                writer.write(block)
+                stage.rows_out = len(block)
+            summary.update(block)
+            del block
+            
+            if verbose:
+                print(f"  Processed {first + block_size:,} customers...")
+    
+    if verbose:
+        _print_segment_distribution(summary.segment_counts, num_customers)
+        print(f"\n✓ Generated {summary.num_transactions:,} transactions")
+        summary.print_report()
+        print(f"\n✓ Data saved to '{output_file}'")
+        print("="*70)
+    
+    return None
+
+
+def _shard_plan(num_customers, num_shards, seed, start_date, end_date, chunk_customers):
+    """
+    Split the customer range into shards with contiguous ID ranges
+
+    Each shard gets an independent child seed spawned from the master seed.
+    The child seed is split again into a profile stream and a transaction
+    stream, so the parent can replay the cheap profile draws to find every
+    shard's first transaction_id before any transactions are generated.
+    """
+    shard_seeds = np.random.SeedSequence(seed).spawn(num_shards)
+    bounds = np.linspace(0, num_customers, num_shards + 1).astype(np.int64)
+    block_size = chunk_customers or num_customers
+
+    plan = []
+    next_transaction_id = 1
+    for shard, shard_seed in enumerate(shard_seeds):
+        first, last = int(bounds[shard]), int(bounds[shard + 1])
+        profile_seed, transaction_seed = shard_seed.spawn(2)
+        profile_rng = np.random.default_rng(profile_seed)
+        num_transactions = 0
+        for block_first in range(first, last, block_size):
+            profiles = draw_customer_profiles(
+                profile_rng, min(block_size, last - block_first), start_date, end_date
+            )
+            num_transactions += int(profiles['num_transactions'].sum())
+        plan.append({
+            'shard': shard,
+            'first_customer_id': first + 1,
+            'num_customers': last - first,
+            'first_transaction_id': next_transaction_id,
+            'num_transactions': num_transactions,
+            'profile_seed': profile_seed,
+            'transaction_seed': transaction_seed,
+        })
+        next_transaction_id += num_transactions
+    return plan
+
+
+def _generate_shard(task):
+    """Worker: generate one shard and write it to its part file"""
+    profile_rng = np.random.default_rng(task['profile_seed'])
+    transaction_rng = np.random.default_rng(task['transaction_seed'])
+    block_size = task['chunk_customers'] or task['num_customers']
+    summary = SummaryAccumulator()
+    next_transaction_id = task['first_transaction_id']
+    end = task['first_customer_id'] + task['num_customers']
+
+    with TableWriter(task['path']) as writer:
+        for block_first in range(task['first_customer_id'], end, block_size):
+            profiles = draw_customer_profiles(profile_rng, min(block_size, end - block_first),
+                                              task['start_date'], task['end_date'])
+            block = build_transactions(transaction_rng, profiles,
+                                       first_customer_id=block_first,
+                                       first_transaction_id=next_transaction_id,
+                                       start_date=task['start_date'],
+                                       end_date=task['end_date'])
+            next_transaction_id += len(block)
+            writer.write(block)
+            summary.update(block)
+
+    return summary
+
+
+def _part_path(output_file, shard):
+    root, ext = os.path.splitext(output_file)
+    if detect_format(output_file) == 'feather':
+        # Shards write in blocks, which Feather does not support
+        ext = '.parquet'
+    return f"{root}.part-{shard:05d}{ext or '.csv'}"
+
+
+def generate_sharded(num_customers=NUM_CUSTOMERS,
+                     start_date=START_DATE,
+                     end_date=END_DATE,
+                     output_file='ecommerce_transactions.csv',
+                     seed=RANDOM_SEED,
+                     workers=2,
+                     num_shards=None,
+                     chunk_customers=None,
+                     merge=True,
+                     verbose=True):
+    """
+    Generate transactions in parallel shards across a process pool
+
+    The customer range is split into contiguous shards, each generated by a
+    worker process from its own child seed. Output is identical for a given
+    (seed, num_shards, chunk_customers) whatever the number of workers, and
+    customer IDs and transaction IDs remain globally unique and contiguous.
+    Profiles are drawn block by block, so changing chunk_customers changes
+    the generated data.
+
+    Args:
+        num_customers (int): Number of unique customers to generate
+        start_date (datetime): Earliest transaction date
+        end_date (datetime): Latest transaction date
+        output_file (str): Output filename (.csv, .parquet, .feather or
+            .db); Feather output is sharded into Parquet part files and
+            merged with a single write, so the merge holds all transactions
+            in memory
+        seed (int): Master seed the shard seeds are derived from
+        workers (int): Number of worker processes
+        num_shards (int): Number of shards (default: workers)
+        chunk_customers (int): Customers per block within a shard (default:
+            one block per shard); part of the reproducibility key
+        merge (bool): Concatenate part files into output_file; otherwise
+            keep the part files and write a JSON manifest next to them
+        verbose (bool): Print progress information
+
+    Returns:
+        dict: Manifest describing the shards and output files
+    """
+    num_shards = num_shards or workers
+
+    if verbose:
+        print("="*70)
+        print("E-COMMERCE SYNTHETIC DATA GENERATOR (SHARDED)")
+        print("="*70)
+        print(f"\nConfiguration:")
+        print(f"  Customers: {num_customers:,}")
+        print(f"  Date Range: {start_date.date()} to {end_date.date()}")
+        print(f"  Seed: {seed}")
+        print(f"  Shards: {num_shards} across {workers} workers")
+
+    plan = _shard_plan(num_customers, num_shards, seed, start_date, end_date,
+                       chunk_customers)
+    tasks = [dict(shard,
+                  path=_part_path(output_file, shard['shard']),
+                  chunk_customers=chunk_customers,
+                  start_date=start_date,
+                  end_date=end_date)
+             for shard in plan]
+
+    if verbose:
+        print(f"\nGenerating transactions...")
+
+    summary = SummaryAccumulator()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for task, shard_summary in zip(tasks, pool.map(_generate_shard, tasks)):
+            summary.merge(shard_summary)
+            if verbose:
+                print(f"  Shard {task['shard']}: {task['num_customers']:,} customers, "
+                      f"{task['num_transactions']:,} transactions")
+
+    manifest = {
+        'seed': seed,
+        'num_shards': num_shards,
+        'num_customers': num_customers,
+        'num_transactions': summary.num_transactions,
+        'start_date': str(start_date.date()),
+        'end_date': str(end_date.date()),
+        'parts': [{
+            'path': os.path.basename(task['path']),
+            'first_customer_id': task['first_customer_id'],
+            'num_customers': task['num_customers'],
+            'first_transaction_id': task['first_transaction_id'],
+            'num_transactions': task['num_transactions'],
+        } for task in tasks],
+    }
+
+    if merge:
+        _merge_parts([task['path'] for task in tasks], output_file)
+        manifest['output'] = os.path.basename(output_file)
+    else:
+        manifest_path = os.path.splitext(output_file)[0] + '.manifest.json'
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    if verbose:
+        _print_segment_distribution(summary.segment_counts, num_customers)
+        print(f"\n✓ Generated {summary.num_transactions:,} transactions")
+        summary.print_report()
+        if merge:
+            print(f"\n✓ Data saved to '{output_file}'")
+        else:
+            print(f"\n✓ {num_shards} part files and manifest saved to '{manifest_path}'")
+        print("="*70)
+
+    return manifest
+
+
+def _merge_parts(part_paths, output_file):
+    """Concatenate part files into one output, one part in memory at most (all for Feather)"""
+    if detect_format(output_file) == 'feather':
+        # Feather cannot be appended to: one write of all parts
+        write_table(pd.concat([read_table(path) for path in part_paths], ignore_index=True), output_file)
+        for path in part_paths:
+            os.remove(path)
+        return
+    if detect_format(output_file) != 'csv':
+        with TableWriter(output_file) as writer:
+            for path in part_paths:
+                writer.write(read_table(path))
+                os.remove(path)
+        return
+
+    # CSV parts are joined byte-wise, keeping only the first header
+    with open(output_file, 'wb') as out:
+        for i, path in enumerate(part_paths):
+            with open(path, 'rb') as part:
+                if i > 0:
+                    part.readline()
+                shutil.copyfileobj(part, out, length=16 * 1024 * 1024)
+            os.remove(path)
+
+
 def main():
     """Main execution function"""
     parser = argparse.ArgumentParser(
@@ -262,7 +720,61 @@ def main():
         '--output',
         type=str,
         default='ecommerce_transactions.csv',
-        help='Output CSV filename (default: ecommerce_transactions.csv)'
+        help='Output filename; .parquet or .feather for columnar output, .db for '
+             'SQLite (default: ecommerce_transactions.csv)'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=RANDOM_SEED,
+        help=f'Random seed for reproducible output (default: {RANDOM_SEED})'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Write customers to the output in blocks with bounded memory'
+    )
+    parser.add_argument(
+        '--chunk-customers',
+        type=int,
+        default=None,
+        help=f'Customers per block in streaming mode (default: {DEFAULT_CHUNK_CUSTOMERS}; implies --stream)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Generate shards in parallel with this many processes (default: 1)'
+    )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=None,
+        help='Number of shards; output is fixed by (seed, shards) (default: --workers)'
+    )
+    parser.add_argument(
+        '--no-merge',
+        action='store_true',
+        help='Keep per-shard part files and write a manifest instead of merging'
+    )
+    parser.add_argument(
+        '--run-report',
+        type=str,
+        default=None,
+        help='Write stage timings and peak memory to this JSON file'
+    )
+    parser.add_argument(
+        '--profile-stage',
+        type=str,
+        default=None,
+        help='Run this stage under cProfile (e.g. generate_transactions)'
+    )
+    parser.add_argument(
+        '--memory',
+        type=str,
+        default='rss',
+        choices=['tracemalloc', 'rss', 'none'],
+        help='Peak memory measurement for the run report (default: rss)'
     )
     parser.add_argument(
         '--quiet',
@@ -272,13 +784,41 @@ def main():
     
     args = parser.parse_args()
     
+    chunk_customers = args.chunk_customers
+    if args.stream and chunk_customers is None:
+        chunk_customers = DEFAULT_CHUNK_CUSTOMERS
+    
+    if args.workers > 1 or args.shards:
+        return generate_sharded(
+            num_customers=args.customers,
+            output_file=args.output,
+            seed=args.seed,
+            workers=args.workers,
+            num_shards=args.shards,
+            chunk_customers=chunk_customers,
+            merge=not args.no_merge,
+            verbose=not args.quiet
+        )
+    
+    run_report = RunReport('data_generation', enabled=bool(args.run_report or args.profile_stage),
+                           memory=None if args.memory == 'none' else args.memory,
+                           profile_stage=args.profile_stage)
+    
     # Generate data
     df = generate_transactions(
         num_customers=args.customers,
         output_file=args.output,
-        verbose=not args.quiet
+        seed=args.seed,
+        chunk_customers=chunk_customers,
+        verbose=not args.quiet,
+        run_report=run_report
     )
     
+    if args.run_report:
+        run_report.print_summary()
+        run_report.save(args.run_report)
+        print(f"\n✓ Run report saved to '{args.run_report}'")
+    
     return df
 
 
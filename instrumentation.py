@@ -0,0 +1,233 @@
+"""
+Pipeline Instrumentation
+Per-stage wall time, peak traced memory and row counts with a JSON run report
+
+Stages are wrapped in RunReport.stage context managers:
+
+    report = RunReport()
+    with report.stage('rfm', rows_in=len(df)) as stage:
+        rfm_df = compute_rfm(df)
+        stage.rows_out = len(rfm_df)
+    report.print_summary()
+    report.save('run_report.json')
+
+Memory is the peak above the level at stage entry, measured either with
+tracemalloc ('tracemalloc': Python and NumPy allocations; precise but it
+slows allocation-heavy code such as CSV writing several-fold) or from the
+process's peak resident set size, reset at each stage entry ('rss': all
+allocations including native libraries, negligible overhead, Linux only).
+Stages may be nested. Setting
+profile_stage runs that one stage under cProfile and writes its stats next
+to the report. A disabled report hands out a shared no-op stage object, so
+instrumented code costs one method call per stage when it is off.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import cProfile
+import json
+import os
+import platform
+import pstats
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+# Functions listed when printing a stage profile
+PROFILE_TOP = 20
+
+MEMORY_MODES = ('tracemalloc', 'rss')
+
+
+def _status_bytes(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _memory(mode):
+    """(current, peak) bytes in the given mode"""
+    if mode == 'tracemalloc':
+        return tracemalloc.get_traced_memory()
+    return _status_bytes('VmRSS:'), _status_bytes('VmHWM:')
+
+
+def _reset_peak(mode):
+    if mode == 'tracemalloc':
+        tracemalloc.reset_peak()
+    else:
+        # Resets the peak resident set size (VmHWM) to the current size
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+
+
+def _rss_supported():
+    return os.access('/proc/self/clear_refs', os.W_OK) and os.path.exists('/proc/self/status')
+
+
+class _NullStage:
+    """Stage handed out by a disabled report: accepts and ignores everything"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """Context manager measuring one stage of a RunReport"""
+
+    def __init__(self, report, name, rows_in):
+        self.report = report
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.children_peak = 0
+
+    def __enter__(self):
+        report = self.report
+        self.parent = report._stack[-1] if report._stack else None
+        if report.memory:
+            current, peak = _memory(report.memory)
+            if self.parent is not None:
+                # The parent's peak so far, before the reset below hides it
+                self.parent.children_peak = max(self.parent.children_peak, peak)
+            _reset_peak(report.memory)
+            self.start_memory = current
+        report._stack.append(self)
+        # Reserve the record's slot so stages are listed in start order
+        self.index = len(report.stages)
+        report.stages.append(None)
+        self.profiler = None
+        if report.profile_stage == self.name:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        report = self.report
+        if self.profiler is not None:
+            self.profiler.disable()
+            report._save_profile(self.name, self.profiler)
+        report._stack.pop()
+
+        record = {'stage': self.name, 'depth': len(report._stack), 'seconds': round(seconds, 4),
+                  'rows_in': self.rows_in, 'rows_out': self.rows_out}
+        if self.rows_in and seconds > 0:
+            record['rows_per_s'] = round(self.rows_in / seconds, 1)
+        if report.memory:
+            peak = max(_memory(report.memory)[1], self.children_peak)
+            record['peak_mb'] = round(max(peak - self.start_memory, 0) / 1e6, 2)
+            if self.parent is not None:
+                self.parent.children_peak = max(self.parent.children_peak, peak)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        report.stages[self.index] = record
+        return False
+
+
+class RunReport:
+    """
+    Collects stage measurements of one run
+
+    Args:
+        name (str): Run name (e.g. the script)
+        enabled (bool): If False, stage() returns a no-op and nothing is
+            recorded
+        memory (str): Peak memory measurement, one of MEMORY_MODES, or
+            None to skip it; 'rss' falls back to None where unsupported
+        profile_stage (str): Name of a stage to run under cProfile
+        profile_file (str): Where to write that stage's stats (default:
+            profile_<stage>.prof)
+    """
+
+    def __init__(self, name='run', enabled=True, memory='rss',
+                 profile_stage=None, profile_file=None):
+        if memory is not None and memory not in MEMORY_MODES:
+            raise ValueError(f"Unknown memory mode '{memory}'; expected one of {MEMORY_MODES}")
+        if memory == 'rss' and not _rss_supported():
+            memory = None
+        self.name = name
+        self.enabled = enabled
+        self.memory = memory if enabled else None
+        self.profile_stage = profile_stage if enabled else None
+        self.profile_file = profile_file
+        self.stages = []
+        self.started = datetime.now()
+        self._stack = []
+        self._start = time.perf_counter()
+        if self.memory == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name, rows_in=None):
+        """
+        Measure the enclosed block as a stage
+
+        Args:
+            name (str): Stage name
+            rows_in (int): Rows the stage consumes (set rows_out on the
+                returned object for the rows it produces)
+
+        Returns:
+            Context manager yielding the stage object
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, rows_in)
+
+    def _save_profile(self, name, profiler):
+        path = self.profile_file or f'profile_{name}.prof'
+        profiler.dump_stats(path)
+        print(f"\nProfile of stage '{name}' (saved to '{path}'):")
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats('cumulative').print_stats(PROFILE_TOP)
+
+    def to_dict(self):
+        """The run report as a JSON-serializable dict"""
+        return {
+            'run': self.name,
+            'started': self.started.isoformat(timespec='seconds'),
+            'total_seconds': round(time.perf_counter() - self._start, 4),
+            'python': platform.python_version(),
+            'memory': self.memory,
+            'profile_stage': self.profile_stage,
+            'stages': [record for record in self.stages if record is not None],
+        }
+
+    def save(self, path):
+        """Write the run report as JSON"""
+        if not self.enabled:
+            return
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+    def print_summary(self):
+        """Print a compact table of the recorded stages"""
+        if not self.enabled:
+            return
+        total = time.perf_counter() - self._start
+        print(f"\nRun timings ({self.name}, {total:.2f}s total):")
+        print(f"  {'stage':24s} {'seconds':>9s} {'share':>6s} {'peak MB':>9s} {'rows in':>12s} {'rows out':>12s}")
+        for record in self.to_dict()['stages']:
+            label = '  ' * record['depth'] + record['stage']
+            peak = f"{record['peak_mb']:9.1f}" if 'peak_mb' in record else f"{'-':>9s}"
+            rows_in = f"{record['rows_in']:,}" if record['rows_in'] is not None else '-'
+            rows_out = f"{record['rows_out']:,}" if record['rows_out'] is not None else '-'
+            print(f"  {label:24s} {record['seconds']:9.3f} {record['seconds'] / total:6.1%} "
+                  f"{peak} {rows_in:>12s} {rows_out:>12s}")
+
+
+# Shared disabled report for code instrumented with an optional report
+DISABLED = RunReport(enabled=False)
@@ -0,0 +1,276 @@
+"""
+Choosing the Number of Clusters
+Evaluates K-Means for a range of K and recommends the number of clusters
+
+The full silhouette score compares every customer with every other one
+(O(n^2) time), which makes the K sweep the slowest step of the analysis
+and infeasible for a million customers. This module offers cheaper
+criteria:
+
+- 'silhouette': silhouette score on repeated stratified samples, reported
+  with a bootstrap confidence interval
+- 'simplified_silhouette': silhouette computed against cluster centroids
+  instead of all points (O(n*K))
+- 'davies_bouldin' and 'calinski_harabasz': centroid-based indices (O(n*K))
+
+Each K is fitted in its own worker process.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, silhouette_score
+
+K_RANGE = range(3, 11)
+RANDOM_SEED = 42
+
+# Criterion -> True if higher values are better
+METRICS = {
+    'silhouette': True,
+    'simplified_silhouette': True,
+    'davies_bouldin': False,
+    'calinski_harabasz': True,
+}
+
+# Customers per silhouette sample and number of samples
+DEFAULT_SAMPLE_SIZE = 2000
+DEFAULT_BOOTSTRAP = 10
+CONFIDENCE_LEVEL = 0.95
+
+
+def stratified_sample(labels, sample_size, rng):
+    """
+    Indices of a sample that keeps each cluster's share of customers
+
+    Args:
+        labels (np.ndarray): Cluster label per customer
+        sample_size (int): Number of customers to draw
+        rng (np.random.Generator): Random generator
+
+    Returns:
+        np.ndarray: Sorted row indices
+    """
+    n = len(labels)
+    if sample_size >= n:
+        return np.arange(n)
+
+    clusters, counts = np.unique(labels, return_counts=True)
+    # Largest-remainder allocation, at least 2 per cluster so that every
+    # cluster in the sample has a defined intra-cluster distance
+    quota = counts * sample_size / n
+    take = np.floor(quota).astype(np.int64)
+    take[np.argsort(take - quota)[:sample_size - take.sum()]] += 1
+    take = np.minimum(np.maximum(take, 2), counts)
+
+    order = np.argsort(labels, kind='stable')
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    picks = [
+        order[start + rng.choice(count, size=k, replace=False)]
+        for start, count, k in zip(starts, counts, take)
+    ]
+    return np.sort(np.concatenate(picks))
+
+
+def sampled_silhouette(X, labels, sample_size=DEFAULT_SAMPLE_SIZE,
+                       n_bootstrap=DEFAULT_BOOTSTRAP, seed=RANDOM_SEED):
+    """
+    Silhouette score estimated on stratified samples
+
+    Args:
+        X (np.ndarray): Scaled features
+        labels (np.ndarray): Cluster label per customer
+        sample_size (int): Customers per sample
+        n_bootstrap (int): Number of independent samples
+        seed (int): Random seed
+
+    Returns:
+        tuple: (mean score, lower and upper bound of the confidence interval)
+    """
+    if sample_size >= len(X):
+        score = silhouette_score(X, labels)
+        return score, score, score
+
+    rng = np.random.default_rng(seed)
+    scores = np.array([
+        silhouette_score(X[idx], labels[idx])
+        for idx in (stratified_sample(labels, sample_size, rng) for _ in range(n_bootstrap))
+    ])
+    tail = (1 - CONFIDENCE_LEVEL) / 2 * 100
+    low, high = np.percentile(scores, [tail, 100 - tail])
+    return scores.mean(), low, high
+
+
+def simplified_silhouette(X, labels, centers):
+    """
+    Silhouette with distances to cluster centroids instead of to all points
+
+    For each customer a is the distance to its own centroid and b the
+    distance to the nearest other centroid; the score is the mean of
+    (b - a) / max(a, b).
+
+    Args:
+        X (np.ndarray): Scaled features
+        labels (np.ndarray): Cluster label per customer
+        centers (np.ndarray): Cluster centroids
+
+    Returns:
+        float: Simplified silhouette score
+    """
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2 keeps the temporaries at n x K
+    squared = (X ** 2).sum(axis=1)[:, None] - 2 * X @ centers.T + (centers ** 2).sum(axis=1)
+    distances = np.sqrt(np.maximum(squared, 0))
+    rows = np.arange(len(X))
+    a = distances[rows, labels]
+    distances[rows, labels] = np.inf
+    b = distances.min(axis=1)
+    denom = np.maximum(a, b)
+    return float(np.mean(np.divide(b - a, denom, out=np.zeros_like(a), where=denom > 0)))
+
+
+def evaluate_k(X, k, metric='silhouette', sample_size=DEFAULT_SAMPLE_SIZE,
+               n_bootstrap=DEFAULT_BOOTSTRAP, seed=RANDOM_SEED):
+    """
+    Fit K-Means with k clusters and score the result
+
+    Args:
+        X (np.ndarray): Scaled features
+        k (int): Number of clusters
+        metric (str): One of METRICS
+        sample_size (int): Customers per silhouette sample
+        n_bootstrap (int): Number of silhouette samples
+        seed (int): Random seed for K-Means and sampling
+
+    Returns:
+        dict: k, inertia, score and (for 'silhouette') ci_low/ci_high
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'; expected one of {tuple(METRICS)}")
+
+    kmeans = KMeans(n_clusters=k, random_state=seed, n_init=10)
+    labels = kmeans.fit_predict(X)
+    result = {'k': k, 'inertia': float(kmeans.inertia_)}
+
+    if metric == 'silhouette':
+        score, low, high = sampled_silhouette(X, labels, sample_size, n_bootstrap, seed)
+        result.update(score=float(score), ci_low=float(low), ci_high=float(high))
+    elif metric == 'simplified_silhouette':
+        result['score'] = simplified_silhouette(X, labels, kmeans.cluster_centers_)
+    elif metric == 'davies_bouldin':
+        result['score'] = float(davies_bouldin_score(X, labels))
+    else:
+        result['score'] = float(calinski_harabasz_score(X, labels))
+    return result
+
+
+_worker_X = None
+
+
+def _init_worker(X):
+    """Receive the feature matrix once per worker instead of once per K"""
+    global _worker_X
+    _worker_X = X
+
+
+def _evaluate_task(task):
+    k, metric, sample_size, n_bootstrap, seed = task
+    return evaluate_k(_worker_X, k, metric, sample_size, n_bootstrap, seed)
+
+
+def select_k(X, k_range=K_RANGE, metric='silhouette', workers=None,
+             sample_size=DEFAULT_SAMPLE_SIZE, n_bootstrap=DEFAULT_BOOTSTRAP,
+             seed=RANDOM_SEED):
+    """
+    Evaluate every K in k_range and recommend the best one
+
+    Args:
+        X (np.ndarray): Scaled features
+        k_range (iterable): Candidate numbers of clusters
+        metric (str): Selection criterion, one of METRICS
+        workers (int): Worker processes (default: one per K, capped at the
+            CPU count); 1 evaluates in this process
+        sample_size (int): Customers per silhouette sample
+        n_bootstrap (int): Number of silhouette samples
+        seed (int): Random seed
+
+    Returns:
+        tuple: (recommended K, list of per-K result dicts in k_range order)
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'; expected one of {tuple(METRICS)}")
+
+    k_values = list(k_range)
+    if workers is None:
+        workers = min(len(k_values), os.cpu_count() or 1)
+
+    tasks = [(k, metric, sample_size, n_bootstrap, seed) for k in k_values]
+    if workers <= 1:
+        results = [evaluate_k(X, *task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(np.asarray(X),)) as pool:
+            results = list(pool.map(_evaluate_task, tasks))
+
+    scores = np.array([result['score'] for result in results])
+    best = np.argmax(scores) if METRICS[metric] else np.argmin(scores)
+    return k_values[best], results
+
+
+def print_k_results(results, metric):
+    """Print the per-K evaluation table"""
+    print("\nCluster Evaluation Metrics:")
+    for result in results:
+        line = f"  K={result['k']}: Inertia={result['inertia']:.2f}, {metric}={result['score']:.4f}"
+        if 'ci_low' in result:
+            line += f" ({CONFIDENCE_LEVEL:.0%} CI {result['ci_low']:.4f}-{result['ci_high']:.4f})"
+        print(line)
+
+
+def main():
+    """Main execution function"""
+    from sklearn.preprocessing import StandardScaler
+    from storage import read_table
+
+    parser = argparse.ArgumentParser(
+        description='Recommend the number of K-Means clusters for RFM metrics'
+    )
+    parser.add_argument('--input', type=str, default='rfm_analysis_results.csv',
+                        help='File with recency/frequency/monetary columns '
+                             '(default: rfm_analysis_results.csv)')
+    parser.add_argument('--metric', type=str, default='silhouette', choices=list(METRICS),
+                        help='Selection criterion (default: silhouette)')
+    parser.add_argument('--k-min', type=int, default=K_RANGE.start,
+                        help=f'Smallest K (default: {K_RANGE.start})')
+    parser.add_argument('--k-max', type=int, default=K_RANGE.stop - 1,
+                        help=f'Largest K (default: {K_RANGE.stop - 1})')
+    parser.add_argument('--sample-size', type=int, default=DEFAULT_SAMPLE_SIZE,
+                        help=f'Customers per silhouette sample (default: {DEFAULT_SAMPLE_SIZE})')
+    parser.add_argument('--bootstrap', type=int, default=DEFAULT_BOOTSTRAP,
+                        help=f'Number of silhouette samples (default: {DEFAULT_BOOTSTRAP})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: one per K, up to the CPU count)')
+    args = parser.parse_args()
+
+    rfm_df = read_table(args.input, columns=['recency', 'frequency', 'monetary'])
+    X_scaled = StandardScaler().fit_transform(rfm_df.to_numpy(dtype=float))
+
+    print("="*70)
+    print("K SELECTION")
+    print("="*70)
+    print(f"\nCustomers: {len(X_scaled):,}  Criterion: {args.metric}")
+
+    best_k, results = select_k(
+        X_scaled, range(args.k_min, args.k_max + 1), metric=args.metric,
+        workers=args.workers, sample_size=args.sample_size, n_bootstrap=args.bootstrap
+    )
+    print_k_results(results, args.metric)
+    print(f"\n✓ Recommended number of clusters: {best_k}")
+
+
+if __name__ == "__main__":
+    main()
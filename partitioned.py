@@ -0,0 +1,308 @@
+"""
+Partitioned RFM Segmentation
+Runs the full segmentation pipeline per store, region or other partition in one invocation
+
+Transactions are read once, converted to the compact schema (integer
+customer codes, day numbers, amounts in cents) and sorted by partition and
+customer, so every partition is one contiguous row range. The columns are
+saved as .npy files that worker processes memory-map in their
+initializer: a task is just a list of row ranges, and no frames are
+pickled to the workers.
+
+Each partition runs the same pipeline as script_2.py on its own
+transactions: RFM (analysis date = the day after the partition's last
+transaction unless one date is given), quintile scoring, scaling,
+K-Means and segment naming. Partitions smaller than min_batch_rows
+transactions are batched into one task so that scheduling overhead does
+not dominate, and tasks are submitted largest first. Partitions with too
+few customers to cluster are reported instead of failing the run.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+from clustering import RANDOM_SEED, cluster_rfm
+from compact_schema import CustomerDictionary, compute_rfm_compact, to_cents, to_days
+from pipeline import cluster_summary_table, name_clusters, segment_summary_table
+from rfm import score_rfm
+from storage import RFM_COLUMNS, read_transactions, write_table
+
+N_CLUSTERS = 8
+
+# Partitions with fewer transactions share a task with other small ones
+DEFAULT_MIN_BATCH_ROWS = 200_000
+
+# Partitions with fewer customers are skipped (too few to cluster and score)
+MIN_PARTITION_CUSTOMERS = 50
+
+_COLUMNS = ('customer_code', 'transaction_day', 'amount_cents')
+
+_worker_columns = None
+
+
+def prepare_partitions(transactions, partition_column, data_dir):
+    """
+    Sort compact transactions by partition and customer and save the columns
+
+    Args:
+        transactions (pd.DataFrame): Transactions with RFM_COLUMNS and the
+            partition column
+        partition_column (str): Column identifying the partition
+        data_dir (str): Directory for the .npy column files
+
+    Returns:
+        tuple: (partitions DataFrame with partition, start, end and rows,
+            CustomerDictionary of the customer codes)
+    """
+    customers = CustomerDictionary.from_series(transactions['customer_id'])
+    codes = customers.encode(transactions['customer_id']).astype(np.int32)
+    keys = transactions[partition_column]
+    if not isinstance(keys.dtype, pd.CategoricalDtype):
+        keys = keys.astype('category')
+    labels = keys.cat.categories
+    partition_codes = keys.cat.codes.to_numpy()
+    if (partition_codes < 0).any():
+        raise ValueError(f"Missing values in partition column '{partition_column}'")
+
+    order = np.lexsort((codes, partition_codes))
+    np.save(os.path.join(data_dir, 'customer_code.npy'), codes[order])
+    np.save(os.path.join(data_dir, 'transaction_day.npy'),
+            to_days(transactions['transaction_date'].to_numpy())[order])
+    np.save(os.path.join(data_dir, 'amount_cents.npy'),
+            to_cents(transactions['total_amount'].to_numpy(), np.int64)[order])
+
+    rows = np.bincount(partition_codes, minlength=len(labels))
+    ends = np.cumsum(rows)
+    partitions = pd.DataFrame({'partition': labels, 'start': ends - rows, 'end': ends, 'rows': rows})
+    return partitions[partitions['rows'] > 0].reset_index(drop=True), customers
+
+
+def batch_partitions(partitions, min_batch_rows=DEFAULT_MIN_BATCH_ROWS):
+    """
+    Group partitions into tasks, largest first
+
+    Partitions of at least min_batch_rows transactions are tasks of their
+    own; smaller ones are packed together until a task reaches that size.
+
+    Args:
+        partitions (pd.DataFrame): Output of prepare_partitions
+        min_batch_rows (int): Target transactions per task
+
+    Returns:
+        list: Tasks, each a list of (partition index, start, end)
+    """
+    tasks, batch, batch_rows = [], [], 0
+    for index in np.argsort(-partitions['rows'].to_numpy(), kind='stable'):
+        part = partitions.iloc[index]
+        entry = (int(index), int(part['start']), int(part['end']))
+        if part['rows'] >= min_batch_rows:
+            tasks.append([entry])
+            continue
+        batch.append(entry)
+        batch_rows += int(part['rows'])
+        if batch_rows >= min_batch_rows:
+            tasks.append(batch)
+            batch, batch_rows = [], 0
+    if batch:
+        tasks.append(batch)
+    return tasks
+
+
+def segment_partition(columns, start, end, n_clusters=N_CLUSTERS, analysis_day=None,
+                      random_state=RANDOM_SEED):
+    """
+    RFM, scores, clusters and segment names of one partition
+
+    Args:
+        columns (dict): Sorted compact columns (arrays or memmaps)
+        start, end (int): Row range of the partition
+        n_clusters (int): Number of K-Means clusters
+        analysis_day (int): Reference day number (default: the day after
+            the partition's last transaction)
+        random_state (int): K-Means seed
+
+    Returns:
+        pd.DataFrame: Segmented RFM table with global customer_code
+    """
+    codes = np.asarray(columns['customer_code'][start:end])
+    # Rows are sorted by customer within the partition: local codes are
+    # the run index, in global code order
+    local = np.cumsum(np.r_[0, codes[1:] != codes[:-1]])
+    customer_codes = codes[np.r_[True, codes[1:] != codes[:-1]]]
+    compact = compute_rfm_compact(pd.DataFrame({
+        'customer_code': local,
+        'transaction_day': np.asarray(columns['transaction_day'][start:end]),
+        'amount_cents': np.asarray(columns['amount_cents'][start:end]),
+    }), len(customer_codes), analysis_day)
+
+    rfm_df = pd.DataFrame({
+        'customer_code': customer_codes,
+        'recency': compact['recency'].to_numpy(dtype=np.int64),
+        'frequency': compact['frequency'].to_numpy(dtype=np.int64),
+        'monetary': compact['monetary_cents'].to_numpy() / 100,
+    })
+    rfm_df = score_rfm(rfm_df)
+    rfm_df['cluster'] = cluster_rfm(rfm_df, n_clusters, random_state=random_state)['labels']
+    # cluster_summary_table counts customers in a customer_id column
+    named = rfm_df.rename(columns={'customer_code': 'customer_id'})
+    rfm_df['segment'] = rfm_df['cluster'].map(name_clusters(named, cluster_summary_table(named)))
+    return rfm_df
+
+
+def _init_worker(data_dir, single_threaded=False):
+    """Memory-map the sorted columns once per worker"""
+    global _worker_columns
+    _worker_columns = {name: np.load(os.path.join(data_dir, f'{name}.npy'), mmap_mode='r')
+                       for name in _COLUMNS}
+    if single_threaded:
+        # One worker process per core: keep BLAS and OpenMP single-threaded
+        threadpool_limits(1)
+
+
+def _run_task(task):
+    """Segment every partition of a task; returns (index, result or error) pairs"""
+    entries, n_clusters, analysis_day, random_state = task
+    results = []
+    for index, start, end in entries:
+        codes = _worker_columns['customer_code'][start:end]
+        customers = 1 + int(np.count_nonzero(codes[1:] != codes[:-1]))
+        if customers < max(MIN_PARTITION_CUSTOMERS, n_clusters):
+            results.append((index, f'{customers} customers'))
+            continue
+        try:
+            results.append((index, segment_partition(_worker_columns, start, end, n_clusters,
+                                                     analysis_day, random_state)))
+        except ValueError as e:
+            results.append((index, str(e)))
+    return results
+
+
+def run_partitioned(transactions, partition_column, n_clusters=N_CLUSTERS, workers=None,
+                    min_batch_rows=DEFAULT_MIN_BATCH_ROWS, analysis_date=None,
+                    random_state=RANDOM_SEED, workdir=None, verbose=True):
+    """
+    Segment every partition of the transactions
+
+    Args:
+        transactions (pd.DataFrame): Transactions with RFM_COLUMNS and the
+            partition column
+        partition_column (str): Column identifying the partition (e.g. a
+            store or region ID)
+        n_clusters (int): K-Means clusters per partition
+        workers (int): Worker processes (default: CPU count); 1 runs in
+            this process
+        min_batch_rows (int): Target transactions per task for batching
+            small partitions
+        analysis_date (datetime): Common reference date (default: per
+            partition, the day after its last transaction)
+        random_state (int): K-Means seed
+        workdir (str): Directory for the temporary column files
+        verbose (bool): Print progress
+
+    Returns:
+        dict: 'results' (combined segmented table with the partition
+            column), 'summary' (per-partition segment summaries) and
+            'skipped' (partition -> reason)
+    """
+    workers = workers or os.cpu_count() or 1
+    analysis_day = None if analysis_date is None else int(to_days([pd.Timestamp(analysis_date)])[0])
+
+    with tempfile.TemporaryDirectory(dir=workdir) as data_dir:
+        partitions, customers = prepare_partitions(transactions, partition_column, data_dir)
+        tasks = [(entries, n_clusters, analysis_day, random_state)
+                 for entries in batch_partitions(partitions, min_batch_rows)]
+        if verbose:
+            print(f"  {len(partitions)} partitions in {len(tasks)} tasks across {workers} workers")
+
+        outcomes = []
+        if workers <= 1:
+            _init_worker(data_dir)
+            for task in tasks:
+                outcomes.extend(_run_task(task))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(data_dir, True)) as pool:
+                for future in as_completed([pool.submit(_run_task, task) for task in tasks]):
+                    outcomes.extend(future.result())
+
+    labels = partitions['partition']
+    frames, summaries, skipped = [], [], {}
+    for index, outcome in sorted(outcomes, key=lambda item: item[0]):
+        if isinstance(outcome, str):
+            skipped[labels[index]] = outcome
+            continue
+        outcome.insert(0, partition_column, labels[index])
+        frames.append(outcome)
+        summary = segment_summary_table(outcome.rename(columns={'customer_code': 'customer_id'}))
+        summaries.append(summary.reset_index().assign(**{partition_column: labels[index]}))
+
+    results = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if len(results):
+        results.insert(1, 'customer_id', customers.decode(results.pop('customer_code')))
+        results[partition_column] = pd.Categorical(results[partition_column], categories=labels)
+        results['segment'] = results['segment'].astype('category')
+    summary = pd.concat(summaries, ignore_index=True) if summaries else pd.DataFrame()
+    if len(summary):
+        summary = summary[[partition_column] + [c for c in summary.columns if c != partition_column]]
+    return {'results': results, 'summary': summary, 'skipped': skipped}
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Run the RFM segmentation separately for every store/region partition'
+    )
+    parser.add_argument('--input', type=str, default='ecommerce_transactions.csv',
+                        help='Transaction file (default: ecommerce_transactions.csv)')
+    parser.add_argument('--partition-column', type=str, required=True,
+                        help='Column identifying the partition, e.g. store_id or region')
+    parser.add_argument('--clusters', type=int, default=N_CLUSTERS,
+                        help=f'K-Means clusters per partition (default: {N_CLUSTERS})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--min-batch-rows', type=int, default=DEFAULT_MIN_BATCH_ROWS,
+                        help=f'Transactions per task when batching small partitions '
+                             f'(default: {DEFAULT_MIN_BATCH_ROWS:,})')
+    parser.add_argument('--analysis-date', type=str, default=None,
+                        help='Common analysis date, YYYY-MM-DD (default: per partition)')
+    parser.add_argument('--output', type=str, default='partitioned_results.csv',
+                        help='Combined results file (default: partitioned_results.csv)')
+    parser.add_argument('--summary', type=str, default='partition_summary.csv',
+                        help='Per-partition segment summaries (default: partition_summary.csv)')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("PARTITIONED RFM SEGMENTATION")
+    print("="*70)
+
+    start = time.perf_counter()
+    transactions = read_transactions(args.input, columns=RFM_COLUMNS + [args.partition_column])
+    print(f"\nLoaded {len(transactions):,} transactions in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    run = run_partitioned(transactions, args.partition_column, args.clusters, args.workers,
+                          args.min_batch_rows, args.analysis_date)
+    segmented = run['results'][args.partition_column].nunique() if len(run['results']) else 0
+    print(f"  Segmented {segmented} partitions ({len(run['results']):,} customer rows) "
+          f"in {time.perf_counter() - start:.2f}s")
+    for partition, reason in run['skipped'].items():
+        print(f"  Skipped partition {partition}: {reason}")
+
+    write_table(run['results'], args.output)
+    run['summary'].to_csv(args.summary, index=False)
+    print(f"\n✓ {args.output} - Combined results of all partitions")
+    print(f"✓ {args.summary} - Segment summary per partition")
+
+
+if __name__ == "__main__":
+    main()
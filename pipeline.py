@@ -0,0 +1,394 @@
+"""
+Staged RFM Pipeline
+The generate -> RFM -> score -> K selection -> cluster -> segment stages with caching
+
+Each stage is a function that takes the StageCache and the Stage outputs
+it depends on, and returns its own Stage. Cache keys chain through the
+stages, so a run only recomputes what is downstream of a change:
+
+    generate    data_generation parameters         -> transactions file
+    rfm         transactions file fingerprint,     -> rfm_df, analysis date
+                analysis date, chunk size / state
+    scores      rfm, scoring backend               -> scored rfm_df
+    k_select    rfm, K range, criterion, seed      -> recommended K
+    clusters    rfm, K, engine, random_state       -> labels, scaler, model
+    stability   rfm, clusters, refits, resampling  -> per-cluster Jaccard, ARI,
+                                                      per-customer confidence
+    segments    scores, clusters, naming rules     -> segments and summaries
+    cube        transactions file, segments        -> revenue cube directory
+
+The segments stage key includes the source of assign_segment_name and the
+rules dict, so editing the naming rules reuses the cached RFM table and
+fitted clusters.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import hashlib
+import inspect
+import json
+from datetime import timedelta
+
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from cluster_stability import DEFAULT_FRACTION, stability_analysis
+from clustering import FEATURES, RANDOM_SEED, cluster_rfm
+from compact_schema import compute_rfm_compact, from_days, read_compact_transactions, rfm_table, to_days
+from k_selection import K_RANGE, select_k
+from rfm import aggregate_rfm_chunked, compute_rfm, default_analysis_date, finalize_rfm, score_rfm
+from revenue_cube import build_cube, save_cube
+from rfm_rules import DEFAULT_RULES, assign_rule_segments
+from rfm_store import load_state
+from sqlite_store import compute_rfm_sql
+from stage_cache import fingerprint
+from storage import RFM_COLUMNS, compact_dtypes, detect_format, read_table, read_transactions
+from transaction_index import build_transaction_index, index_is_current
+
+# Bump when a stage's computation changes so older cached outputs are not reused
+STAGE_VERSION = 1
+
+SEGMENTATION_MODES = ('kmeans', 'rules')
+
+
+def assign_segment_name(row, means):
+    """
+    Assign strategic segment names based on cluster characteristics
+
+    Args:
+        row (pd.Series): Cluster averages avg_recency, avg_frequency,
+            avg_monetary
+        means (tuple): Overall mean recency, frequency and monetary
+
+    Returns:
+        str: Segment name
+    """
+    r, f, m = row['avg_recency'], row['avg_frequency'], row['avg_monetary']
+    r_mean, f_mean, m_mean = means
+
+    if r < r_mean * 0.5 and f > f_mean * 1.5 and m > m_mean * 1.5:
+        return 'Champions'
+    elif r < r_mean and f > f_mean and m > m_mean:
+        return 'Loyal Customers'
+    elif r < r_mean * 0.7 and f < f_mean * 0.5:
+        return 'New Customers'
+    elif r < r_mean and f > f_mean * 0.8:
+        return 'Potential Loyalists'
+    elif r > r_mean * 1.5 and f > f_mean and m > m_mean:
+        return 'At Risk'
+    elif r > r_mean * 2 and f > f_mean * 1.2:
+        return 'Cant Lose Them'
+    elif r > r_mean * 1.5 and m < m_mean:
+        return 'Hibernating'
+    else:
+        return 'Need Attention'
+
+
+def cluster_summary_table(rfm_df):
+    """
+    Per-cluster averages, customer and revenue shares
+
+    Args:
+        rfm_df (pd.DataFrame): RFM table with a cluster column
+
+    Returns:
+        pd.DataFrame: Indexed by cluster
+    """
+    cluster_summary = rfm_df.groupby('cluster').agg({
+        'recency': 'mean',
+        'frequency': 'mean',
+        'monetary': 'mean',
+        'customer_id': 'count'
+    }).round(2)
+
+    cluster_summary.columns = ['avg_recency', 'avg_frequency', 'avg_monetary', 'customer_count']
+    cluster_summary['pct_customers'] = (cluster_summary['customer_count'] / len(rfm_df) * 100).round(2)
+    cluster_summary['total_revenue'] = rfm_df.groupby('cluster')['monetary'].sum().round(2)
+    cluster_summary['pct_revenue'] = (cluster_summary['total_revenue'] / rfm_df['monetary'].sum() * 100).round(2)
+    return cluster_summary
+
+
+def name_clusters(rfm_df, cluster_summary):
+    """
+    Segment name of every cluster
+
+    Args:
+        rfm_df (pd.DataFrame): RFM table (for the overall means)
+        cluster_summary (pd.DataFrame): Output of cluster_summary_table
+
+    Returns:
+        dict: Cluster ID -> segment name
+    """
+    means = (rfm_df['recency'].mean(), rfm_df['frequency'].mean(), rfm_df['monetary'].mean())
+    return {cluster_id: assign_segment_name(cluster_summary.loc[cluster_id], means)
+            for cluster_id in cluster_summary.index}
+
+
+def segment_summary_table(rfm_df):
+    """
+    Per-segment averages, customer and revenue shares, by revenue share
+
+    Args:
+        rfm_df (pd.DataFrame): RFM table with a segment column
+
+    Returns:
+        pd.DataFrame: Indexed by segment
+    """
+    segment_summary = rfm_df.groupby('segment', observed=True).agg({
+        'recency': 'mean',
+        'frequency': 'mean',
+        'monetary': 'mean',
+        'customer_id': 'count'
+    }).round(2)
+
+    segment_summary.columns = ['avg_recency_days', 'avg_frequency', 'avg_monetary_value', 'customer_count']
+    segment_summary['pct_customers'] = (segment_summary['customer_count'] / len(rfm_df) * 100).round(2)
+    segment_summary['total_revenue'] = rfm_df.groupby('segment', observed=True)['monetary'].sum().round(2)
+    segment_summary['pct_revenue'] = (segment_summary['total_revenue'] / rfm_df['monetary'].sum() * 100).round(2)
+    return segment_summary.sort_values('pct_revenue', ascending=False)
+
+
+def _source_hash(*functions):
+    digest = hashlib.sha1()
+    for function in functions:
+        digest.update(inspect.getsource(function).encode())
+    return digest.hexdigest()
+
+
+# -- stages -------------------------------------------------------------------
+
+def stage_generate(cache, output_file, num_customers, seed, start_date=None, end_date=None):
+    """
+    Synthetic transaction file (data_generation.py)
+
+    Returns:
+        Stage: Fingerprint of the written file
+    """
+    from data_generation import END_DATE, START_DATE, generate_transactions
+    start_date = start_date or START_DATE
+    end_date = end_date or END_DATE
+    return cache.run_file(
+        'generate', output_file,
+        lambda: generate_transactions(num_customers, start_date, end_date, output_file,
+                                      seed=seed, verbose=False),
+        num_customers=num_customers, seed=seed, start_date=start_date, end_date=end_date,
+        version=STAGE_VERSION,
+    )
+
+
+def stage_rfm(cache, transactions_file, analysis_date=None, chunk_size=None, state_file=None,
+              compact=False, index_dir=None, index_columns=RFM_COLUMNS):
+    """
+    Recency, frequency and monetary per customer
+
+    A SQLite transactions_file (.db / .sqlite) is aggregated inside the
+    database (sqlite_store.py) unless chunk_size is set. With index_dir
+    the file is also sorted by customer into a transaction_index.py history
+    index; for CSV / Parquet / Feather input the metrics are reduced from
+    the same sorted columns. The index is rebuilt whenever it is missing or
+    older than the file, also on a cache hit. It needs the whole history in
+    memory, so it is skipped with state_file or chunk_size. compact loads
+    and aggregates the compact schema when no other mode applies; with
+    any mode it returns rfm_df in compact types.
+
+    Args:
+        cache (StageCache): Stage cache
+        transactions_file (str): Transaction file
+        analysis_date (datetime): Reference date (default: the day after
+            the last transaction)
+        chunk_size (int): Aggregate the file in chunks of this many rows
+        state_file (str): Derive the metrics from an rfm_store.py state
+            instead of the transaction history
+        compact (bool): Return rfm_df in compact types; without SQLite
+            input or index_dir, also load the transactions in the compact
+            schema and aggregate integer codes, days and cents
+            (compact_schema.py)
+        index_dir (str): Directory of the per-customer transaction index
+        index_columns (list): Columns stored in the index (all if None)
+
+    Returns:
+        Stage: dict with 'rfm_df' and 'analysis_date'
+    """
+    if state_file or chunk_size:
+        index_dir = None
+    if state_file:
+        source = {'state': fingerprint(state_file), 'meta': fingerprint(f"{state_file}.meta.json")}
+    else:
+        source = fingerprint(transactions_file)
+    # The stored columns are part of the index identity, so changing them rebuilds it
+    index_source = {**fingerprint(transactions_file), 'columns': index_columns} if index_dir else None
+
+    def compute():
+        if state_file or chunk_size:
+            if state_file:
+                state, _ = load_state(state_file)
+            else:
+                state = aggregate_rfm_chunked(transactions_file, chunksize=chunk_size)
+            date = analysis_date or state['last_purchase'].max() + timedelta(days=1)
+            rfm_df = finalize_rfm(state, date)
+        elif detect_format(transactions_file) == 'sqlite':
+            # Grouped query inside SQLite: one row per customer comes back
+            rfm_df, date = compute_rfm_sql(transactions_file, analysis_date)
+        elif index_dir:
+            # One customer sort serves both the history index and the RFM reductions
+            index = build_transaction_index(read_table(transactions_file, columns=index_columns),
+                                            index_dir, source=index_source)
+            date = analysis_date or index.default_analysis_date()
+            rfm_df = index.rfm(date)
+        elif compact:
+            transactions, customers = read_compact_transactions(transactions_file, columns=RFM_COLUMNS)
+            if analysis_date:
+                day = int(to_days([analysis_date])[0])
+            else:
+                day = int(transactions['transaction_day'].max()) + 1
+            rfm_df = rfm_table(compute_rfm_compact(transactions, len(customers), day), customers)
+            date = analysis_date or from_days([day])[0]
+        else:
+            transactions = read_transactions(transactions_file, columns=RFM_COLUMNS)
+            date = analysis_date or default_analysis_date(transactions)
+            rfm_df = compute_rfm(transactions, date)
+        if compact:
+            rfm_df = compact_dtypes(rfm_df)
+        return {'rfm_df': rfm_df, 'analysis_date': pd.Timestamp(date)}
+
+    stage = cache.run('rfm', compute, source=source, analysis_date=analysis_date,
+                      chunk_size=chunk_size, compact=compact, indexed=bool(index_dir),
+                      version=STAGE_VERSION)
+    if index_dir and not index_is_current(index_dir, index_source):
+        # Metrics came from the cache or another aggregation path: index separately
+        build_transaction_index(read_table(transactions_file, columns=index_columns),
+                                index_dir, source=index_source)
+    return stage
+
+
+def stage_scores(cache, rfm, backend='qcut', compact=False):
+    """
+    1-5 R/F/M scores (score_rfm)
+
+    With compact the scores keep the compact integer types
+    (storage.compact_dtypes) instead of int64.
+
+    Returns:
+        Stage: Scored rfm_df
+    """
+    def compute():
+        scored = score_rfm(rfm.value['rfm_df'], backend=backend)
+        return compact_dtypes(scored) if compact else scored
+
+    return cache.run('scores', compute, rfm=rfm, backend=backend, compact=compact,
+                     version=STAGE_VERSION)
+
+
+def stage_k_selection(cache, rfm, k_range=K_RANGE, metric='silhouette', random_state=RANDOM_SEED):
+    """
+    Recommended number of clusters (k_selection.py)
+
+    Returns:
+        Stage: dict with 'best_k' and per-K 'results'
+    """
+    def compute():
+        X_scaled = StandardScaler().fit_transform(rfm.value['rfm_df'][FEATURES].values)
+        best_k, results = select_k(X_scaled, k_range, metric=metric, seed=random_state)
+        return {'best_k': best_k, 'results': results}
+
+    return cache.run('k_select', compute, rfm=rfm, k_range=k_range, metric=metric,
+                     random_state=random_state, version=STAGE_VERSION)
+
+
+def stage_clusters(cache, rfm, n_clusters, engine='kmeans', random_state=RANDOM_SEED):
+    """
+    K-Means clustering of the scaled RFM metrics (clustering.py)
+
+    Returns:
+        Stage: cluster_rfm result (labels, model, scaler, inertia, history)
+    """
+    return cache.run(
+        'clusters',
+        lambda: cluster_rfm(rfm.value['rfm_df'], n_clusters, engine=engine, random_state=random_state),
+        rfm=rfm, n_clusters=n_clusters, engine=engine, random_state=random_state,
+        version=STAGE_VERSION,
+    )
+
+
+def stage_stability(cache, rfm, clusters, n_replicates, method='bootstrap', fraction=DEFAULT_FRACTION,
+                    random_state=RANDOM_SEED, workers=None):
+    """
+    Bootstrap stability of the fitted clusters (cluster_stability.py)
+
+    The result does not depend on the number of workers, so workers is
+    not part of the cache key.
+
+    Returns:
+        Stage: stability_analysis result
+    """
+    def compute():
+        X_scaled = clusters.value['scaler'].transform(rfm.value['rfm_df'][FEATURES].to_numpy())
+        return stability_analysis(X_scaled, clusters.value['labels'], n_replicates, method, fraction,
+                                  workers=workers, seed=random_state)
+
+    return cache.run('stability', compute, rfm=rfm, clusters=clusters, n_replicates=n_replicates,
+                     method=method, fraction=fraction, random_state=random_state,
+                     version=STAGE_VERSION)
+
+
+def stage_segments(cache, scores, clusters=None, mode='kmeans', rules=None, compact=False):
+    """
+    Segment names and summary tables
+
+    Args:
+        cache (StageCache): Stage cache
+        scores (Stage): Output of stage_scores
+        clusters (Stage): Output of stage_clusters (for mode 'kmeans')
+        mode (str): 'kmeans' names clusters with assign_segment_name;
+            'rules' maps scores through rfm_rules
+        rules (dict): Rules for mode 'rules' (default: DEFAULT_RULES)
+        compact (bool): Keep cluster as int8 and segment as a categorical
+
+    Returns:
+        Stage: dict with 'rfm_df' (with segment, and cluster for 'kmeans'),
+            'segment_summary', 'cluster_summary' and 'segment_mapping'
+            (None for 'rules')
+    """
+    if mode not in SEGMENTATION_MODES:
+        raise ValueError(f"Unknown segmentation mode '{mode}'; expected one of {SEGMENTATION_MODES}")
+    rules = rules or DEFAULT_RULES
+
+    def compute():
+        rfm_df = scores.value.copy()
+        cluster_summary = segment_mapping = None
+        if mode == 'kmeans':
+            rfm_df['cluster'] = clusters.value['labels']
+            cluster_summary = cluster_summary_table(rfm_df)
+            segment_mapping = name_clusters(rfm_df, cluster_summary)
+            rfm_df['segment'] = rfm_df['cluster'].map(segment_mapping)
+        else:
+            rfm_df['segment'] = assign_rule_segments(rfm_df, rules)
+        if compact:
+            rfm_df = compact_dtypes(rfm_df)
+        return {'rfm_df': rfm_df, 'segment_summary': segment_summary_table(rfm_df),
+                'cluster_summary': cluster_summary, 'segment_mapping': segment_mapping}
+
+    if mode == 'kmeans':
+        naming = _source_hash(assign_segment_name, name_clusters, cluster_summary_table)
+    else:
+        naming = hashlib.sha1(json.dumps(rules, sort_keys=True).encode()).hexdigest()
+    return cache.run('segments', compute, scores=scores,
+                     clusters=clusters if mode == 'kmeans' else None, mode=mode,
+                     naming=naming, summary=_source_hash(segment_summary_table),
+                     compact=compact, version=STAGE_VERSION)
+
+
+def stage_cube(cache, transactions_file, segments, cube_dir):
+    """
+    Segment x category x month revenue cube (revenue_cube.py)
+
+    Returns:
+        Stage: Fingerprint of the written cube directory
+    """
+    def compute():
+        cube = build_cube(transactions_file, segments.value['rfm_df'][['customer_id', 'segment']])
+        save_cube(cube, cube_dir, source=transactions_file)
+
+    return cache.run_file('cube', cube_dir, compute, source=fingerprint(transactions_file),
+                          segments=segments, version=STAGE_VERSION)
@@ -0,0 +1,325 @@
+"""
+Mergeable Quantile Sketches for RFM Scoring
+Assigns R/F/M quintile scores when the RFM table is split across shards
+
+Each shard summarizes its recency, frequency and monetary columns in a
+QuantileSketch: a histogram over fixed buckets. Sketches from different
+shards merge by adding bucket counts, and quintile cut points come from
+the merged counts and are applied with np.searchsorted. No shard needs the
+full column or a global sort.
+
+Integer metrics (recency, frequency) use one bucket per value, so their
+counts are exact. Monetary uses logarithmic buckets whose representative
+value is within a configurable relative error of every value in the bucket.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+RFM_METRICS = ('recency', 'frequency', 'monetary')
+
+# Relative accuracy of the monetary sketch (1% by default)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+
+class QuantileSketch:
+    """
+    Fixed-bucket histogram sketch that can be merged across shards
+
+    With relative_accuracy=None values must be non-negative integers and
+    each value gets its own bucket. Otherwise values must be positive and
+    bucket i covers (gamma**(i-1), gamma**i] with
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy).
+    """
+
+    def __init__(self, relative_accuracy=None):
+        self.relative_accuracy = relative_accuracy
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.offset = 0
+        if relative_accuracy is not None:
+            if not 0 < relative_accuracy < 1:
+                raise ValueError("relative_accuracy must be between 0 and 1")
+            self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+            self._log_gamma = np.log(self._gamma)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def bucket_index(self, values):
+        """Bucket of each value"""
+        values = np.asarray(values)
+        if self.relative_accuracy is None:
+            if len(values) and values.min() < 0:
+                raise ValueError("integer sketch requires non-negative values")
+            return values.astype(np.int64)
+        if len(values) and values.min() <= 0:
+            raise ValueError("logarithmic sketch requires positive values")
+        return np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+
+    def bucket_value(self, index):
+        """Representative value of bucket(s)"""
+        index = np.asarray(index)
+        if self.relative_accuracy is None:
+            return index.astype(float)
+        return 2 * self._gamma ** index / (self._gamma + 1)
+
+    def _add_counts(self, counts, offset):
+        if len(counts) == 0:
+            return
+        if len(self.counts) == 0:
+            self.counts, self.offset = counts.astype(np.int64).copy(), offset
+            return
+        lo = min(self.offset, offset)
+        hi = max(self.offset + len(self.counts), offset + len(counts))
+        merged = np.zeros(hi - lo, dtype=np.int64)
+        merged[self.offset - lo:self.offset - lo + len(self.counts)] += self.counts
+        merged[offset - lo:offset - lo + len(counts)] += counts
+        self.counts, self.offset = merged, lo
+
+    def update(self, values):
+        """
+        Add values to the sketch
+
+        Args:
+            values (array-like): Values of one metric
+        """
+        index = self.bucket_index(values)
+        if len(index) == 0:
+            return
+        lo = int(index.min())
+        self._add_counts(np.bincount(index - lo), lo)
+
+    def merge(self, other):
+        """
+        Add the counts of another sketch built with the same accuracy
+
+        Args:
+            other (QuantileSketch): Sketch of a disjoint set of customers
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("cannot merge sketches with different accuracy")
+        self._add_counts(other.counts, other.offset)
+
+    def rank_before(self, index):
+        """Number of values in buckets strictly below each bucket"""
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+        position = np.clip(np.asarray(index) - self.offset, 0, len(self.counts))
+        return cumulative[position]
+
+    def bucket_count(self, index):
+        """Number of values in each bucket"""
+        position = np.asarray(index) - self.offset
+        inside = (position >= 0) & (position < len(self.counts))
+        if len(self.counts) == 0:
+            return np.zeros(position.shape, dtype=np.int64)
+        return np.where(inside, self.counts[np.clip(position, 0, len(self.counts) - 1)], 0)
+
+    def quantile(self, q):
+        """
+        Quantiles with the linear interpolation used by pandas/NumPy
+
+        Args:
+            q (array-like): Quantile levels in [0, 1]
+
+        Returns:
+            np.ndarray: Estimated quantiles (exact for integer sketches)
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        n = self.count
+        if n == 0:
+            return np.full(len(q), np.nan)
+        position = q * (n - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, n - 1)
+        cumulative = np.cumsum(self.counts)
+        lower_value = self.bucket_value(np.searchsorted(cumulative, lower, side='right') + self.offset)
+        upper_value = self.bucket_value(np.searchsorted(cumulative, upper, side='right') + self.offset)
+        return lower_value + (position - lower) * (upper_value - lower_value)
+
+
+def build_sketches(rfm_df, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """
+    Sketch the recency, frequency and monetary columns of one shard
+
+    Args:
+        rfm_df (pd.DataFrame): RFM metrics with recency, frequency, monetary
+        relative_accuracy (float): Relative accuracy of the monetary sketch
+
+    Returns:
+        dict: Metric name -> QuantileSketch
+    """
+    sketches = {
+        'recency': QuantileSketch(),
+        'frequency': QuantileSketch(),
+        'monetary': QuantileSketch(relative_accuracy),
+    }
+    for metric, sketch in sketches.items():
+        sketch.update(rfm_df[metric].to_numpy())
+    return sketches
+
+
+def merge_sketches(sketch_sets):
+    """
+    Merge per-shard sketches into global sketches
+
+    Args:
+        sketch_sets (list): Dicts returned by build_sketches
+
+    Returns:
+        dict: Metric name -> merged QuantileSketch
+    """
+    merged = {}
+    for sketches in sketch_sets:
+        for metric, sketch in sketches.items():
+            if metric not in merged:
+                merged[metric] = QuantileSketch(sketch.relative_accuracy)
+            merged[metric].merge(sketch)
+    return merged
+
+
+def quintile_edges(sketch):
+    """Inner quintile cut points (20/40/60/80%) of a value sketch"""
+    return sketch.quantile([0.2, 0.4, 0.6, 0.8])
+
+
+def _value_scores(values, sketch):
+    """Quintile bin (1-5) of each value, as pd.qcut on the values would give"""
+    return np.searchsorted(quintile_edges(sketch), values, side='left') + 1
+
+
+def _rank_scores(values, sketch, preceding=None):
+    """
+    Quintile bin (1-5) of each value's rank, as pd.qcut on
+    values.rank(method='first') would give
+
+    Each value's global rank is the number of values in lower buckets plus
+    its position among this shard's values in the same bucket, scaled up to
+    the bucket's global count. On a single shard this is the exact
+    rank(method='first'). If the sketch of all shards that come before this
+    one in row order is given, integer buckets (where every member is a tie)
+    are offset by the preceding count instead of scaled, which makes f_score
+    exact for contiguous shards too.
+    """
+    bucket = sketch.bucket_index(values)
+    order = np.lexsort((np.arange(len(values)), values, bucket))
+    sorted_bucket = bucket[order]
+    group_start = np.r_[0, np.flatnonzero(np.diff(sorted_bucket)) + 1]
+    group_size = np.diff(np.r_[group_start, len(order)])
+    position = np.arange(len(order)) - np.repeat(group_start, group_size)
+
+    if preceding is not None and sketch.relative_accuracy is None:
+        within = preceding.bucket_count(sorted_bucket) + position + 1
+    else:
+        local_count = np.repeat(group_size, group_size)
+        within = (position + 1) * sketch.bucket_count(sorted_bucket) / local_count
+    rank = np.empty(len(values), dtype=float)
+    rank[order] = sketch.rank_before(sorted_bucket) + within
+
+    n = sketch.count
+    edges = 1 + np.array([0.2, 0.4, 0.6, 0.8]) * (n - 1)
+    return np.searchsorted(edges, np.round(rank, 9), side='left') + 1
+
+
+def sketch_scores(rfm_df, sketches, preceding=None):
+    """
+    Assign r/f/m scores to one shard using merged sketches
+
+    Args:
+        rfm_df (pd.DataFrame): RFM metrics of the shard
+        sketches (dict): Merged sketches of all shards
+        preceding (dict): Merged sketches of the shards before this one in
+            row order, if shards are contiguous (improves tie handling)
+
+    Returns:
+        pd.DataFrame: Columns r_score, f_score, m_score aligned with rfm_df
+    """
+    def before(metric):
+        if preceding is None:
+            return None
+        # The first shard has no preceding shards: an empty sketch
+        return preceding.get(metric, QuantileSketch(sketches[metric].relative_accuracy))
+
+    return pd.DataFrame({
+        'r_score': 6 - _value_scores(rfm_df['recency'].to_numpy(), sketches['recency']),
+        'f_score': _rank_scores(rfm_df['frequency'].to_numpy(), sketches['frequency'],
+                                before('frequency')),
+        'm_score': _rank_scores(rfm_df['monetary'].to_numpy(), sketches['monetary'],
+                                before('monetary')),
+    }, index=rfm_df.index)
+
+
+def score_mismatch_report(exact_scores, approx_scores):
+    """
+    Count customers whose sketch-based scores differ from exact qcut scores
+
+    Args:
+        exact_scores (pd.DataFrame): r_score, f_score, m_score from qcut
+        approx_scores (pd.DataFrame): Same columns from the sketch backend
+
+    Returns:
+        dict: Per score number and share of differing customers, and the
+            number of customers with any difference
+    """
+    report = {}
+    any_diff = np.zeros(len(exact_scores), dtype=bool)
+    for col in ('r_score', 'f_score', 'm_score'):
+        diff = exact_scores[col].to_numpy() != approx_scores[col].to_numpy()
+        any_diff |= diff
+        report[col] = {'mismatches': int(diff.sum()),
+                       'pct': float(diff.mean() * 100) if len(diff) else 0.0}
+    report['any'] = {'mismatches': int(any_diff.sum()),
+                     'pct': float(any_diff.mean() * 100) if len(any_diff) else 0.0}
+    return report
+
+
+def main():
+    """Compare sketch-based scoring on simulated shards with exact qcut scoring"""
+    from rfm import score_rfm
+    from storage import read_table
+
+    parser = argparse.ArgumentParser(
+        description='Score RFM metrics with mergeable quantile sketches and report '
+                    'differences from exact qcut scores'
+    )
+    parser.add_argument('--input', type=str, default='rfm_analysis_results.csv',
+                        help='File with recency/frequency/monetary columns '
+                             '(default: rfm_analysis_results.csv)')
+    parser.add_argument('--shards', type=int, default=8,
+                        help='Number of shards to split the customers into (default: 8)')
+    parser.add_argument('--accuracy', type=float, default=DEFAULT_RELATIVE_ACCURACY,
+                        help=f'Relative accuracy of the monetary sketch (default: {DEFAULT_RELATIVE_ACCURACY})')
+    args = parser.parse_args()
+
+    rfm_df = read_table(args.input, columns=['customer_id', *RFM_METRICS])
+    exact = score_rfm(rfm_df[['customer_id', *RFM_METRICS]])
+
+    # Contiguous shards, as produced by customer-range sharding
+    shards = np.array_split(np.arange(len(rfm_df)), args.shards)
+    shard_sketches = [build_sketches(rfm_df.iloc[idx], args.accuracy) for idx in shards]
+    sketches = merge_sketches(shard_sketches)
+    approx = pd.concat([
+        sketch_scores(rfm_df.iloc[idx], sketches, merge_sketches(shard_sketches[:i]))
+        for i, idx in enumerate(shards)
+    ])
+
+    report = score_mismatch_report(exact, approx)
+    print("="*70)
+    print("SKETCH SCORING vs EXACT QCUT")
+    print("="*70)
+    print(f"\nCustomers: {len(rfm_df):,}  Shards: {args.shards}  Monetary accuracy: {args.accuracy:.2%}")
+    for metric, sketch in sketches.items():
+        edges = ', '.join(f"{e:,.2f}" for e in quintile_edges(sketch))
+        print(f"  {metric:10s} cut points: {edges}  ({len(sketch.counts):,} buckets)")
+    print("\nScore differences:")
+    for col, stats in report.items():
+        print(f"  {col:8s}: {stats['mismatches']:7,d} customers ({stats['pct']:.3f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+Segmentation Report Renderer
+Renders the segmentation charts headlessly from binned aggregates instead of per-customer points
+
+The notebook draws every customer through matplotlib, which needs an
+interactive session and stops working at a few hundred thousand
+customers. Here the RFM results are first reduced with NumPy to
+aggregates whose size does not depend on the number of customers:
+
+- per-segment customer counts, revenue and mean recency/frequency/monetary
+- fixed-bin histograms of recency, frequency and monetary
+- a per-segment 3D histogram of (recency, frequency, monetary); the 3D
+  chart plots occupied bins sized by their customer count
+- K-Means inertia and the K selection score by K (from k_selection, with
+  the criterion it used; computed on a random sample of at most k_sample
+  customers when not given)
+
+The input is read in chunks (two passes: value ranges, then bin counts),
+so aggregation memory is bounded by the chunk size. Each figure is then
+drawn by a worker process with the Agg canvas from these aggregates
+only, so rendering time and memory stay flat as the customer count grows.
+
+    aggregates = aggregate_report('rfm_analysis_results.csv')
+    render_report(aggregates, 'visualizations')
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from clustering import FEATURES, iter_feature_chunks
+from k_selection import K_RANGE, METRICS, select_k
+
+RANDOM_SEED = 42
+REPORT_DIR = 'visualizations'
+DPI = 300
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+# Bins per histogram (as in the notebook) and per axis of the 3D histogram
+HISTOGRAM_BINS = {'recency': 50, 'frequency': 30, 'monetary': 50}
+VOXEL_BINS = 20
+# Customers sampled for the elbow and silhouette curves when no K results are given
+DEFAULT_K_SAMPLE = 50_000
+
+AXIS_LABELS = {'recency': 'Recency (days)', 'frequency': 'Frequency (purchases)',
+               'monetary': 'Monetary ($)'}
+# Chart label of each k_selection criterion
+METRIC_LABELS = {
+    'silhouette': 'Silhouette Score',
+    'simplified_silhouette': 'Simplified Silhouette Score',
+    'davies_bouldin': 'Davies-Bouldin Index',
+    'calinski_harabasz': 'Calinski-Harabasz Index',
+}
+
+_worker_aggregates = None
+_worker_dpi = DPI
+
+
+def _bin(values, low, high, bins):
+    """Bin index of each value on a uniform grid over [low, high]"""
+    width = (high - low) / bins or 1.0
+    return np.clip(((values - low) / width).astype(np.int64), 0, bins - 1)
+
+
+def _segment_codes(segments, labels):
+    """Positions of a chunk's segment names in the report's label list"""
+    if isinstance(segments.dtype, pd.CategoricalDtype):
+        # Map each category once, then gather by category code
+        return labels.get_indexer(segments.cat.categories.astype(str))[segments.cat.codes.to_numpy()]
+    return labels.get_indexer(segments.astype(str))
+
+
+def _scan(source, chunksize):
+    """First pass: customer count, value ranges, moments and segment names"""
+    n, labels = 0, set()
+    low = np.full(len(FEATURES), np.inf)
+    high = np.full(len(FEATURES), -np.inf)
+    total = np.zeros(len(FEATURES))
+    squares = np.zeros(len(FEATURES))
+    for chunk in iter_feature_chunks(source, chunksize, FEATURES + ['segment']):
+        X = chunk[FEATURES].to_numpy(dtype=np.float64)
+        n += len(X)
+        low = np.minimum(low, X.min(axis=0))
+        high = np.maximum(high, X.max(axis=0))
+        total += X.sum(axis=0)
+        squares += (X ** 2).sum(axis=0)
+        labels.update(str(label) for label in chunk['segment'].unique())
+    mean = total / n
+    std = np.sqrt(np.maximum(squares / n - mean ** 2, 0))
+    return n, pd.Index(sorted(labels)), low, high, mean, std
+
+
+def aggregate_report(source, k_results=None, selected_k=None, k_metric='silhouette',
+                     chunksize=DEFAULT_CHUNK_ROWS, k_sample=DEFAULT_K_SAMPLE, seed=RANDOM_SEED):
+    """
+    Reduce RFM results to the aggregates the report figures are drawn from
+
+    Args:
+        source (pd.DataFrame or str): Results table or file with recency,
+            frequency, monetary and segment
+        k_results (list): Per-K results of k_selection.select_k (default:
+            evaluated on a sample of k_sample customers; 0 skips the K
+            charts)
+        selected_k (int): K marked on the K charts (default: the best K)
+        k_metric (str): k_selection criterion of the scores, one of METRICS
+        chunksize (int): Customers per chunk
+        k_sample (int): Customers sampled for the K evaluation
+        seed (int): Random seed for the sample
+
+    Returns:
+        dict: Aggregates; the size does not depend on the customer count
+    """
+    if k_metric not in METRICS:
+        raise ValueError(f"Unknown metric '{k_metric}'; expected one of {tuple(METRICS)}")
+    n, labels, low, high, mean, std = _scan(source, chunksize)
+    n_segments = len(labels)
+    counts = np.zeros(n_segments)
+    sums = np.zeros((len(FEATURES), n_segments))
+    histograms = {f: np.zeros(HISTOGRAM_BINS[f], dtype=np.int64) for f in FEATURES}
+    voxels = np.zeros(n_segments * VOXEL_BINS ** 3, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    sample_rate = min(1.0, k_sample / n) if k_results is None and k_sample else 0.0
+    sample = []
+
+    for chunk in iter_feature_chunks(source, chunksize, FEATURES + ['segment']):
+        X = chunk[FEATURES].to_numpy(dtype=np.float64)
+        codes = _segment_codes(chunk['segment'], labels)
+        counts += np.bincount(codes, minlength=n_segments)
+        cell = codes.astype(np.int64)
+        for i, feature in enumerate(FEATURES):
+            sums[i] += np.bincount(codes, weights=X[:, i], minlength=n_segments)
+            histograms[feature] += np.bincount(_bin(X[:, i], low[i], high[i], HISTOGRAM_BINS[feature]),
+                                               minlength=HISTOGRAM_BINS[feature])
+            cell = cell * VOXEL_BINS + _bin(X[:, i], low[i], high[i], VOXEL_BINS)
+        voxels += np.bincount(cell, minlength=len(voxels))
+        if sample_rate:
+            sample.append(X[rng.random(len(X)) < sample_rate])
+
+    if sample:
+        X_sample = (np.concatenate(sample) - mean) / np.where(std > 0, std, 1)
+        best_k, k_results = select_k(X_sample, K_RANGE, metric=k_metric, seed=seed)
+        selected_k = selected_k or best_k
+    elif k_results:
+        scores = [result['score'] for result in k_results]
+        best = np.argmax(scores) if METRICS[k_metric] else np.argmin(scores)
+        selected_k = selected_k or k_results[int(best)]['k']
+
+    return {
+        'customers': n,
+        'segments': labels.tolist(),
+        'counts': counts,
+        'revenue': sums[FEATURES.index('monetary')],
+        'means': pd.DataFrame((sums / np.maximum(counts, 1)).T, index=labels, columns=FEATURES),
+        'feature_means': dict(zip(FEATURES, mean)),
+        'histograms': {f: (histograms[f], np.linspace(low[i], high[i], HISTOGRAM_BINS[f] + 1))
+                       for i, f in enumerate(FEATURES)},
+        'voxels': voxels.reshape(n_segments, VOXEL_BINS, VOXEL_BINS, VOXEL_BINS),
+        'voxel_edges': {f: np.linspace(low[i], high[i], VOXEL_BINS + 1) for i, f in enumerate(FEATURES)},
+        'k_results': k_results or None,
+        'k_metric': k_metric,
+        'selected_k': selected_k,
+        'k_sample': int(sum(len(s) for s in sample)) if sample else None,
+    }
+
+
+# -- figures ------------------------------------------------------------------
+# Each figure function takes the aggregates and returns a matplotlib Figure
+# on the Agg canvas, or None when its data is missing.
+
+def _canvas(figsize):
+    """Figure on the Agg canvas, without pyplot or a global backend switch"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _figure(figsize, **subplot_kw):
+    fig = _canvas(figsize)
+    return fig, fig.add_subplot(**subplot_kw)
+
+
+def _segment_bars(aggregates, values, title, xlabel, color, label):
+    order = np.argsort(values, kind='stable')
+    names = [aggregates['segments'][i] for i in order]
+    fig, ax = _figure((10, 6))
+    ax.barh(names, values[order], color=color, edgecolor='black')
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_xlabel(xlabel, fontsize=12)
+    share = values[order] / values.sum() * 100
+    for i, (v, pct) in enumerate(zip(values[order], share)):
+        ax.text(v, i, f" {label(v)} ({pct:.1f}%)", va='center', fontsize=10)
+    ax.margins(x=0.25)
+    fig.tight_layout()
+    return fig
+
+
+def figure_segment_distribution(aggregates):
+    """Customer count per segment with percentages"""
+    return _segment_bars(aggregates, aggregates['counts'], 'Customer Count by Segment',
+                         'Number of Customers', 'steelblue', lambda v: f"{v:,.0f}")
+
+
+def figure_revenue_by_segment(aggregates):
+    """Total revenue per segment with percentages"""
+    return _segment_bars(aggregates, aggregates['revenue'] / 1e6, 'Total Revenue by Segment',
+                         'Revenue ($ Millions)', 'green', lambda v: f"${v:,.1f}M")
+
+
+def figure_rfm_heatmap(aggregates):
+    """Mean recency, frequency and monetary per segment, normalized per metric"""
+    means = aggregates['means']
+    spread = (means.max() - means.min()).replace(0, 1)
+    normalized = ((means - means.min()) / spread).T
+    fig, ax = _figure((10, 6))
+    image = ax.imshow(normalized.to_numpy(), cmap='RdYlGn_r', aspect='auto')
+    fig.colorbar(image, ax=ax, label='Normalized Value')
+    for (i, j), value in np.ndenumerate(means.T.to_numpy()):
+        ax.text(j, i, f"{value:.1f}", ha='center', va='center', fontsize=9)
+    ax.set_xticks(range(len(means)), means.index, rotation=45, ha='right')
+    ax.set_yticks(range(len(FEATURES)), FEATURES)
+    ax.set_title('RFM Metrics Heatmap by Segment', fontsize=14, fontweight='bold', pad=20)
+    ax.set_xlabel('Segment', fontsize=12)
+    ax.set_ylabel('RFM Metric', fontsize=12)
+    fig.tight_layout()
+    return fig
+
+
+def _k_curve(aggregates, key, title, ylabel, color, marker):
+    results = aggregates['k_results']
+    if not results:
+        return None
+    ks = [result['k'] for result in results]
+    fig, ax = _figure((8, 5))
+    ax.plot(ks, [result[key] for result in results], marker=marker, linewidth=2, markersize=8, color=color)
+    if key == 'score' and 'ci_low' in results[0]:
+        ax.fill_between(ks, [r['ci_low'] for r in results], [r['ci_high'] for r in results],
+                        color=color, alpha=0.15, label='95% interval')
+    if aggregates['selected_k']:
+        ax.axvline(x=aggregates['selected_k'], color='red', linestyle='--', alpha=0.7,
+                   label=f"Selected K={aggregates['selected_k']}")
+    if aggregates['k_sample']:
+        title += f" ({aggregates['k_sample']:,}-customer sample)"
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_xlabel('Number of Clusters (K)', fontsize=12)
+    ax.set_ylabel(ylabel, fontsize=12)
+    ax.grid(True, alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    return fig
+
+
+def figure_elbow_method(aggregates):
+    """Inertia by K"""
+    return _k_curve(aggregates, 'inertia', 'Elbow Method for Optimal K',
+                    'Inertia (Within-Cluster Sum of Squares)', None, 'o')
+
+
+def figure_silhouette_analysis(aggregates):
+    """K selection score by K (the silhouette, or the criterion k_selection used)"""
+    label = METRIC_LABELS[aggregates['k_metric']]
+    ylabel = label if METRICS[aggregates['k_metric']] else f"{label} (lower is better)"
+    return _k_curve(aggregates, 'score', f"{label} by K", ylabel, 'green', 's')
+
+
+def figure_3d_segmentation(aggregates):
+    """Occupied 3D histogram bins per segment, sized by customer count"""
+    import matplotlib
+    edges = aggregates['voxel_edges']
+    centers = [(edges[f][:-1] + edges[f][1:]) / 2 for f in FEATURES]
+    voxels = aggregates['voxels']
+    scale = 300 / np.log1p(voxels.max())
+    colors = matplotlib.colormaps['tab10'](np.linspace(0, 1, max(len(voxels), 2)))
+    fig, ax = _figure((14, 10), projection='3d')
+    for s, segment in enumerate(aggregates['segments']):
+        i, j, k = np.nonzero(voxels[s])
+        ax.scatter(centers[0][i], centers[1][j], centers[2][k], s=np.log1p(voxels[s][i, j, k]) * scale,
+                   c=[colors[s]], label=segment, alpha=0.6, edgecolors='black', linewidth=0.5)
+    ax.set_xlabel(AXIS_LABELS['recency'], fontsize=12, labelpad=10)
+    ax.set_ylabel(AXIS_LABELS['frequency'], fontsize=12, labelpad=10)
+    ax.set_zlabel(AXIS_LABELS['monetary'], fontsize=12, labelpad=10)
+    ax.set_title(f"3D Customer Segmentation (RFM Space, {aggregates['customers']:,} customers binned)",
+                 fontsize=14, fontweight='bold', pad=20)
+    ax.legend(loc='upper left', fontsize=10)
+    fig.tight_layout()
+    return fig
+
+
+def figure_rfm_distribution(aggregates):
+    """Recency, frequency and monetary histograms with their means"""
+    fig = _canvas((16, 4))
+    axes = fig.subplots(1, 3)
+    colors = {'recency': 'skyblue', 'frequency': 'lightgreen', 'monetary': 'lightcoral'}
+    for ax, feature in zip(axes, FEATURES):
+        counts, edges = aggregates['histograms'][feature]
+        ax.stairs(counts, edges, fill=True, color=colors[feature], edgecolor='black')
+        mean = aggregates['feature_means'][feature]
+        ax.axvline(mean, color='red', linestyle='--', linewidth=2, label=f"Mean: {mean:,.1f}")
+        ax.set_title(f"{feature.capitalize()} Distribution", fontsize=14, fontweight='bold')
+        ax.set_xlabel(AXIS_LABELS[feature], fontsize=12)
+        ax.set_ylabel('Number of Customers', fontsize=12)
+        ax.legend()
+    fig.tight_layout()
+    return fig
+
+
+# Output file stem -> figure function
+FIGURES = {
+    'segment_distribution': figure_segment_distribution,
+    'revenue_by_segment': figure_revenue_by_segment,
+    'rfm_heatmap': figure_rfm_heatmap,
+    'elbow_method': figure_elbow_method,
+    'silhouette_analysis': figure_silhouette_analysis,
+    '3d_segmentation': figure_3d_segmentation,
+    'rfm_distribution': figure_rfm_distribution,
+}
+
+
+def _init_worker(aggregates, dpi):
+    """Receive the aggregates once per worker instead of once per figure"""
+    global _worker_aggregates, _worker_dpi
+    _worker_aggregates, _worker_dpi = aggregates, dpi
+
+
+def _render_task(task):
+    name, path = task
+    start = time.perf_counter()
+    fig = FIGURES[name](_worker_aggregates)
+    if fig is None:
+        return name, None, 0.0
+    fig.savefig(path, dpi=_worker_dpi)
+    return name, path, time.perf_counter() - start
+
+
+def render_report(aggregates, output_dir=REPORT_DIR, figures=None, workers=None, dpi=DPI):
+    """
+    Draw the report figures as PNG files, one worker process per figure
+
+    Args:
+        aggregates (dict): Output of aggregate_report
+        output_dir (str): Directory for the PNG files
+        figures (list): Names from FIGURES (default: all)
+        workers (int): Worker processes (default: one per figure, capped
+            at the CPU count); 1 renders in this process
+        dpi (int): Resolution of the PNG files
+
+    Returns:
+        dict: Figure name -> (path, seconds) for the figures written
+            (figures without data, e.g. the K charts without K results,
+            are left out)
+    """
+    names = list(figures or FIGURES)
+    unknown = [name for name in names if name not in FIGURES]
+    if unknown:
+        raise ValueError(f"Unknown figure(s) {unknown}; expected names from {tuple(FIGURES)}")
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(name, os.path.join(output_dir, f'{name}.png')) for name in names]
+    if workers is None:
+        workers = min(len(tasks), os.cpu_count() or 1)
+
+    if workers <= 1:
+        _init_worker(aggregates, dpi)
+        outcomes = [_render_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(aggregates, dpi)) as pool:
+            outcomes = list(pool.map(_render_task, tasks))
+    return {name: (path, seconds) for name, path, seconds in outcomes if path}
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Render the segmentation charts from an RFM results file without plotting every customer'
+    )
+    parser.add_argument('--input', type=str, default='rfm_analysis_results.csv',
+                        help='Results file with recency, frequency, monetary and segment '
+                             '(default: rfm_analysis_results.csv)')
+    parser.add_argument('--output-dir', type=str, default=REPORT_DIR,
+                        help=f'Directory for the PNG files (default: {REPORT_DIR})')
+    parser.add_argument('--figures', type=str, nargs='+', default=None, choices=list(FIGURES),
+                        help='Figures to render (default: all)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f'Customers per chunk (default: {DEFAULT_CHUNK_ROWS:,})')
+    parser.add_argument('--k-sample', type=int, default=DEFAULT_K_SAMPLE,
+                        help=f'Customers sampled for the elbow/silhouette charts, 0 to skip them '
+                             f'(default: {DEFAULT_K_SAMPLE:,})')
+    parser.add_argument('--metric', type=str, default='silhouette', choices=list(METRICS),
+                        help='K selection criterion of the sampled K charts (default: silhouette)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: one per figure, up to the CPU count)')
+    parser.add_argument('--dpi', type=int, default=DPI, help=f'PNG resolution (default: {DPI})')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("SEGMENTATION REPORT")
+    print("="*70)
+
+    start = time.perf_counter()
+    aggregates = aggregate_report(args.input, k_results=None if args.k_sample else [],
+                                  k_metric=args.metric, chunksize=args.chunksize,
+                                  k_sample=args.k_sample)
+    print(f"\nAggregated {aggregates['customers']:,} customers in "
+          f"{len(aggregates['segments'])} segments ({time.perf_counter() - start:.2f}s)")
+
+    start = time.perf_counter()
+    rendered = render_report(aggregates, args.output_dir, args.figures, args.workers, args.dpi)
+    print(f"Rendered {len(rendered)} figures ({time.perf_counter() - start:.2f}s):")
+    for name, (path, seconds) in rendered.items():
+        print(f"  ✓ {path} ({seconds:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
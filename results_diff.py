@@ -0,0 +1,308 @@
+"""
+Results Change-Data Capture
+Diffs two segmentation runs and keeps only the customers that changed
+
+Every run rewrites the results table for all customers, while only a small
+share of them change segment, cluster or score. diff_results compares the
+new results with the previous run's and returns a delta of inserted,
+removed and changed rows plus summary counts, so a CRM sync only pushes
+the delta.
+
+Customer IDs become uint64 keys and both sides are sorted by key; the
+join is then a np.searchsorted of one sorted key array into the other,
+with no string comparisons or pandas merge. IDs of one common length such
+as CUST00001 are packed exactly and in order (the shared prefix dropped,
+the rest read straight from the Arrow string buffer), so results written
+in customer order need no sort at all. Other IDs are hashed; a collision
+between two different IDs then has probability about n^2 / 2^65 (1e-5
+at 20M customers). Duplicate keys within one run are reported as an
+error.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from storage import read_table, write_table
+
+DELTA_FILE = 'rfm_results_delta.csv'
+KEY_COLUMN = 'customer_id'
+
+# Columns whose change makes a customer part of the delta
+CHANGE_COLUMNS = ['segment', 'cluster', 'r_score', 'f_score', 'm_score']
+
+INSERT, DELETE, UPDATE = 'insert', 'delete', 'update'
+CHANGE_TYPES = [INSERT, DELETE, UPDATE]
+
+
+def _fixed_width_bytes(values):
+    """
+    Strings of one common length as an (n, width) uint8 matrix, read
+    straight from the Arrow string buffer; None if that is not possible
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    try:
+        array = pa.array(values, type=pa.large_string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    if array.null_count or len(array) == 0:
+        return None
+    offsets = np.frombuffer(array.buffers()[1], dtype=np.int64)[array.offset:array.offset + len(array) + 1]
+    width = int(offsets[1] - offsets[0])
+    if width == 0 or offsets[-1] - offsets[0] != width * len(array) or (np.diff(offsets) != width).any():
+        return None
+    data = np.frombuffer(array.buffers()[2], dtype=np.uint8)[offsets[0]:offsets[-1]]
+    return data.reshape(len(array), width)
+
+
+def _common_prefix(chars):
+    """Length of the prefix shared by every row of a character matrix"""
+    for j in range(chars.shape[1]):
+        if (chars[:, j] != chars[0, j]).any():
+            return j
+    return chars.shape[1]
+
+
+def _pack(chars):
+    """Up to 8 bytes per row as big-endian uint64: exact and order-preserving"""
+    words = np.zeros((len(chars), 8), dtype=np.uint8)
+    words[:, 8 - chars.shape[1]:] = chars
+    return words.view('>u8').ravel().astype(np.uint64)
+
+
+def _mix64(h):
+    """splitmix64 finalizer: a bijection that spreads every input bit"""
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def _hash(values, chars):
+    """uint64 hash of each string"""
+    if chars is None:
+        return pd.util.hash_array(np.asarray(values, dtype=object), categorize=False)
+    n, width = chars.shape
+    words = np.zeros((n, -(-width // 8) * 8), dtype=np.uint8)
+    words[:, :width] = chars
+    words = words.view(np.uint64)
+    h = np.full(n, width, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for i in range(words.shape[1]):
+            h = _mix64(h ^ words[:, i])
+    return h
+
+
+def customer_keys(*columns):
+    """
+    uint64 keys of customer IDs, comparable across the given columns
+
+    IDs of one common length whose characters after a shared prefix fit in
+    8 bytes (e.g. CUST00001) are packed into exact, order-preserving
+    integers; other IDs are hashed. Categorical columns only key their
+    categories.
+
+    Args:
+        *columns (pd.Series): Customer ID columns (categorical or plain)
+
+    Returns:
+        list: One uint64 key array per column
+    """
+    parts = []
+    for ids in columns:
+        if isinstance(ids.dtype, pd.CategoricalDtype):
+            parts.append((ids.cat.categories, ids.cat.codes.to_numpy()))
+        else:
+            parts.append((ids, None))
+    chars = [_fixed_width_bytes(values) for values, _ in parts]
+
+    packed = all(c is not None for c in chars) and len({c.shape[1] for c in chars}) == 1
+    if packed:
+        width = chars[0].shape[1]
+        prefix = min(_common_prefix(c) for c in chars)
+        while prefix and any((c[0, :prefix] != chars[0][0, :prefix]).any() for c in chars):
+            prefix -= 1
+        packed = width - prefix <= 8
+    if packed:
+        keys = [_pack(c[:, prefix:]) for c in chars]
+    else:
+        # One hash function for all columns: the byte-wise one only if every
+        # column has fixed-width IDs
+        if any(c is None for c in chars):
+            chars = [None] * len(chars)
+        keys = [_hash(values, c) for (values, _), c in zip(parts, chars)]
+    return [k if codes is None else k[codes] for k, (_, codes) in zip(keys, parts)]
+
+
+def _sorted_keys(keys, side):
+    """Keys in increasing order and the row order that gives them"""
+    if len(keys) < 2 or (keys[1:] > keys[:-1]).all():
+        order = np.arange(len(keys))
+    else:
+        order = np.argsort(keys)
+        keys = keys[order]
+    duplicates = np.flatnonzero(keys[1:] == keys[:-1])
+    if len(duplicates):
+        raise ValueError(f"{len(duplicates)} duplicate {KEY_COLUMN} key(s) in the {side} results")
+    return keys, order
+
+
+def _differs(previous, current, prev_rows, cur_rows):
+    """Element-wise inequality of two aligned column selections"""
+    if isinstance(current.dtype, pd.CategoricalDtype) or isinstance(previous.dtype, pd.CategoricalDtype):
+        # Compare codes in one category space instead of strings
+        current = current.astype('category')
+        previous = previous.astype('category')
+        recode = current.cat.categories.get_indexer(previous.cat.categories)
+        prev_codes = previous.cat.codes.to_numpy()
+        prev_codes = np.where(prev_codes >= 0, recode[prev_codes], -1)
+        # Labels missing from the current categories never match (-2)
+        prev_codes = np.where((prev_codes < 0) & (previous.cat.codes.to_numpy() >= 0), -2, prev_codes)
+        return prev_codes[prev_rows] != current.cat.codes.to_numpy()[cur_rows]
+    return previous.to_numpy()[prev_rows] != current.to_numpy()[cur_rows]
+
+
+def _trimmed(rows):
+    """Rows with unused categories dropped, so the delta stays small"""
+    for col in rows.columns:
+        if isinstance(rows[col].dtype, pd.CategoricalDtype):
+            rows[col] = rows[col].cat.remove_unused_categories()
+    return rows
+
+
+def diff_results(previous, current, columns=CHANGE_COLUMNS):
+    """
+    Rows inserted, removed or changed between two results tables
+
+    Args:
+        previous (pd.DataFrame): Results of the previous run
+        current (pd.DataFrame): Results of this run
+        columns (list): Columns compared for changes (those present in
+            both tables)
+
+    Returns:
+        tuple: (delta DataFrame, counts dict). The delta has a
+            change_type column ('insert', 'delete' or 'update'), the current
+            row for inserts and updates, the previous row for deletes, and
+            previous_<column> values of the compared columns for updates.
+    """
+    columns = [c for c in columns if c in previous.columns and c in current.columns]
+    prev_keys, cur_keys = customer_keys(previous[KEY_COLUMN], current[KEY_COLUMN])
+    prev_keys, prev_order = _sorted_keys(prev_keys, 'previous')
+    cur_keys, cur_order = _sorted_keys(cur_keys, 'current')
+
+    # Merge-join of the sorted keys
+    pos = np.searchsorted(prev_keys, cur_keys)
+    matched = np.zeros(len(cur_keys), dtype=bool)
+    in_range = pos < len(prev_keys)
+    matched[in_range] = prev_keys[pos[in_range]] == cur_keys[in_range]
+    prev_matched = np.zeros(len(prev_keys), dtype=bool)
+    prev_matched[pos[matched]] = True
+
+    inserted = np.sort(cur_order[~matched])
+    removed = np.sort(prev_order[~prev_matched])
+    prev_rows, cur_rows = prev_order[pos[matched]], cur_order[matched]
+
+    changed = np.zeros(len(cur_rows), dtype=bool)
+    column_counts = {}
+    for col in columns:
+        differs = _differs(previous[col], current[col], prev_rows, cur_rows)
+        column_counts[col] = int(differs.sum())
+        changed |= differs
+    order = np.argsort(cur_rows[changed], kind='stable')
+    updated_prev, updated = prev_rows[changed][order], cur_rows[changed][order]
+
+    updates = _trimmed(current.iloc[updated].reset_index(drop=True))
+    for col in columns:
+        updates[f'previous_{col}'] = previous[col].iloc[updated_prev].to_numpy()
+    delta = pd.concat([
+        _trimmed(current.iloc[inserted].assign(change_type=INSERT)),
+        updates.assign(change_type=UPDATE),
+        _trimmed(previous.iloc[removed].assign(change_type=DELETE)),
+    ], ignore_index=True)
+    delta['change_type'] = pd.Categorical(delta['change_type'], categories=CHANGE_TYPES)
+    delta = delta[['change_type'] + [c for c in delta.columns if c != 'change_type']]
+    for col in columns:
+        # Keep integer columns integer where inserts leave previous values empty
+        if pd.api.types.is_integer_dtype(current[col].dtype):
+            delta[f'previous_{col}'] = delta[f'previous_{col}'].astype('Int64')
+
+    counts = {
+        'previous': int(len(previous)),
+        'current': int(len(current)),
+        'inserted': int(len(inserted)),
+        'removed': int(len(removed)),
+        'changed': int(changed.sum()),
+        'unchanged': int(len(cur_rows) - changed.sum()),
+        'changed_by_column': column_counts,
+    }
+    return delta, counts
+
+
+def save_delta(delta, counts, path=DELTA_FILE):
+    """
+    Write a delta and its summary counts (<path>.summary.json)
+
+    Args:
+        delta (pd.DataFrame): Delta from diff_results
+        counts (dict): Counts from diff_results
+        path (str): Delta file (.csv, .parquet or .feather)
+    """
+    write_table(delta, path)
+    with open(f"{path}.summary.json", 'w') as f:
+        json.dump(counts, f, indent=2)
+
+
+def print_counts(counts):
+    """Print the summary counts of a diff"""
+    print(f"Results delta: {counts['inserted']:,} inserted, {counts['removed']:,} removed, "
+          f"{counts['changed']:,} changed, {counts['unchanged']:,} unchanged")
+    changed = ', '.join(f"{col} {n:,}" for col, n in counts['changed_by_column'].items() if n)
+    if changed:
+        print(f"  changes by column: {changed}")
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Delta of inserted, removed and changed customers between two results files'
+    )
+    parser.add_argument('--previous', type=str, required=True,
+                        help='Results file of the previous run')
+    parser.add_argument('--current', type=str, default='rfm_analysis_results.csv',
+                        help='Results file of this run (default: rfm_analysis_results.csv)')
+    parser.add_argument('--output', type=str, default=DELTA_FILE,
+                        help=f'Delta file (default: {DELTA_FILE})')
+    parser.add_argument('--columns', type=str, nargs='+', default=CHANGE_COLUMNS,
+                        help=f"Columns compared (default: {' '.join(CHANGE_COLUMNS)})")
+    args = parser.parse_args()
+
+    print("="*70)
+    print("RESULTS DELTA")
+    print("="*70)
+
+    previous = read_table(args.previous)
+    current = read_table(args.current)
+    start = time.perf_counter()
+    delta, counts = diff_results(previous, current, args.columns)
+    seconds = time.perf_counter() - start
+
+    print(f"\n{counts['previous']:,} previous vs {counts['current']:,} current customers "
+          f"(diffed in {seconds:.2f}s)")
+    print_counts(counts)
+    save_delta(delta, counts, args.output)
+    print(f"\n✓ {len(delta):,} delta rows saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
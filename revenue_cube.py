@@ -0,0 +1,379 @@
+"""
+Segment x Category x Month Revenue Cube
+Pre-aggregated revenue, orders and distinct customers for dashboard queries
+
+The cube is built in one pass over the transactions (read in chunks) once
+customers have segments, and stored as a directory of NumPy arrays plus
+JSON dimension metadata:
+
+    revenue_cube/
+        metadata.json               dimension labels, source, build info
+        revenue.npy                 (S, C, M) float64 revenue
+        orders.npy                  (S, C, M) int64 transactions
+        customers.npy               (S, C, M) distinct customers
+        customers_segment_category.npy  (S, C) distinct customers over all months
+        customers_segment_month.npy     (S, M) distinct customers over all categories
+        customers_segment.npy           (S,)   customers per segment
+
+Revenue and orders add up along any dimension. Distinct customers only add
+up across segments (each customer has one segment), so the roll-ups over
+all months and/or all categories are precomputed. Arrays are loaded
+memory-mapped and queries are small array reductions, answering in
+microseconds instead of a transaction scan.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from storage import iter_table, read_table
+
+CUBE_DIR = 'revenue_cube'
+FORMAT_VERSION = 1
+DIMENSIONS = ('segment', 'category', 'month')
+MEASURES = ('revenue', 'orders', 'customers')
+CUBE_COLUMNS = ['customer_id', 'transaction_date', 'product_category', 'total_amount']
+
+# Distinct-customer arrays by the dimensions they keep
+CUSTOMER_ROLLUPS = {
+    ('segment', 'category', 'month'): 'customers',
+    ('segment', 'category'): 'customers_segment_category',
+    ('segment', 'month'): 'customers_segment_month',
+    ('segment',): 'customers_segment',
+}
+ARRAYS = ('revenue', 'orders') + tuple(CUSTOMER_ROLLUPS.values())
+
+# Bit layout of the packed int64 keys: customer | category | month
+_CATEGORY_SHIFT = 16
+_CUSTOMER_SHIFT = 32
+
+
+def _month_numbers(dates):
+    """Months since 1970-01 (uint16 range)"""
+    return np.asarray(dates, dtype='datetime64[M]').astype(np.int64)
+
+
+def build_cube(transactions_file, rfm_df, chunksize=1_000_000, fmt=None):
+    """
+    Aggregate transactions into the segment x category x month cube
+
+    Args:
+        transactions_file (str): Transaction file (CSV, Parquet or Feather)
+        rfm_df (pd.DataFrame): Results with customer_id and segment
+        chunksize (int): Transaction rows per chunk
+        fmt (str): Explicit storage format overriding the extension
+
+    Returns:
+        dict: Arrays of ARRAYS plus 'segments', 'categories', 'months'
+            labels and 'transactions' / 'unmatched' row counts
+    """
+    segment_labels = pd.Categorical(rfm_df['segment'])
+    segments = [str(s) for s in segment_labels.categories]
+    segment_of = segment_labels.codes.astype(np.int64)
+    customer_index = pd.Index(rfm_df['customer_id'].astype(str).to_numpy())
+
+    categories = []
+    cell_parts, pair_parts = [], []
+    transactions = unmatched = 0
+    for chunk in iter_table(transactions_file, columns=CUBE_COLUMNS, chunksize=chunksize, fmt=fmt):
+        transactions += len(chunk)
+        ids = pd.Categorical(chunk['customer_id'])
+        customers = customer_index.get_indexer(ids.categories.astype(str))[ids.codes]
+        known = customers >= 0
+        unmatched += int((~known).sum())
+
+        # Chunk category codes -> global codes (in order of first appearance)
+        labels = pd.Categorical(chunk['product_category'])
+        for label in labels.categories:
+            if label not in categories:
+                categories.append(label)
+        category_codes = np.array([categories.index(c) for c in labels.categories], dtype=np.int64)
+
+        customers = customers[known].astype(np.int64)
+        category = category_codes[labels.codes[known]]
+        month = _month_numbers(chunk['transaction_date'].to_numpy()[known])
+        amount = chunk['total_amount'].to_numpy(dtype=np.float64)[known]
+
+        cells, inverse = np.unique((segment_of[customers] << _CUSTOMER_SHIFT)
+                                   | (category << _CATEGORY_SHIFT) | month, return_inverse=True)
+        cell_parts.append((cells, np.bincount(inverse, weights=amount), np.bincount(inverse)))
+        pair_parts.append(np.unique((customers << _CUSTOMER_SHIFT) | (category << _CATEGORY_SHIFT) | month))
+
+    return _assemble(cell_parts, pair_parts, segments, segment_of, categories,
+                     transactions, unmatched)
+
+
+def _assemble(cell_parts, pair_parts, segments, segment_of, categories, transactions, unmatched):
+    """Turn the per-chunk packed keys into dense arrays"""
+    category_mask = (1 << (_CUSTOMER_SHIFT - _CATEGORY_SHIFT)) - 1
+    month_mask = (1 << _CATEGORY_SHIFT) - 1
+    cells = np.concatenate([part[0] for part in cell_parts]) if cell_parts else np.zeros(0, np.int64)
+    revenue = np.concatenate([part[1] for part in cell_parts]) if cell_parts else np.zeros(0)
+    orders = np.concatenate([part[2] for part in cell_parts]) if cell_parts else np.zeros(0, np.int64)
+    pairs = np.unique(np.concatenate(pair_parts)) if pair_parts else np.zeros(0, np.int64)
+
+    # Dimension labels: sorted categories, every month between first and last
+    order = np.argsort(categories, kind='stable')
+    category_rank = np.empty(len(categories), dtype=np.int64)
+    category_rank[order] = np.arange(len(categories))
+    cell_months = cells & month_mask
+    months = (np.arange(cell_months.min(), cell_months.max() + 1) if len(cells)
+              else np.zeros(0, np.int64))
+    first_month = months[0] if len(months) else 0
+    shape = (len(segments), len(categories), len(months))
+
+    def flat(segment, category, month):
+        return np.ravel_multi_index((segment, category_rank[category], month - first_month), shape)
+
+    cell_index = flat(cells >> _CUSTOMER_SHIFT, (cells >> _CATEGORY_SHIFT) & category_mask, cells & month_mask)
+    size = int(np.prod(shape))
+    arrays = {
+        'revenue': np.bincount(cell_index, weights=revenue, minlength=size).reshape(shape),
+        'orders': np.bincount(cell_index, weights=orders, minlength=size).astype(np.int64).reshape(shape),
+    }
+
+    customer = pairs >> _CUSTOMER_SHIFT
+    category = (pairs >> _CATEGORY_SHIFT) & category_mask
+    month = pairs & month_mask
+    arrays['customers'] = np.bincount(flat(segment_of[customer], category, month),
+                                      minlength=size).reshape(shape)
+    # Distinct (customer, category) and (customer, month) pairs for the roll-ups
+    by_category = np.unique((customer << _CATEGORY_SHIFT) | category)
+    arrays['customers_segment_category'] = np.bincount(
+        segment_of[by_category >> _CATEGORY_SHIFT] * shape[1] + category_rank[by_category & category_mask],
+        minlength=shape[0] * shape[1]).reshape(shape[:2])
+    by_month = np.unique((customer << _CATEGORY_SHIFT) | month)
+    arrays['customers_segment_month'] = np.bincount(
+        segment_of[by_month >> _CATEGORY_SHIFT] * shape[2] + (by_month & month_mask) - first_month,
+        minlength=shape[0] * shape[2]).reshape((shape[0], shape[2]))
+    arrays['customers_segment'] = np.bincount(segment_of[np.unique(customer)], minlength=shape[0])
+
+    arrays.update({
+        'segments': segments,
+        'categories': [str(categories[i]) for i in order],
+        'months': [str(np.datetime64(int(m), 'M')) for m in months],
+        'transactions': int(transactions),
+        'unmatched': int(unmatched),
+    })
+    return arrays
+
+
+def save_cube(cube, cube_dir=CUBE_DIR, source=None):
+    """
+    Write a cube directory
+
+    Args:
+        cube (dict): Output of build_cube
+        cube_dir (str): Directory to write
+        source (str): Transaction file the cube was built from (recorded)
+    """
+    os.makedirs(cube_dir, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(cube_dir, f'{name}.npy'), np.ascontiguousarray(cube[name]))
+    metadata = {
+        'format_version': FORMAT_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'source': source,
+        'transactions': cube['transactions'],
+        'unmatched_transactions': cube['unmatched'],
+        'dimensions': {'segment': cube['segments'], 'category': cube['categories'],
+                       'month': cube['months']},
+    }
+    # Metadata last: a directory without it is an incomplete cube
+    with open(os.path.join(cube_dir, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+def load_cube(cube_dir=CUBE_DIR):
+    """
+    Load a cube directory written by save_cube
+
+    Args:
+        cube_dir (str): Cube directory
+
+    Returns:
+        RevenueCube: Loaded cube
+    """
+    with open(os.path.join(cube_dir, 'metadata.json')) as f:
+        metadata = json.load(f)
+    if metadata.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported cube format {metadata.get('format_version')} in '{cube_dir}'")
+    arrays = {name: np.load(os.path.join(cube_dir, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+    return RevenueCube(arrays, metadata)
+
+
+class RevenueCube:
+    """
+    Query API over a loaded cube
+
+    Filters take a label, a list of labels or (for month) a slice of
+    'YYYY-MM' labels with inclusive ends; None means all. Results keep the
+    dimensions listed in `by` and sum over the others.
+
+    Args:
+        arrays (dict): Arrays of ARRAYS
+        metadata (dict): Cube metadata with dimension labels
+    """
+
+    def __init__(self, arrays, metadata):
+        self.arrays = arrays
+        self.metadata = metadata
+        self.labels = {dim: list(metadata['dimensions'][dim]) for dim in DIMENSIONS}
+        self._positions = {dim: {label: i for i, label in enumerate(labels)}
+                           for dim, labels in self.labels.items()}
+
+    @property
+    def shape(self):
+        return tuple(len(self.labels[dim]) for dim in DIMENSIONS)
+
+    def _select(self, dim, selection):
+        """Index array (or full slice) for a dimension filter"""
+        if selection is None:
+            return slice(None)
+        positions = self._positions[dim]
+        if isinstance(selection, slice):
+            start = positions[selection.start] if selection.start is not None else 0
+            stop = positions[selection.stop] + 1 if selection.stop is not None else len(positions)
+            return np.arange(start, stop)
+        if isinstance(selection, str):
+            selection = [selection]
+        try:
+            return np.array([positions[label] for label in selection], dtype=np.intp)
+        except KeyError as e:
+            raise KeyError(f"Unknown {dim} {e.args[0]!r}") from None
+
+    def query(self, measure='revenue', by=('segment',), segment=None, category=None, month=None,
+              as_frame=True):
+        """
+        Aggregate a measure over a slice of the cube
+
+        Args:
+            measure (str): One of MEASURES
+            by (tuple): Dimensions to keep (in DIMENSIONS order)
+            segment, category, month: Filters (see class docstring)
+            as_frame (bool): Return a labelled pandas object; False returns
+                the bare NumPy array (fastest)
+
+        Returns:
+            pd.Series / pd.DataFrame / np.ndarray / scalar: Aggregated measure
+        """
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown measure '{measure}'; expected one of {MEASURES}")
+        by = tuple(dim for dim in DIMENSIONS if dim in ((by,) if isinstance(by, str) else by))
+        filters = {'segment': segment, 'category': category, 'month': month}
+        selections = [self._select(dim, filters[dim]) for dim in DIMENSIONS]
+
+        if measure == 'customers':
+            # Distinct counts only sum across segments: use the array that
+            # already covers every collapsed category/month
+            kept = tuple(dim for dim in DIMENSIONS if dim == 'segment' or dim in by)
+            filtered = [dim for dim in ('category', 'month') if dim not in kept and filters[dim] is not None]
+            if filtered:
+                raise ValueError("Distinct customers cannot be summed over a filtered subset of "
+                                 f"{' / '.join(filtered)}; keep it in 'by' instead")
+            array = self.arrays[CUSTOMER_ROLLUPS[kept]]
+            selections = [selections[DIMENSIONS.index(dim)] for dim in kept]
+        else:
+            kept = DIMENSIONS
+            array = self.arrays[measure]
+
+        values = np.asarray(array)
+        for axis, selection in enumerate(selections):
+            if not isinstance(selection, slice):
+                values = values.take(selection, axis=axis)
+        values = values.sum(axis=tuple(i for i, dim in enumerate(kept) if dim not in by))
+        if not as_frame or not by:
+            return values if by else values.item()
+
+        index = [pd.Index(np.array(self.labels[dim])[selections[kept.index(dim)]], name=dim)
+                 for dim in by]
+        if len(by) == 1:
+            return pd.Series(values, index=index[0], name=measure)
+        if len(by) == 2:
+            return pd.DataFrame(values, index=index[0], columns=index[1])
+        return pd.Series(values.ravel(), index=pd.MultiIndex.from_product(index), name=measure)
+
+    def top_n(self, n=5, measure='revenue', by='category', **filters):
+        """
+        Largest values of a measure along one dimension
+
+        Args:
+            n (int): Number of entries
+            measure (str): One of MEASURES
+            by (str): Dimension to rank
+            **filters: segment / category / month filters
+
+        Returns:
+            pd.Series: Top n labels and values, largest first
+        """
+        return self.query(measure, by=(by,), **filters).nlargest(n)
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Build or query the segment x category x month revenue cube'
+    )
+    parser.add_argument('--cube', type=str, default=CUBE_DIR,
+                        help=f'Cube directory (default: {CUBE_DIR})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Build the cube from transactions and results')
+    build_parser.add_argument('--transactions', type=str, default='ecommerce_transactions.csv',
+                              help='Transaction file (default: ecommerce_transactions.csv)')
+    build_parser.add_argument('--results', type=str, default='rfm_analysis_results.csv',
+                              help='Results file with customer_id and segment '
+                                   '(default: rfm_analysis_results.csv)')
+
+    query_parser = subparsers.add_parser('query', help='Query the cube')
+    query_parser.add_argument('--measure', type=str, default='revenue', choices=MEASURES,
+                              help='Measure (default: revenue)')
+    query_parser.add_argument('--by', type=str, nargs='+', default=['segment'], choices=DIMENSIONS,
+                              help='Dimensions to keep (default: segment)')
+    query_parser.add_argument('--segment', type=str, nargs='+', default=None, help='Segment filter')
+    query_parser.add_argument('--category', type=str, nargs='+', default=None, help='Category filter')
+    query_parser.add_argument('--months', type=str, nargs=2, default=None, metavar=('FROM', 'TO'),
+                              help='Month range, inclusive (YYYY-MM YYYY-MM)')
+    query_parser.add_argument('--top', type=int, default=None,
+                              help='Only the N largest values (single --by dimension)')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print("="*70)
+        print("BUILDING REVENUE CUBE")
+        print("="*70)
+        start = time.perf_counter()
+        rfm_df = read_table(args.results, columns=['customer_id', 'segment'])
+        cube = build_cube(args.transactions, rfm_df)
+        save_cube(cube, args.cube, source=args.transactions)
+        print(f"\n✓ Cube {len(cube['segments'])} segments x {len(cube['categories'])} categories x "
+              f"{len(cube['months'])} months from {cube['transactions']:,} transactions "
+              f"in {time.perf_counter() - start:.2f}s, saved to '{args.cube}'")
+        if cube['unmatched']:
+            print(f"  {cube['unmatched']:,} transactions of customers without a segment were skipped")
+        return
+
+    cube = load_cube(args.cube)
+    month = slice(*args.months) if args.months else None
+    start = time.perf_counter()
+    if args.top:
+        result = cube.top_n(args.top, args.measure, by=args.by[0], segment=args.segment,
+                            category=args.category, month=month)
+    else:
+        result = cube.query(args.measure, by=tuple(args.by), segment=args.segment,
+                            category=args.category, month=month)
+    elapsed = time.perf_counter() - start
+    print(result.round(2) if hasattr(result, 'round') else result)
+    print(f"\n({elapsed * 1e6:.0f} µs)")
+
+
+if __name__ == "__main__":
+    main()
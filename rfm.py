@@ -0,0 +1,307 @@
+"""
+RFM Metrics Engine
+Computes per-customer Recency, Frequency and Monetary values from transactions
+
+Only built-in reductions are used (max date, count, sum), followed by a
+single vectorized date subtraction for recency, so no Python code runs per
+customer. Because the reductions are mergeable, the same metrics can be
+computed out of core from a file read in chunks.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from quantile_sketch import DEFAULT_RELATIVE_ACCURACY, build_sketches, sketch_scores
+from storage import RFM_COLUMNS, iter_table
+
+RFM_METHODS = ('groupby', 'sorted')
+SCORE_BACKENDS = ('qcut', 'sketch')
+
+# All 125 combined scores ('111' ... '555') in rfm_score_index order
+RFM_SCORE_LABELS = [f'{r}{f}{m}' for r in range(1, 6) for f in range(1, 6) for m in range(1, 6)]
+
+
+def default_analysis_date(transactions):
+    """
+    Analysis date used throughout the project: the day after the last transaction
+
+    Args:
+        transactions (pd.DataFrame): Transactions with a transaction_date column
+
+    Returns:
+        pd.Timestamp: Analysis date
+    """
+    return transactions['transaction_date'].max() + timedelta(days=1)
+
+
+def compute_rfm(transactions, analysis_date=None, method='groupby', assume_sorted=False):
+    """
+    Calculate Recency, Frequency and Monetary metrics per customer
+
+    Args:
+        transactions (pd.DataFrame): Transactions with customer_id,
+            transaction_date, transaction_id and total_amount columns
+        analysis_date (datetime): Reference date for recency (default: the
+            day after the last transaction)
+        method (str): 'groupby' uses pandas built-in group reductions;
+            'sorted' sorts by customer once and reduces contiguous runs with
+            np.maximum.reduceat / np.add.reduceat (monetary then agrees with
+            'groupby' up to floating-point summation order)
+        assume_sorted (bool): For the 'sorted' method, skip the sort because
+            rows are already grouped by customer in ascending ID order
+
+    Returns:
+        pd.DataFrame: One row per customer with columns customer_id,
+            recency (days), frequency (transactions) and monetary (revenue),
+            ordered by customer_id
+    """
+    if method not in RFM_METHODS:
+        raise ValueError(f"Unknown RFM method '{method}'; expected one of {RFM_METHODS}")
+
+    if analysis_date is None:
+        analysis_date = default_analysis_date(transactions)
+    analysis_date = pd.Timestamp(analysis_date)
+
+    if method == 'sorted':
+        return _compute_rfm_sorted(transactions, analysis_date, assume_sorted)
+
+    return finalize_rfm(rfm_state(transactions), analysis_date)
+
+
+def rfm_state(transactions):
+    """
+    Per-customer partial RFM state: last purchase date, count and revenue
+
+    All three fields are mergeable reductions, so states computed from
+    separate chunks of transactions can be combined with merge_rfm_states.
+
+    Args:
+        transactions (pd.DataFrame): Transactions with customer_id,
+            transaction_date, transaction_id and total_amount columns
+
+    Returns:
+        pd.DataFrame: Indexed by customer_id with columns last_purchase,
+            frequency and monetary
+    """
+    return transactions.groupby('customer_id', observed=True, sort=True).agg(
+        last_purchase=('transaction_date', 'max'),
+        frequency=('transaction_id', 'count'),
+        monetary=('total_amount', 'sum')
+    )
+
+
+def merge_rfm_states(states):
+    """
+    Combine partial RFM states (max of dates, sum of counts and revenue)
+
+    Args:
+        states (list): States returned by rfm_state or merge_rfm_states
+
+    Returns:
+        pd.DataFrame: Merged state, sorted by customer_id
+    """
+    states = [_plain_index(state) for state in states if len(state)]
+    if not states:
+        return pd.DataFrame({'last_purchase': pd.Series(dtype='datetime64[ns]'),
+                             'frequency': pd.Series(dtype='int64'),
+                             'monetary': pd.Series(dtype='float64')},
+                            index=pd.Index([], name='customer_id'))
+    if len(states) == 1:
+        return states[0].sort_index()
+    return pd.concat(states).groupby(level=0, sort=True).agg(
+        {'last_purchase': 'max', 'frequency': 'sum', 'monetary': 'sum'}
+    )
+
+
+def _plain_index(state):
+    """Drop chunk-specific categorical keys so states from different chunks align"""
+    if isinstance(state.index, pd.CategoricalIndex):
+        state = state.set_axis(state.index.astype(state.index.categories.dtype))
+    return state
+
+
+def finalize_rfm(state, analysis_date):
+    """
+    Turn an RFM state into the rfm_df layout used by the analysis scripts
+
+    Args:
+        state (pd.DataFrame): Output of rfm_state or merge_rfm_states
+        analysis_date (datetime): Reference date for recency
+
+    Returns:
+        pd.DataFrame: Columns customer_id, recency, frequency, monetary
+    """
+    return pd.DataFrame({
+        'customer_id': state.index,
+        'recency': (pd.Timestamp(analysis_date) - state['last_purchase']).dt.days.to_numpy(),
+        'frequency': state['frequency'].to_numpy(),
+        'monetary': state['monetary'].to_numpy(),
+    })
+
+
+def aggregate_rfm_chunked(path, chunksize=1_000_000, fmt=None):
+    """
+    Build the RFM state of a transaction file too large to load at once
+
+    The file is read in chunks of rows; each chunk is reduced to a partial
+    state and partials are folded together whenever they outgrow the
+    running state, so peak memory follows the number of customers rather
+    than the number of transactions.
+
+    Args:
+        path (str): Transaction file (CSV, Parquet or Feather)
+        chunksize (int): Rows per chunk
+        fmt (str): Explicit storage format overriding the extension
+
+    Returns:
+        pd.DataFrame: Merged RFM state for all customers
+    """
+    state = merge_rfm_states([])
+    pending, pending_rows = [], 0
+
+    for chunk in iter_table(path, columns=RFM_COLUMNS, chunksize=chunksize, fmt=fmt):
+        partial = rfm_state(chunk)
+        pending.append(partial)
+        pending_rows += len(partial)
+        if pending_rows >= max(len(state), chunksize):
+            state = merge_rfm_states([state] + pending)
+            pending, pending_rows = [], 0
+
+    return merge_rfm_states([state] + pending)
+
+
+def compute_rfm_chunked(path, analysis_date=None, chunksize=1_000_000, fmt=None):
+    """
+    Out-of-core equivalent of compute_rfm for a transaction file
+
+    Recency and frequency match compute_rfm exactly; monetary matches up to
+    floating-point summation order, since chunk sums are added together.
+
+    Args:
+        path (str): Transaction file (CSV, Parquet or Feather)
+        analysis_date (datetime): Reference date for recency (default: the
+            day after the last transaction)
+        chunksize (int): Rows per chunk
+        fmt (str): Explicit storage format overriding the extension
+
+    Returns:
+        pd.DataFrame: Columns customer_id, recency, frequency, monetary
+    """
+    state = aggregate_rfm_chunked(path, chunksize=chunksize, fmt=fmt)
+    if analysis_date is None:
+        analysis_date = state['last_purchase'].max() + timedelta(days=1)
+    return finalize_rfm(state, analysis_date)
+
+
+def customer_codes(customer_ids):
+    """
+    Integer codes for customer IDs, in the order groupby sorts them
+
+    Args:
+        customer_ids (pd.Series): Customer IDs (categorical or plain)
+
+    Returns:
+        tuple: (codes array, array/Index of IDs indexed by code)
+    """
+    if isinstance(customer_ids.dtype, pd.CategoricalDtype):
+        # Category order is the order groupby reports categorical keys in
+        return customer_ids.cat.codes.to_numpy(), customer_ids.cat.categories
+    codes, uniques = pd.factorize(customer_ids, sort=True)
+    return codes, uniques
+
+
+def _compute_rfm_sorted(transactions, analysis_date, assume_sorted):
+    """Sort-based RFM: one sort, then reductions over contiguous customer runs"""
+    codes, uniques = customer_codes(transactions['customer_id'])
+    dates = transactions['transaction_date'].to_numpy()
+    amounts = transactions['total_amount'].to_numpy()
+    valid_id = transactions['transaction_id'].notna().to_numpy()
+
+    if not assume_sorted:
+        order = np.argsort(codes, kind='stable')
+        codes, dates, amounts, valid_id = codes[order], dates[order], amounts[order], valid_id[order]
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+
+    last_purchase = np.maximum.reduceat(dates, starts)
+    frequency = np.add.reduceat(valid_id.astype(np.int64), starts)
+    monetary = np.add.reduceat(amounts, starts)
+
+    return pd.DataFrame({
+        'customer_id': uniques[codes[starts]],
+        'recency': (analysis_date - pd.DatetimeIndex(last_purchase)).days.to_numpy(dtype=np.int64),
+        'frequency': frequency,
+        'monetary': monetary,
+    })
+
+
+def score_rfm(rfm_df, backend='qcut', sketches=None,
+              relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """
+    Add 1-5 quintile scores and the combined RFM score
+
+    Args:
+        rfm_df (pd.DataFrame): RFM metrics with recency, frequency, monetary
+        backend (str): 'qcut' scores exactly with pd.qcut on the full column;
+            'sketch' uses mergeable quantile sketches (see quantile_sketch.py)
+        sketches (dict): Merged sketches of all shards for the 'sketch'
+            backend (default: sketches of rfm_df itself)
+        relative_accuracy (float): Monetary sketch accuracy when sketches
+            are built here
+
+    Returns:
+        pd.DataFrame: Copy of rfm_df with r_score, f_score, m_score,
+            rfm_score and rfm_score_numeric columns
+    """
+    if backend not in SCORE_BACKENDS:
+        raise ValueError(f"Unknown scoring backend '{backend}'; expected one of {SCORE_BACKENDS}")
+
+    rfm_df = rfm_df.copy()
+
+    if backend == 'qcut':
+        # For Recency: Lower is better, so reverse the score
+        rfm_df['r_score'] = pd.qcut(rfm_df['recency'], q=5, labels=[5, 4, 3, 2, 1], duplicates='drop')
+        # For Frequency and Monetary: Higher is better
+        rfm_df['f_score'] = pd.qcut(rfm_df['frequency'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5], duplicates='drop')
+        rfm_df['m_score'] = pd.qcut(rfm_df['monetary'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5], duplicates='drop')
+    else:
+        if sketches is None:
+            sketches = build_sketches(rfm_df, relative_accuracy)
+        scores = sketch_scores(rfm_df, sketches)
+        for col in ('r_score', 'f_score', 'm_score'):
+            rfm_df[col] = scores[col]
+
+    # Convert to numeric
+    rfm_df['r_score'] = rfm_df['r_score'].astype(int)
+    rfm_df['f_score'] = rfm_df['f_score'].astype(int)
+    rfm_df['m_score'] = rfm_df['m_score'].astype(int)
+
+    # Calculate RFM Score (combined): a categorical over the 125 possible
+    # labels, so no strings are built per customer
+    rfm_df['rfm_score'] = pd.Categorical.from_codes(
+        rfm_score_index(rfm_df['r_score'].to_numpy(), rfm_df['f_score'].to_numpy(),
+                        rfm_df['m_score'].to_numpy()),
+        categories=RFM_SCORE_LABELS
+    )
+    rfm_df['rfm_score_numeric'] = rfm_df['r_score'] + rfm_df['f_score'] + rfm_df['m_score']
+
+    return rfm_df
+
+
+def rfm_score_index(r_score, f_score, m_score):
+    """
+    Position of each score combination in RFM_SCORE_LABELS
+
+    Args:
+        r_score, f_score, m_score (np.ndarray): 1-5 scores
+
+    Returns:
+        np.ndarray: (r-1)*25 + (f-1)*5 + (m-1), in 0-124 (int16)
+    """
+    r_score, f_score, m_score = (np.asarray(s, dtype=np.int16) for s in (r_score, f_score, m_score))
+    return (r_score - 1) * 25 + (f_score - 1) * 5 + (m_score - 1)
@@ -0,0 +1,189 @@
+"""
+Rule-Based RFM Segmentation
+Assigns segments from R/F/M scores through a precomputed 125-entry lookup table
+
+Rules are declarative: an ordered list of segments, each with the score
+ranges it covers. The first matching rule wins and customers matching no
+rule get the default segment. Because there are only 5 x 5 x 5 score
+combinations, the rules are evaluated once per combination and compiled
+into a lookup array indexed by (r-1)*25 + (f-1)*5 + (m-1). Assigning all
+customers is then one integer gather, with no clustering, no per-row
+Python and no string building.
+
+Rules can also be loaded from a JSON file with the same layout as
+DEFAULT_RULES:
+
+    {"default": "Need Attention",
+     "rules": [{"segment": "Champions", "r": [4, 5], "f": [4, 5], "m": [4, 5]}, ...]}
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from rfm import RFM_SCORE_LABELS, rfm_score_index
+
+SCORES = range(1, 6)
+
+# Classic score-based segments, checked in order; ranges are inclusive and
+# a missing score means any value
+DEFAULT_RULES = {
+    'default': 'Need Attention',
+    'rules': [
+        {'segment': 'Champions', 'r': [4, 5], 'f': [4, 5], 'm': [4, 5]},
+        {'segment': 'Loyal Customers', 'r': [3, 5], 'f': [3, 5], 'm': [3, 5]},
+        {'segment': 'Cant Lose Them', 'r': [1, 1], 'f': [4, 5], 'm': [4, 5]},
+        {'segment': 'At Risk', 'r': [1, 2], 'f': [3, 5]},
+        {'segment': 'New Customers', 'r': [5, 5], 'f': [1, 1]},
+        {'segment': 'Potential Loyalists', 'r': [4, 5], 'f': [1, 3]},
+        {'segment': 'Hibernating', 'r': [1, 2], 'f': [1, 2]},
+    ],
+}
+
+
+def _check_range(rule, score):
+    bounds = rule.get(score, [1, 5])
+    if (not isinstance(bounds, (list, tuple)) or len(bounds) != 2
+            or not 1 <= bounds[0] <= bounds[1] <= 5):
+        raise ValueError(f"Rule '{rule.get('segment')}': {score} must be [low, high] "
+                         f"within 1-5, got {bounds!r}")
+    return bounds
+
+
+def compile_rules(rules=DEFAULT_RULES):
+    """
+    Evaluate the rules for all 125 score combinations
+
+    Args:
+        rules (dict): 'rules' list and 'default' segment (see DEFAULT_RULES)
+
+    Returns:
+        tuple: (int8 array of 125 segment codes indexed by
+            rfm_score_index, list of segment names the codes refer to)
+    """
+    default = rules.get('default', 'Need Attention')
+    segments = []
+    for rule in rules['rules']:
+        if 'segment' not in rule:
+            raise ValueError(f"Rule without a 'segment' name: {rule!r}")
+        if rule['segment'] not in segments:
+            segments.append(rule['segment'])
+    if default not in segments:
+        segments.append(default)
+
+    # Score grids in lookup order: r varies slowest, m fastest
+    r, f, m = (grid.ravel() for grid in np.meshgrid(SCORES, SCORES, SCORES, indexing='ij'))
+    lookup = np.full(125, segments.index(default), dtype=np.int8)
+    unassigned = np.ones(125, dtype=bool)
+    for rule in rules['rules']:
+        match = unassigned.copy()
+        for score, values in (('r', r), ('f', f), ('m', m)):
+            low, high = _check_range(rule, score)
+            match &= (values >= low) & (values <= high)
+        lookup[match] = segments.index(rule['segment'])
+        unassigned &= ~match
+    return lookup, segments
+
+
+def load_rules(path):
+    """
+    Read segmentation rules from a JSON file
+
+    Args:
+        path (str): JSON file laid out like DEFAULT_RULES
+
+    Returns:
+        dict: Rules for compile_rules
+    """
+    with open(path) as f:
+        rules = json.load(f)
+    if not isinstance(rules.get('rules'), list):
+        raise ValueError(f"'{path}' must contain a 'rules' list")
+    return rules
+
+
+def assign_rule_segments(rfm_df, rules=DEFAULT_RULES, compiled=None):
+    """
+    Segment customers from their r/f/m scores
+
+    Args:
+        rfm_df (pd.DataFrame): RFM table with r_score, f_score, m_score
+        rules (dict): Rules to compile (ignored if compiled is given)
+        compiled (tuple): Output of compile_rules, to reuse across calls
+
+    Returns:
+        pd.Categorical: Segment of each customer
+    """
+    lookup, segments = compiled if compiled is not None else compile_rules(rules)
+    index = rfm_score_index(rfm_df['r_score'].to_numpy(), rfm_df['f_score'].to_numpy(),
+                            rfm_df['m_score'].to_numpy())
+    return pd.Categorical.from_codes(lookup[index], categories=segments)
+
+
+def rules_table(rules=DEFAULT_RULES):
+    """
+    The compiled lookup as a readable table
+
+    Args:
+        rules (dict): Rules to compile
+
+    Returns:
+        pd.DataFrame: One row per rfm_score with its segment
+    """
+    lookup, segments = compile_rules(rules)
+    return pd.DataFrame({'rfm_score': RFM_SCORE_LABELS,
+                         'segment': np.asarray(segments, dtype=object)[lookup]})
+
+
+def main():
+    """Main execution function"""
+    from storage import read_table, write_table
+
+    parser = argparse.ArgumentParser(
+        description='Assign rule-based RFM segments from r/f/m scores'
+    )
+    parser.add_argument('--input', type=str, default='rfm_analysis_results.csv',
+                        help='File with r_score/f_score/m_score columns '
+                             '(default: rfm_analysis_results.csv)')
+    parser.add_argument('--rules', type=str, default=None,
+                        help='JSON rules file (default: built-in classic rules)')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Optional output file with customer_id and rule_segment')
+    parser.add_argument('--show-table', action='store_true',
+                        help='Print the compiled 125-entry lookup table')
+    args = parser.parse_args()
+
+    rules = load_rules(args.rules) if args.rules else DEFAULT_RULES
+    compiled = compile_rules(rules)
+    if args.show_table:
+        print(rules_table(rules).to_string(index=False))
+
+    rfm_df = read_table(args.input, columns=['customer_id', 'r_score', 'f_score', 'm_score', 'monetary'])
+    start = time.perf_counter()
+    segments = assign_rule_segments(rfm_df, compiled=compiled)
+    elapsed = time.perf_counter() - start
+
+    print("="*70)
+    print("RULE-BASED SEGMENTATION")
+    print("="*70)
+    print(f"\nAssigned {len(rfm_df):,} customers in {elapsed * 1000:.2f} ms")
+    summary = pd.DataFrame({'segment': segments, 'monetary': rfm_df['monetary']}).groupby(
+        'segment', observed=False).agg(customer_count=('monetary', 'size'), total_revenue=('monetary', 'sum'))
+    summary['pct_customers'] = (summary['customer_count'] / len(rfm_df) * 100).round(2)
+    summary['pct_revenue'] = (summary['total_revenue'] / rfm_df['monetary'].sum() * 100).round(2)
+    print(summary.sort_values('pct_revenue', ascending=False))
+
+    if args.output:
+        write_table(pd.DataFrame({'customer_id': rfm_df['customer_id'], 'rule_segment': segments}),
+                    args.output)
+        print(f"\n✓ Rule segments saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+RFM Snapshot History and Segment Migration
+Computes RFM as of many dates in one sweep and tracks segment transitions
+
+Transactions are sorted once by (customer, date). With the sorted keys
+customer * 2^32 + day and running totals of amounts, the RFM of every
+customer as of a date d (transactions strictly before d, matching the
+scripts' analysis date convention) is one vectorized np.searchsorted per
+customer:
+
+    frequency = pos(d) - start
+    monetary  = cumsum[pos(d)] - cumsum[start]
+    recency   = d - day[pos(d) - 1]
+
+so each snapshot costs O(customers x log transactions) with no further
+pass over the transactions. Running totals are kept in integer cents, so
+monetary is exact; it can differ from compute_rfm's floating-point sums
+in the last bit, which only matters for a value lying exactly on a score
+cut point. Every snapshot is scored and segmented with
+one fixed stored model (segmentation_model.py), so segments are
+comparable over time, and consecutive snapshots give segment-to-segment
+transition matrices. Customers with no purchase before a snapshot date
+are in the state NOT_ACTIVE.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from compact_schema import to_cents, to_days
+from rfm import customer_codes
+from segmentation_model import MODEL_DIR, load_model
+from storage import RFM_COLUMNS, read_transactions, write_table
+
+NOT_ACTIVE = 'Not Active Yet'
+DEFAULT_MONTHS = 36
+
+_DAY_BITS = 32
+
+
+def _days(dates):
+    return to_days(dates).astype(np.int64)
+
+
+class SnapshotEngine:
+    """
+    Transactions sorted once for RFM as of any date
+
+    Args:
+        transactions (pd.DataFrame): Transactions with customer_id,
+            transaction_date and total_amount
+    """
+
+    def __init__(self, transactions):
+        codes, self.customer_ids = customer_codes(transactions['customer_id'])
+        codes = np.asarray(codes, dtype=np.int64)
+        days = _days(transactions['transaction_date'].to_numpy())
+        keys = (codes << _DAY_BITS) | days
+        order = np.argsort(keys, kind='stable')
+
+        self.keys = keys[order]
+        self.days = days[order]
+        # Running totals in integer cents: exact differences between any
+        # two positions
+        self.cents = np.concatenate([[0], np.cumsum(to_cents(transactions['total_amount'].to_numpy(),
+                                                             np.int64)[order])])
+        self.num_customers = len(self.customer_ids)
+        self.codes = np.arange(self.num_customers, dtype=np.int64)
+        self.starts = np.searchsorted(self.keys, self.codes << _DAY_BITS)
+        self.first_day = int(self.days.min())
+        self.last_day = int(self.days.max())
+
+    def default_dates(self, months=DEFAULT_MONTHS):
+        """
+        Monthly snapshot dates: month starts over the last `months` months,
+        ending with the usual analysis date (day after the last transaction)
+
+        Returns:
+            list: pd.Timestamp dates
+        """
+        analysis_date = pd.Timestamp(np.datetime64(self.last_day + 1, 'D'))
+        month_starts = pd.date_range(end=analysis_date, periods=months, freq='MS')
+        dates = [d for d in month_starts if d < analysis_date] + [analysis_date]
+        return dates[-months:]
+
+    def rfm_as_of(self, date):
+        """
+        RFM metrics of every customer as of a date
+
+        Args:
+            date (datetime): Analysis date; transactions before it count
+
+        Returns:
+            tuple: (active mask over all customers, recency, frequency,
+                monetary arrays for the active customers)
+        """
+        day = int(_days([pd.Timestamp(date).to_datetime64()])[0])
+        ends = np.searchsorted(self.keys, (self.codes << _DAY_BITS) | day, side='left')
+        frequency = ends - self.starts
+        active = frequency > 0
+        starts, ends = self.starts[active], ends[active]
+        recency = day - self.days[ends - 1]
+        monetary = (self.cents[ends] - self.cents[starts]) / 100
+        return active, recency, frequency[active], monetary
+
+    def rfm_frame(self, date):
+        """rfm_as_of in the usual rfm_df layout (active customers only)"""
+        active, recency, frequency, monetary = self.rfm_as_of(date)
+        return pd.DataFrame({'customer_id': self.customer_ids[active], 'recency': recency,
+                             'frequency': frequency, 'monetary': monetary})
+
+
+def run_snapshots(engine, dates, model, keep_rows=False):
+    """
+    Score and segment every customer at every snapshot date
+
+    Args:
+        engine (SnapshotEngine): Sorted transactions
+        dates (list): Snapshot dates in increasing order
+        model (SegmentationModel): Fixed model all snapshots are scored with
+        keep_rows (bool): Also return the per-customer rows of every snapshot
+
+    Returns:
+        dict: 'states' ((customers, snapshots) int16 codes into 'labels',
+            NOT_ACTIVE last), 'labels', 'dates', 'counts' (segment counts
+            per snapshot) and optionally 'rows' (long table)
+    """
+    labels = list(model.segments) + [NOT_ACTIVE]
+    not_active = len(labels) - 1
+    states = np.full((engine.num_customers, len(dates)), not_active, dtype=np.int16)
+    rows = []
+    for i, date in enumerate(dates):
+        active, recency, frequency, monetary = engine.rfm_as_of(date)
+        X = np.column_stack([recency, frequency, monetary]).astype(np.float64)
+        clusters = model.assign_clusters(X)
+        states[active, i] = model.cluster_segment[clusters]
+        if keep_rows:
+            scored = model.score(pd.DataFrame({
+                'customer_id': engine.customer_ids[active], 'recency': recency,
+                'frequency': frequency, 'monetary': monetary}))
+            scored.insert(0, 'snapshot_date', pd.Timestamp(date))
+            rows.append(scored)
+
+    counts = pd.DataFrame(
+        np.stack([np.bincount(states[:, i], minlength=len(labels)) for i in range(len(dates))], axis=1),
+        index=pd.Index(labels, name='segment'),
+        columns=pd.Index([pd.Timestamp(d).date() for d in dates], name='snapshot_date'),
+    )
+    result = {'states': states, 'labels': labels, 'dates': list(dates), 'counts': counts}
+    if keep_rows:
+        result['rows'] = pd.concat(rows, ignore_index=True)
+    return result
+
+
+def transition_matrix(from_states, to_states, labels):
+    """
+    Customers moving between segments from one snapshot to the next
+
+    Args:
+        from_states (np.ndarray): State codes at the earlier snapshot
+        to_states (np.ndarray): State codes at the later snapshot
+        labels (list): State labels
+
+    Returns:
+        pd.DataFrame: Counts with rows = from segment, columns = to segment
+    """
+    n = len(labels)
+    counts = np.bincount(from_states.astype(np.int64) * n + to_states, minlength=n * n).reshape(n, n)
+    return pd.DataFrame(counts, index=pd.Index(labels, name='from_segment'),
+                        columns=pd.Index(labels, name='to_segment'))
+
+
+def transition_matrices(history):
+    """
+    Transition matrices between consecutive snapshots
+
+    Args:
+        history (dict): Output of run_snapshots
+
+    Returns:
+        list: (from_date, to_date, matrix) tuples
+    """
+    states, dates, labels = history['states'], history['dates'], history['labels']
+    return [(dates[i], dates[i + 1], transition_matrix(states[:, i], states[:, i + 1], labels))
+            for i in range(len(dates) - 1)]
+
+
+def transitions_table(matrices):
+    """Long table of all transition matrices (nonzero cells)"""
+    frames = []
+    for from_date, to_date, matrix in matrices:
+        long = matrix.stack().rename('customers').reset_index()
+        long.insert(0, 'to_snapshot', pd.Timestamp(to_date).date())
+        long.insert(0, 'from_snapshot', pd.Timestamp(from_date).date())
+        frames.append(long[long['customers'] > 0])
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Monthly RFM snapshots and segment migration with a fixed model'
+    )
+    parser.add_argument('--input', type=str, default='ecommerce_transactions.csv',
+                        help='Transaction file (default: ecommerce_transactions.csv)')
+    parser.add_argument('--model', type=str, default=MODEL_DIR,
+                        help=f'Segmentation model directory (default: {MODEL_DIR})')
+    parser.add_argument('--months', type=int, default=DEFAULT_MONTHS,
+                        help=f'Number of monthly snapshots (default: {DEFAULT_MONTHS})')
+    parser.add_argument('--output-dir', type=str, default='rfm_snapshots',
+                        help='Directory for the output tables (default: rfm_snapshots)')
+    parser.add_argument('--rows', action='store_true',
+                        help='Also write every customer row of every snapshot (snapshots.parquet '
+                             'if pyarrow is available, else CSV)')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("RFM SNAPSHOTS & SEGMENT MIGRATION")
+    print("="*70)
+
+    model = load_model(args.model)
+    start = time.perf_counter()
+    engine = SnapshotEngine(read_transactions(args.input, columns=RFM_COLUMNS))
+    sort_seconds = time.perf_counter() - start
+    dates = engine.default_dates(args.months)
+
+    start = time.perf_counter()
+    history = run_snapshots(engine, dates, model, keep_rows=args.rows)
+    matrices = transition_matrices(history)
+    sweep_seconds = time.perf_counter() - start
+
+    print(f"\n{engine.num_customers:,} customers, {len(engine.keys):,} transactions "
+          f"(loaded and sorted in {sort_seconds:.2f}s)")
+    print(f"{len(dates)} snapshots {pd.Timestamp(dates[0]).date()} .. {pd.Timestamp(dates[-1]).date()} "
+          f"scored with model {model.version} in {sweep_seconds:.2f}s")
+    print("\nCustomers per segment (last 6 snapshots):")
+    print(history['counts'].iloc[:, -6:].to_string())
+    if matrices:
+        from_date, to_date, matrix = matrices[-1]
+        print(f"\nMigration {pd.Timestamp(from_date).date()} -> {pd.Timestamp(to_date).date()}:")
+        print(matrix.to_string())
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    history['counts'].to_csv(os.path.join(args.output_dir, 'segment_counts.csv'))
+    transitions_table(matrices).to_csv(os.path.join(args.output_dir, 'transitions.csv'), index=False)
+    if args.rows:
+        try:
+            import pyarrow  # noqa: F401
+            rows_path = os.path.join(args.output_dir, 'snapshots.parquet')
+        except ImportError:
+            rows_path = os.path.join(args.output_dir, 'snapshots.csv')
+        write_table(history['rows'], rows_path)
+    print(f"\n✓ Snapshot tables saved to '{args.output_dir}'")
+
+
+if __name__ == "__main__":
+    main()
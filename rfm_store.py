@@ -0,0 +1,224 @@
+"""
+Incremental RFM State Store
+Keeps per-customer RFM state on disk and applies daily transaction deltas
+
+The state holds each customer's last purchase date, transaction count and
+cumulative monetary value, plus a watermark: the latest transaction date
+ingested and the highest transaction_id on that date. transaction_ids are
+not assigned in time order, so a transaction is new when its (date, id)
+pair sorts after the watermark. A daily refresh only reads the new
+transactions, merges them into the state and re-derives recency for the
+new analysis date, so it costs O(new transactions + customers) instead of
+a pass over the full history.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import functools
+import json
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from rfm import aggregate_rfm_chunked, finalize_rfm, merge_rfm_states, rfm_state
+from storage import RFM_COLUMNS, iter_table, read_table, read_transactions, write_table
+
+STATE_FILE = 'rfm_state.csv'
+
+
+def _meta_path(state_path):
+    return f"{state_path}.meta.json"
+
+
+def _watermark(transactions):
+    """Latest transaction day and the highest transaction_id on that day"""
+    days = transactions['transaction_date'].dt.normalize()
+    last_day = days.max()
+    return {'transaction_date': last_day,
+            'transaction_id': transactions.loc[days == last_day, 'transaction_id'].max()}
+
+
+def _watermark_key(watermark):
+    return pd.Timestamp(watermark['transaction_date']), int(watermark['transaction_id'])
+
+
+def _later(watermark, other):
+    """The later of two watermarks, ordered by (date, transaction_id)"""
+    return max(watermark, other, key=_watermark_key)
+
+
+def save_state(state, state_path, watermark):
+    """
+    Persist an RFM state and its watermark
+
+    Args:
+        state (pd.DataFrame): RFM state indexed by customer_id
+        state_path (str): State file (.csv, .parquet or .feather)
+        watermark (dict): 'transaction_date' and 'transaction_id' of the
+            newest ingested transaction (see _watermark)
+    """
+    write_table(state.rename_axis('customer_id').reset_index(), state_path)
+    meta = {
+        'watermark_transaction_id': int(watermark['transaction_id']),
+        'watermark_date': str(pd.Timestamp(watermark['transaction_date']).date()),
+        'num_customers': int(len(state)),
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(_meta_path(state_path), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_state(state_path):
+    """
+    Load an RFM state and its metadata
+
+    Args:
+        state_path (str): State file written by save_state
+
+    Returns:
+        tuple: (state DataFrame indexed by customer_id, metadata dict)
+    """
+    state = read_table(state_path).set_index('customer_id')
+    with open(_meta_path(state_path)) as f:
+        meta = json.load(f)
+    return merge_rfm_states([state]), meta
+
+
+def init_state(transactions_path, state_path=STATE_FILE, chunksize=None):
+    """
+    Build the state from the full transaction history
+
+    Args:
+        transactions_path (str): Transaction file
+        state_path (str): State file to write
+        chunksize (int): Read the history in chunks of this many rows
+
+    Returns:
+        dict: Metadata of the written state
+    """
+    if chunksize:
+        state = aggregate_rfm_chunked(transactions_path, chunksize=chunksize)
+        watermarks = [_watermark(chunk) for chunk in iter_table(
+            transactions_path, columns=['transaction_date', 'transaction_id'], chunksize=chunksize)]
+        watermark = functools.reduce(_later, watermarks)
+    else:
+        transactions = read_transactions(transactions_path, columns=RFM_COLUMNS)
+        state = merge_rfm_states([rfm_state(transactions)])
+        watermark = _watermark(transactions)
+
+    save_state(state, state_path, watermark)
+    return load_state(state_path)[1]
+
+
+def update_state(new_transactions, state_path=STATE_FILE):
+    """
+    Merge a delta of new transactions into the stored state
+
+    Transactions whose (date, transaction_id) does not sort after the
+    watermark are skipped, so re-applying the same delta is harmless. A
+    delta is expected to hold whole days: rows of the watermark day with a
+    lower transaction_id count as already ingested.
+
+    Args:
+        new_transactions (pd.DataFrame or str): New transactions, or a file
+        state_path (str): State file to update in place
+
+    Returns:
+        dict: Metadata of the updated state, with 'ingested' and
+            'skipped' rows
+    """
+    state, meta = load_state(state_path)
+    if isinstance(new_transactions, str):
+        new_transactions = read_transactions(new_transactions, columns=RFM_COLUMNS)
+
+    days = new_transactions['transaction_date'].dt.normalize()
+    watermark_day = pd.Timestamp(meta['watermark_date'])
+    is_new = (days > watermark_day) | (
+        (days == watermark_day)
+        & (new_transactions['transaction_id'] > meta['watermark_transaction_id']))
+    fresh = new_transactions[is_new]
+    if len(fresh):
+        state = merge_rfm_states([state, rfm_state(fresh)])
+        save_state(state, state_path, _later(
+            {'transaction_date': watermark_day, 'transaction_id': meta['watermark_transaction_id']},
+            _watermark(fresh)))
+        meta = load_state(state_path)[1]
+
+    meta['ingested'] = int(len(fresh))
+    meta['skipped'] = int(len(new_transactions) - len(fresh))
+    return meta
+
+
+def state_rfm(state_path=STATE_FILE, analysis_date=None):
+    """
+    Derive the rfm_df table from the stored state
+
+    Args:
+        state_path (str): State file
+        analysis_date (datetime): Reference date for recency (default: the
+            day after the watermark date)
+
+    Returns:
+        tuple: (rfm_df with customer_id, recency, frequency, monetary;
+            analysis date used)
+    """
+    state, meta = load_state(state_path)
+    if analysis_date is None:
+        analysis_date = pd.Timestamp(meta['watermark_date']) + timedelta(days=1)
+    analysis_date = pd.Timestamp(analysis_date)
+    return finalize_rfm(state, analysis_date), analysis_date
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Maintain a persisted per-customer RFM state'
+    )
+    parser.add_argument(
+        '--state',
+        type=str,
+        default=STATE_FILE,
+        help=f'State file (default: {STATE_FILE})'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    init_parser = subparsers.add_parser('init', help='Build the state from the full history')
+    init_parser.add_argument('--input', type=str, default='ecommerce_transactions.csv',
+                             help='Transaction file (default: ecommerce_transactions.csv)')
+    init_parser.add_argument('--chunksize', type=int, default=None,
+                             help='Read the history in chunks of this many rows')
+
+    update_parser = subparsers.add_parser('update', help='Apply a file of new transactions')
+    update_parser.add_argument('--input', type=str, required=True,
+                               help='File with the new transactions')
+
+    export_parser = subparsers.add_parser('export', help='Write recency/frequency/monetary')
+    export_parser.add_argument('--output', type=str, default='rfm_metrics.csv',
+                               help='Output file (default: rfm_metrics.csv)')
+    export_parser.add_argument('--analysis-date', type=str, default=None,
+                               help='Analysis date YYYY-MM-DD (default: day after watermark)')
+
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        meta = init_state(args.input, args.state, chunksize=args.chunksize)
+        print(f"✓ State built for {meta['num_customers']:,} customers "
+              f"(watermark: transaction {meta['watermark_transaction_id']:,}, {meta['watermark_date']})")
+    elif args.command == 'update':
+        meta = update_state(args.input, args.state)
+        if meta['skipped']:
+            print(f"Skipped {meta['skipped']:,} transactions already covered by the watermark")
+        print(f"✓ Ingested {meta['ingested']:,} new transactions; "
+              f"{meta['num_customers']:,} customers "
+              f"(watermark: transaction {meta['watermark_transaction_id']:,}, {meta['watermark_date']})")
+    else:
+        rfm_df, analysis_date = state_rfm(args.state, args.analysis_date)
+        write_table(rfm_df, args.output)
+        print(f"✓ RFM metrics for {len(rfm_df):,} customers as of {analysis_date.date()} "
+              f"saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,138 @@
 
 # Now let's create the complete RFM Analysis
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+import os
 import warnings
 warnings.filterwarnings('ignore')
 
+from cluster_stability import print_stability
+from clustering import FEATURES
+from instrumentation import RunReport
+from k_selection import K_RANGE, print_k_results, sampled_silhouette
+from pipeline import (stage_clusters, stage_cube, stage_generate, stage_k_selection, stage_rfm,
+                      stage_scores, stage_segments, stage_stability)
+from report_renderer import aggregate_report, render_report
+from results_diff import diff_results, print_counts, save_delta
+from rfm_rules import DEFAULT_RULES, load_rules
+from stage_cache import CACHE_DIR, StageCache
+from storage import read_table, write_table
+
+# Input/output files: .parquet or .feather paths use the columnar format
+TRANSACTIONS_FILE = 'ecommerce_transactions.csv'
+RESULTS_FILE = 'rfm_analysis_results.csv'
+
+# Set to a number of customers to (re)generate TRANSACTIONS_FILE with
+# data_generation.py as the first pipeline stage
+GENERATE_CUSTOMERS = None
+GENERATION_SEED = 42
+
+# Out-of-core mode: set to a row count to aggregate the transaction file in
+# chunks instead of loading it whole (for files larger than RAM)
+RFM_CHUNK_SIZE = None
+
+# Compact schema (see compact_schema.py): load transactions as int32
+# customer codes, day numbers and integer cents, about 4x smaller than
+# string columns; monetary is then summed exactly in cents. The RFM,
+# score and segment tables keep compact types (customer codes behind a
+# categorical customer_id, int16/int8 metrics, scores and clusters) until
+# the results are written. SQLite files keep the in-database RFM query and
+# INDEX_DIR its single sort; their RFM table is then converted to the
+# compact types
+COMPACT_SCHEMA = True
+
+# Per-customer transaction index (see transaction_index.py): set to a
+# directory to have the RFM stage sort the transactions (RFM columns) by
+# customer once and save them with offsets there, so any customer's order
+# history is a slice of memory-mapped columns. It loads the whole file, so
+# it is skipped with RFM_CHUNK_SIZE or RFM_STATE_FILE
+INDEX_DIR = None
+
+# Incremental mode: path of a state file maintained with rfm_store.py; the
+# metrics are then derived from the stored state instead of the history
+RFM_STATE_FILE = None
+
+# Quintile scoring: 'qcut' (exact) or 'sketch' (mergeable quantile sketches)
+SCORE_BACKEND = 'qcut'
+
+# Segmentation mode: 'kmeans' clusters the scaled RFM metrics and names
+# the clusters; 'rules' maps r/f/m scores to segments through the rule
+# lookup table in rfm_rules.py (optionally loaded from RULES_FILE, a JSON
+# file) and skips clustering entirely
+SEGMENTATION_MODE = 'kmeans'
+RULES_FILE = None
+
+# Criterion for choosing the number of clusters (see k_selection.py):
+# 'silhouette' (sampled, with confidence interval), 'simplified_silhouette',
+# 'davies_bouldin' or 'calinski_harabasz'
+K_SELECTION_METRIC = 'silhouette'
+
+# Clustering engine: 'kmeans' (full batch) or 'minibatch' (streaming
+# partial_fit over chunks of customers, see clustering.py)
+CLUSTER_ENGINE = 'kmeans'
+RANDOM_STATE = 42
+
+# Cluster stability (see cluster_stability.py): number of K-Means refits on
+# bootstrap resamples of the customers, run across a process pool; reports
+# per-cluster Jaccard stability and ARI against the fit above, saves the
+# table to STABILITY_FILE and adds each customer's assignment_confidence to
+# the results. Each refit costs about as much as the clustering stage, so
+# it is off by default (None); e.g. 50 to run it
+STABILITY_REPLICATES = None
+STABILITY_FILE = 'cluster_stability.csv'
+
+# Segment x category x month revenue cube for dashboard queries (see
+# revenue_cube.py); None skips building it
+CUBE_DIR = 'revenue_cube'
+
+# Segmentation charts (see report_renderer.py): drawn headlessly from binned
+# aggregates of the results, so the cost does not grow with the customer
+# count; PNG files go to REPORT_DIR. None skips them
+REPORT_DIR = 'visualizations'
+
+# Change-data capture for the CRM sync (see results_diff.py): customers
+# inserted, removed or changed since the previous RESULTS_FILE are written
+# to DELTA_FILE with summary counts; None disables it
+DELTA_FILE = 'rfm_results_delta.csv'
+
+# Stage cache (see stage_cache.py and pipeline.py): unchanged stages are
+# loaded from CACHE_DIR instead of recomputed
+USE_CACHE = True
+
+# Instrumentation (see instrumentation.py): per-stage time, peak memory
+# and row counts, printed as a table and saved to RUN_REPORT_FILE (None
+# disables it). MEMORY_MODE 'rss' (Linux) uses the peak resident set size
+# at negligible cost; 'tracemalloc' traces Python/NumPy allocations more
+# precisely but slows allocation-heavy stages such as CSV export
+# several-fold; None skips memory.
+# PROFILE_STAGE runs one stage (e.g. 'clusters') under cProfile.
+RUN_REPORT_FILE = 'run_report.json'
+MEMORY_MODE = 'rss'
+PROFILE_STAGE = None
+
+cache = StageCache(CACHE_DIR, enabled=USE_CACHE)
+run_report = RunReport('script_1', enabled=bool(RUN_REPORT_FILE), memory=MEMORY_MODE,
+                       profile_stage=PROFILE_STAGE)
+
 print("="*70)
 print("RFM ANALYSIS & CUSTOMER SEGMENTATION")
 print("="*70)
 
-# Load the data
-df = pd.read_csv('ecommerce_transactions.csv')
-df['transaction_date'] = pd.to_datetime(df['transaction_date'])
-
-# Set analysis date (day after last transaction)
-ANALYSIS_DATE = df['transaction_date'].max() + timedelta(days=1)
+if GENERATE_CUSTOMERS:
+    with run_report.stage('generate', rows_in=GENERATE_CUSTOMERS):
+        stage_generate(cache, TRANSACTIONS_FILE, GENERATE_CUSTOMERS, GENERATION_SEED)
+
+# Calculate RFM Metrics (analysis date: day after last transaction)
+with run_report.stage('rfm') as stage:
+    rfm = stage_rfm(cache, TRANSACTIONS_FILE, chunk_size=RFM_CHUNK_SIZE, state_file=RFM_STATE_FILE,
+                    compact=COMPACT_SCHEMA, index_dir=INDEX_DIR)
+    ANALYSIS_DATE = rfm.value['analysis_date']
+    rfm_df = rfm.value['rfm_df']
+    stage.rows_out = len(rfm_df)
 print(f"\nAnalysis Date: {ANALYSIS_DATE.date()}")
 
-# Calculate RFM Metrics
 print("\n" + "="*70)
 print("STEP 1: CALCULATING RFM METRICS")
 print("="*70)
 
-rfm_df = df.groupby('customer_id').agg({
-    'transaction_date': lambda x: (ANALYSIS_DATE - x.max()).days,  # Recency
-    'transaction_id': 'count',  # Frequency
-    'total_amount': 'sum'  # Monetary
-}).reset_index()
-
-rfm_df.columns = ['customer_id', 'recency', 'frequency', 'monetary']
-
 print(f"\nRFM Metrics calculated for {len(rfm_df)} customers")
 print("\nRFM Statistics:")
 print(rfm_df[['recency', 'frequency', 'monetary']].describe())
@@ -43,132 +142,76 @@ print("\n" + "="*70)
 print("STEP 2: CALCULATING RFM SCORES (1-5 Scale)")
 print("="*70)
 
-# For Recency: Lower is better, so reverse the score
-rfm_df['r_score'] = pd.qcut(rfm_df['recency'], q=5, labels=[5, 4, 3, 2, 1], duplicates='drop')
-# For Frequency and Monetary: Higher is better
-rfm_df['f_score'] = pd.qcut(rfm_df['frequency'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5], duplicates='drop')
-rfm_df['m_score'] = pd.qcut(rfm_df['monetary'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5], duplicates='drop')
-
-# Convert to numeric
-rfm_df['r_score'] = rfm_df['r_score'].astype(int)
-rfm_df['f_score'] = rfm_df['f_score'].astype(int)
-rfm_df['m_score'] = rfm_df['m_score'].astype(int)
-
-# Calculate RFM Score (combined)
-rfm_df['rfm_score'] = rfm_df['r_score'].astype(str) + rfm_df['f_score'].astype(str) + rfm_df['m_score'].astype(str)
-rfm_df['rfm_score_numeric'] = rfm_df['r_score'] + rfm_df['f_score'] + rfm_df['m_score']
+with run_report.stage('scores', rows_in=len(rfm_df)):
+    scores = stage_scores(cache, rfm, backend=SCORE_BACKEND, compact=COMPACT_SCHEMA)
+    rfm_df = scores.value
 
 print("\nRFM Scores calculated!")
 print("\nSample RFM Scores:")
 print(rfm_df[['customer_id', 'recency', 'frequency', 'monetary', 'r_score', 'f_score', 'm_score', 'rfm_score']].head(10))
 
-# K-Means Clustering
-print("\n" + "="*70)
-print("STEP 3: K-MEANS CLUSTERING")
-print("="*70)
-
-# Prepare data for clustering
-X = rfm_df[['recency', 'frequency', 'monetary']].values
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
-
-# Find optimal number of clusters using elbow method
-print("\nFinding optimal number of clusters...")
-inertias = []
-silhouette_scores = []
-K_range = range(3, 11)
-
-for k in K_range:
-    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-    kmeans.fit(X_scaled)
-    inertias.append(kmeans.inertia_)
-    silhouette_scores.append(silhouette_score(X_scaled, kmeans.labels_))
-
-print("\nCluster Evaluation Metrics:")
-for k, inertia, sil_score in zip(K_range, inertias, silhouette_scores):
-    print(f"  K={k}: Inertia={inertia:.2f}, Silhouette Score={sil_score:.4f}")
-
-# Use 8 clusters (based on research and silhouette score)
-OPTIMAL_CLUSTERS = 8
-print(f"\n✓ Selected {OPTIMAL_CLUSTERS} clusters for segmentation")
-
-# Perform final clustering
-kmeans_final = KMeans(n_clusters=OPTIMAL_CLUSTERS, random_state=42, n_init=10)
-rfm_df['cluster'] = kmeans_final.fit_predict(X_scaled)
-
-print(f"\nClustering complete!")
-print(f"Silhouette Score: {silhouette_score(X_scaled, rfm_df['cluster']):.4f}")
-
-# Analyze clusters
-print("\n" + "="*70)
-print("STEP 4: CLUSTER ANALYSIS")
-print("="*70)
-
-cluster_summary = rfm_df.groupby('cluster').agg({
-    'recency': 'mean',
-    'frequency': 'mean',
-    'monetary': 'mean',
-    'customer_id': 'count'
-}).round(2)
-
-cluster_summary.columns = ['avg_recency', 'avg_frequency', 'avg_monetary', 'customer_count']
-cluster_summary['pct_customers'] = (cluster_summary['customer_count'] / len(rfm_df) * 100).round(2)
-cluster_summary['total_revenue'] = rfm_df.groupby('cluster')['monetary'].sum().round(2)
-cluster_summary['pct_revenue'] = (cluster_summary['total_revenue'] / rfm_df['monetary'].sum() * 100).round(2)
-
-print("\nCluster Summary:")
-print(cluster_summary)
-
-# Assign segment names based on RFM characteristics
-def assign_segment_name(row):
-    """Assign strategic segment names based on cluster characteristics"""
-    r, f, m = row['avg_recency'], row['avg_frequency'], row['avg_monetary']
-    
-    # Calculate relative scores (compared to overall means)
-    r_mean, f_mean, m_mean = rfm_df['recency'].mean(), rfm_df['frequency'].mean(), rfm_df['monetary'].mean()
-    
-    if r < r_mean * 0.5 and f > f_mean * 1.5 and m > m_mean * 1.5:
-        return 'Champions'
-    elif r < r_mean and f > f_mean and m > m_mean:
-        return 'Loyal Customers'
-    elif r < r_mean * 0.7 and f < f_mean * 0.5:
-        return 'New Customers'
-    elif r < r_mean and f > f_mean * 0.8:
-        return 'Potential Loyalists'
-    elif r > r_mean * 1.5 and f > f_mean and m > m_mean:
-        return 'At Risk'
-    elif r > r_mean * 2 and f > f_mean * 1.2:
-        return 'Cant Lose Them'
-    elif r > r_mean * 1.5 and m < m_mean:
-        return 'Hibernating'
-    else:
-        return 'Need Attention'
-
-# Create segment mapping
-segment_mapping = {}
-for cluster_id in cluster_summary.index:
-    cluster_data = cluster_summary.loc[cluster_id]
-    segment_name = assign_segment_name(cluster_data)
-    segment_mapping[cluster_id] = segment_name
-
-rfm_df['segment'] = rfm_df['cluster'].map(segment_mapping)
+if SEGMENTATION_MODE == 'kmeans':
+    # K-Means Clustering
+    print("\n" + "="*70)
+    print("STEP 3: K-MEANS CLUSTERING")
+    print("="*70)
+
+    # Find optimal number of clusters, evaluating each K in a worker process
+    print("\nFinding optimal number of clusters...")
+    with run_report.stage('k_selection', rows_in=len(rfm_df)):
+        k_selection = stage_k_selection(cache, rfm, K_RANGE, metric=K_SELECTION_METRIC,
+                                        random_state=RANDOM_STATE)
+    OPTIMAL_CLUSTERS = k_selection.value['best_k']
+
+    print_k_results(k_selection.value['results'], K_SELECTION_METRIC)
+    print(f"\n✓ Selected {OPTIMAL_CLUSTERS} clusters for segmentation")
+
+    # Perform final clustering
+    with run_report.stage('clusters', rows_in=len(rfm_df)):
+        clusters = stage_clusters(cache, rfm, OPTIMAL_CLUSTERS, engine=CLUSTER_ENGINE,
+                                  random_state=RANDOM_STATE)
+    with run_report.stage('segments', rows_in=len(rfm_df)):
+        segments = stage_segments(cache, scores, clusters, mode='kmeans', compact=COMPACT_SCHEMA)
+        rfm_df = segments.value['rfm_df']
+
+    with run_report.stage('silhouette', rows_in=len(rfm_df)):
+        X_scaled = clusters.value['scaler'].transform(rfm_df[FEATURES].to_numpy())
+        silhouette = sampled_silhouette(X_scaled, rfm_df['cluster'].to_numpy())[0]
+    print(f"\nClustering complete!")
+    print(f"Silhouette Score (sampled): {silhouette:.4f}")
+
+    if STABILITY_REPLICATES:
+        with run_report.stage('stability', rows_in=len(rfm_df)):
+            stability = stage_stability(cache, rfm, clusters, STABILITY_REPLICATES,
+                                        random_state=RANDOM_STATE)
+        print_stability(stability.value, segments.value['segment_mapping'])
+        rfm_df = rfm_df.assign(assignment_confidence=stability.value['confidence'])
+
+    # Analyze clusters
+    print("\n" + "="*70)
+    print("STEP 4: CLUSTER ANALYSIS")
+    print("="*70)
+
+    cluster_summary = segments.value['cluster_summary']
+    print("\nCluster Summary:")
+    print(cluster_summary)
+else:
+    # Rule-based segments straight from the scores (see rfm_rules.py)
+    print("\n" + "="*70)
+    print("STEP 3: RULE-BASED SEGMENTATION")
+    print("="*70)
+
+    rules = load_rules(RULES_FILE) if RULES_FILE else DEFAULT_RULES
+    with run_report.stage('segments', rows_in=len(rfm_df)):
+        segments = stage_segments(cache, scores, mode='rules', rules=rules, compact=COMPACT_SCHEMA)
+        rfm_df = segments.value['rfm_df']
+    print(f"\n✓ Assigned {len(rfm_df)} customers to {rfm_df['segment'].nunique()} rule-based segments")
 
 print("\n" + "="*70)
 print("STEP 5: SEGMENT NAMING & PROFILING")
 print("="*70)
 
-segment_summary = rfm_df.groupby('segment').agg({
-    'recency': 'mean',
-    'frequency': 'mean',
-    'monetary': 'mean',
-    'customer_id': 'count'
-}).round(2)
-
-segment_summary.columns = ['avg_recency_days', 'avg_frequency', 'avg_monetary_value', 'customer_count']
-segment_summary['pct_customers'] = (segment_summary['customer_count'] / len(rfm_df) * 100).round(2)
-segment_summary['total_revenue'] = rfm_df.groupby('segment')['monetary'].sum().round(2)
-segment_summary['pct_revenue'] = (segment_summary['total_revenue'] / rfm_df['monetary'].sum() * 100).round(2)
-segment_summary = segment_summary.sort_values('pct_revenue', ascending=False)
+segment_summary = segments.value['segment_summary']
 
 print("\nSegment Profiles:")
 print(segment_summary)
@@ -187,15 +230,58 @@ print(f"\n🏆 Highest value segment: {segment_summary.index[0]}")
 print(f"   - {segment_summary.loc[segment_summary.index[0], 'customer_count']} customers ({segment_summary.loc[segment_summary.index[0], 'pct_customers']:.1f}%)")
 print(f"   - ${segment_summary.loc[segment_summary.index[0], 'total_revenue']:,.0f} revenue ({segment_summary.loc[segment_summary.index[0], 'pct_revenue']:.1f}%)")
 
+# Previous run's results, diffed against this run for DELTA_FILE
+previous_results = None
+if DELTA_FILE and os.path.exists(RESULTS_FILE):
+    with run_report.stage('load_previous'):
+        previous_results = read_table(RESULTS_FILE)
+
 # Save results
-rfm_df.to_csv('rfm_analysis_results.csv', index=False)
-segment_summary.to_csv('segment_summary.csv')
-cluster_summary.to_csv('cluster_summary.csv')
+with run_report.stage('export', rows_in=len(rfm_df)):
+    write_table(rfm_df, RESULTS_FILE)
+    segment_summary.to_csv('segment_summary.csv')
+    if SEGMENTATION_MODE == 'kmeans':
+        cluster_summary.to_csv('cluster_summary.csv')
+        if STABILITY_REPLICATES:
+            write_table(stability.value['clusters'], STABILITY_FILE)
+if previous_results is not None:
+    with run_report.stage('delta', rows_in=len(rfm_df)) as stage:
+        delta, delta_counts = diff_results(previous_results, rfm_df)
+        save_delta(delta, delta_counts, DELTA_FILE)
+        stage.rows_out = len(delta)
+    print_counts(delta_counts)
+if CUBE_DIR:
+    with run_report.stage('cube'):
+        stage_cube(cache, TRANSACTIONS_FILE, segments, CUBE_DIR)
+if REPORT_DIR:
+    with run_report.stage('report', rows_in=len(rfm_df)):
+        if SEGMENTATION_MODE == 'kmeans':
+            aggregates = aggregate_report(rfm_df, k_results=k_selection.value['results'],
+                                          selected_k=OPTIMAL_CLUSTERS, k_metric=K_SELECTION_METRIC)
+        else:
+            aggregates = aggregate_report(rfm_df, k_results=[])
+        report = render_report(aggregates, REPORT_DIR)
 
 print("\n" + "="*70)
 print("FILES SAVED")
 print("="*70)
-print("✓ rfm_analysis_results.csv - Complete RFM analysis with segments")
+print(f"✓ {RESULTS_FILE} - Complete RFM analysis with segments")
 print("✓ segment_summary.csv - Segment-level statistics")
-print("✓ cluster_summary.csv - Cluster-level statistics")
+if SEGMENTATION_MODE == 'kmeans':
+    print("✓ cluster_summary.csv - Cluster-level statistics")
+    if STABILITY_REPLICATES:
+        print(f"✓ {STABILITY_FILE} - Per-cluster bootstrap stability")
+if previous_results is not None:
+    print(f"✓ {DELTA_FILE} - Customers changed since the previous run")
+if CUBE_DIR:
+    print(f"✓ {CUBE_DIR}/ - Segment x category x month revenue cube")
+if REPORT_DIR:
+    print(f"✓ {REPORT_DIR}/ - {len(report)} segmentation charts")
+if INDEX_DIR and not (RFM_CHUNK_SIZE or RFM_STATE_FILE):
+    print(f"✓ {INDEX_DIR}/ - Per-customer transaction index (transaction_index.py history)")
+cache.print_report()
+run_report.print_summary()
+if RUN_REPORT_FILE:
+    run_report.save(RUN_REPORT_FILE)
+    print(f"✓ {RUN_REPORT_FILE} - Stage timings and memory")
 print("\n✓ RFM Analysis Complete!")
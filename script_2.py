@@ -1,106 +1,123 @@
 
 # Reload and perform RFM analysis
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+import os
 import warnings
 warnings.filterwarnings('ignore')
 
-print("Loading transaction data...")
-df = pd.read_csv('ecommerce_transactions.csv')
-df['transaction_date'] = pd.to_datetime(df['transaction_date'])
-
-# Set analysis date
-ANALYSIS_DATE = df['transaction_date'].max() + timedelta(days=1)
-
-# Calculate RFM Metrics
-rfm_df = df.groupby('customer_id').agg({
-    'transaction_date': lambda x: (ANALYSIS_DATE - x.max()).days,
-    'transaction_id': 'count',
-    'total_amount': 'sum'
-}).reset_index()
+from instrumentation import RunReport
+from pipeline import segment_summary_table, stage_clusters, stage_rfm, stage_scores, stage_segments
+from results_diff import diff_results, print_counts, save_delta
+from rfm_rules import DEFAULT_RULES, load_rules
+from segmentation_model import build_model, load_model, model_exists, save_model
+from stage_cache import CACHE_DIR, StageCache
+from storage import read_table, write_table
+
+# Input/output files: .parquet or .feather paths use the columnar format
+TRANSACTIONS_FILE = 'ecommerce_transactions.csv'
+RESULTS_FILE = 'rfm_analysis_results.csv'
+
+# Clustering engine: 'kmeans' (full batch) or 'minibatch' (streaming)
+CLUSTER_ENGINE = 'kmeans'
+
+# Segmentation mode: 'kmeans' (clusters named by assign_segment_name) or
+# 'rules' (score-based rules from rfm_rules.py or the JSON RULES_FILE;
+# no clustering)
+SEGMENTATION_MODE = 'kmeans'
+RULES_FILE = None
+
+# Stored segmentation model (see segmentation_model.py): when it exists,
+# customers are scored with it instead of refitting, so segment labels stay
+# stable between runs. Set REFIT_MODEL = True to fit and save a new model,
+# or MODEL_DIR = None to always refit without saving.
+MODEL_DIR = 'segmentation_model'
+REFIT_MODEL = False
+
+# Change-data capture for the CRM sync (see results_diff.py): customers
+# inserted, removed or changed since the previous RESULTS_FILE are written
+# to DELTA_FILE with summary counts; None disables it
+DELTA_FILE = 'rfm_results_delta.csv'
+
+# Stage cache (see stage_cache.py): unchanged stages are loaded from
+# CACHE_DIR instead of recomputed
+USE_CACHE = True
+
+# Instrumentation (see instrumentation.py): per-stage time, peak memory
+# ('rss', or 'tracemalloc', which slows CSV export several-fold, or None)
+# and row counts saved to RUN_REPORT_FILE (None disables it);
+# PROFILE_STAGE runs one stage under cProfile
+RUN_REPORT_FILE = 'run_report.json'
+MEMORY_MODE = 'rss'
+PROFILE_STAGE = None
+
+cache = StageCache(CACHE_DIR, enabled=USE_CACHE)
+run_report = RunReport('script_2', enabled=bool(RUN_REPORT_FILE), memory=MEMORY_MODE,
+                       profile_stage=PROFILE_STAGE)
 
-rfm_df.columns = ['customer_id', 'recency', 'frequency', 'monetary']
+print("Loading transaction data...")
+with run_report.stage('rfm') as stage:
+    rfm = stage_rfm(cache, TRANSACTIONS_FILE)
+    ANALYSIS_DATE = rfm.value['analysis_date']
+    stage.rows_out = len(rfm.value['rfm_df'])
 
 # Calculate RFM Scores
-rfm_df['r_score'] = pd.qcut(rfm_df['recency'], q=5, labels=[5, 4, 3, 2, 1], duplicates='drop')
-rfm_df['f_score'] = pd.qcut(rfm_df['frequency'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5], duplicates='drop')
-rfm_df['m_score'] = pd.qcut(rfm_df['monetary'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5], duplicates='drop')
-
-rfm_df['r_score'] = rfm_df['r_score'].astype(int)
-rfm_df['f_score'] = rfm_df['f_score'].astype(int)
-rfm_df['m_score'] = rfm_df['m_score'].astype(int)
-
-rfm_df['rfm_score'] = rfm_df['r_score'].astype(str) + rfm_df['f_score'].astype(str) + rfm_df['m_score'].astype(str)
-rfm_df['rfm_score_numeric'] = rfm_df['r_score'] + rfm_df['f_score'] + rfm_df['m_score']
-
-# K-Means Clustering
-X = rfm_df[['recency', 'frequency', 'monetary']].values
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
-
-# Perform clustering with 8 clusters
-kmeans = KMeans(n_clusters=8, random_state=42, n_init=10)
-rfm_df['cluster'] = kmeans.fit_predict(X_scaled)
-
-# Assign segment names
-def assign_segment_name(row):
-    r, f, m = row['avg_recency'], row['avg_frequency'], row['avg_monetary']
-    r_mean, f_mean, m_mean = rfm_df['recency'].mean(), rfm_df['frequency'].mean(), rfm_df['monetary'].mean()
-    
-    if r < r_mean * 0.5 and f > f_mean * 1.5 and m > m_mean * 1.5:
-        return 'Champions'
-    elif r < r_mean and f > f_mean and m > m_mean:
-        return 'Loyal Customers'
-    elif r < r_mean * 0.7 and f < f_mean * 0.5:
-        return 'New Customers'
-    elif r < r_mean and f > f_mean * 0.8:
-        return 'Potential Loyalists'
-    elif r > r_mean * 1.5 and f > f_mean and m > m_mean:
-        return 'At Risk'
-    elif r > r_mean * 2 and f > f_mean * 1.2:
-        return 'Cant Lose Them'
-    elif r > r_mean * 1.5 and m < m_mean:
-        return 'Hibernating'
-    else:
-        return 'Need Attention'
-
-cluster_summary = rfm_df.groupby('cluster').agg({
-    'recency': 'mean',
-    'frequency': 'mean',
-    'monetary': 'mean',
-    'customer_id': 'count'
-}).round(2)
-cluster_summary.columns = ['avg_recency', 'avg_frequency', 'avg_monetary', 'customer_count']
-
-segment_mapping = {}
-for cluster_id in cluster_summary.index:
-    segment_name = assign_segment_name(cluster_summary.loc[cluster_id])
-    segment_mapping[cluster_id] = segment_name
-
-rfm_df['segment'] = rfm_df['cluster'].map(segment_mapping)
+with run_report.stage('scores', rows_in=stage.rows_out):
+    scores = stage_scores(cache, rfm)
+
+if SEGMENTATION_MODE == 'rules':
+    # Segments straight from the scores through the rule lookup table
+    with run_report.stage('segments', rows_in=len(scores.value)):
+        segments = stage_segments(cache, scores, mode='rules',
+                                  rules=load_rules(RULES_FILE) if RULES_FILE else DEFAULT_RULES)
+        rfm_df = segments.value['rfm_df']
+elif MODEL_DIR and model_exists(MODEL_DIR) and not REFIT_MODEL:
+    # Assign clusters and segments with the stored model: no refitting,
+    # stable segment labels. Scores stay relative to this population.
+    with run_report.stage('segments', rows_in=len(scores.value)):
+        model = load_model(MODEL_DIR)
+        rfm_df = scores.value.copy()
+        rfm_df['cluster'], rfm_df['segment'] = model.assign_segments(
+            rfm_df[['recency', 'frequency', 'monetary']].to_numpy())
+    print(f"Scored with stored segmentation model {model.version} "
+          f"(fitted {model.analysis_date.date()})")
+else:
+    # Perform clustering with 8 clusters on scaled RFM features
+    with run_report.stage('clusters', rows_in=len(scores.value)):
+        clusters = stage_clusters(cache, rfm, n_clusters=8, engine=CLUSTER_ENGINE)
+    with run_report.stage('segments', rows_in=len(scores.value)):
+        segments = stage_segments(cache, scores, clusters, mode='kmeans')
+        rfm_df = segments.value['rfm_df']
+
+    if MODEL_DIR:
+        version = save_model(build_model(rfm_df, clusters.value['scaler'],
+                                         clusters.value['model'].cluster_centers_,
+                                         segments.value['segment_mapping'], ANALYSIS_DATE), MODEL_DIR)
+        print(f"Segmentation model {version} saved to '{MODEL_DIR}'")
+
+# Previous run's results, diffed against this run for DELTA_FILE
+previous_results = None
+if DELTA_FILE and os.path.exists(RESULTS_FILE):
+    with run_report.stage('load_previous'):
+        previous_results = read_table(RESULTS_FILE)
 
 # Save results
-rfm_df.to_csv('rfm_analysis_results.csv', index=False)
-
-segment_summary = rfm_df.groupby('segment').agg({
-    'recency': 'mean',
-    'frequency': 'mean',
-    'monetary': 'mean',
-    'customer_id': 'count'
-}).round(2)
-segment_summary.columns = ['avg_recency_days', 'avg_frequency', 'avg_monetary_value', 'customer_count']
-segment_summary['pct_customers'] = (segment_summary['customer_count'] / len(rfm_df) * 100).round(2)
-segment_summary['total_revenue'] = rfm_df.groupby('segment')['monetary'].sum().round(2)
-segment_summary['pct_revenue'] = (segment_summary['total_revenue'] / rfm_df['monetary'].sum() * 100).round(2)
-segment_summary = segment_summary.sort_values('pct_revenue', ascending=False)
-
-segment_summary.to_csv('segment_summary.csv')
+with run_report.stage('export', rows_in=len(rfm_df)):
+    write_table(rfm_df, RESULTS_FILE)
+
+    segment_summary = segment_summary_table(rfm_df)
+    segment_summary.to_csv('segment_summary.csv')
+
+if previous_results is not None:
+    with run_report.stage('delta', rows_in=len(rfm_df)) as stage:
+        delta, delta_counts = diff_results(previous_results, rfm_df)
+        save_delta(delta, delta_counts, DELTA_FILE)
+        stage.rows_out = len(delta)
+    print_counts(delta_counts)
 
 print("✓ Analysis complete!")
 print(f"\nSegments identified:")
 for seg in segment_summary.index:
     print(f"  - {seg}: {segment_summary.loc[seg, 'pct_customers']:.1f}% customers, {segment_summary.loc[seg, 'pct_revenue']:.1f}% revenue")
+cache.print_report()
+run_report.print_summary()
+if RUN_REPORT_FILE:
+    run_report.save(RUN_REPORT_FILE)
@@ -0,0 +1,504 @@
+"""
+Segment Lookup Service
+Serves customer segments over HTTP from the RFM results and the stored model
+
+A small asyncio HTTP/1.1 server (standard library only) for systems that
+need a customer's segment at request time:
+
+    GET  /customers/<customer_id>   one customer's RFM values, scores and segment
+    POST /customers/lookup          {"customer_ids": [...]} bulk lookup
+    POST /score                     {"rows": [[recency, frequency, monetary], ...]}
+                                    segments for raw values, from the stored
+                                    segmentation model's centroids
+    GET  /metrics                   request counts, latency percentiles,
+                                    micro-batch sizes and reload status
+    GET  /health                    liveness and loaded versions
+
+Customer IDs such as 'CUST000123' are indexed by their integer part in a
+sorted NumPy array, so lookups are np.searchsorted over compact columns.
+Concurrent /score requests are coalesced into one vectorized
+nearest-centroid computation per micro-batch. The results file and model
+directory are polled for changes and reloaded in a worker thread; publish
+new files by writing to a temporary name and renaming, so the service
+never reads a half-written file.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from collections import deque
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+
+from segmentation_model import MODEL_DIR, load_model, model_exists
+from storage import read_table
+
+RESULTS_FILE = 'rfm_analysis_results.csv'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+
+# Micro-batching: rows per vectorized scoring call, and how long the first
+# request of a batch waits for others to join
+MAX_BATCH_ROWS = 8192
+MAX_BATCH_DELAY = 0.001
+
+RELOAD_INTERVAL = 2.0
+LATENCY_WINDOW = 10000
+
+RESULT_COLUMNS = ['recency', 'frequency', 'monetary', 'r_score', 'f_score', 'm_score',
+                  'rfm_score', 'cluster', 'segment']
+
+_ID_PATTERN = re.compile(r'^(.*?)(\d+)$')
+# Largest customer number the int64 key array holds
+_MAX_NUMBER = int(np.iinfo(np.int64).max)
+_MAX_DIGITS = len(str(_MAX_NUMBER))
+
+
+def customer_numbers(customer_ids):
+    """
+    Integer part and common prefix of customer IDs such as 'CUST000123'
+
+    Args:
+        customer_ids (array-like): Customer ID strings
+
+    Returns:
+        tuple: (int64 array of the trailing numbers, shared prefix)
+    """
+    parts = pd.Series(np.asarray(customer_ids, dtype=object)).str.extract(r'^(.*?)(\d+)$')
+    if parts[1].isna().any():
+        raise ValueError("Customer IDs must end in digits to be indexed")
+    prefixes = parts[0].unique()
+    if len(prefixes) != 1:
+        raise ValueError(f"Customer IDs use several prefixes: {sorted(prefixes)[:5]}")
+    return parts[1].astype(np.int64).to_numpy(), prefixes[0]
+
+
+class SegmentIndex:
+    """
+    Customers sorted by integer ID with their results in parallel columns
+
+    Lookups convert the requested ID to its number, binary-search the key
+    array and confirm the exact ID string, so differently padded IDs do not
+    match.
+    """
+
+    def __init__(self, results, version=None):
+        numbers, self.prefix = customer_numbers(results['customer_id'].astype(str))
+        order = np.argsort(numbers, kind='stable')
+        self.keys = numbers[order]
+        self.ids = results['customer_id'].astype(str).to_numpy(dtype=object)[order]
+        self.columns = {}
+        for col in RESULT_COLUMNS:
+            if col in results:
+                values = results[col]
+                if isinstance(values.dtype, pd.CategoricalDtype) or values.dtype == object:
+                    values = values.astype(str)
+                self.columns[col] = values.to_numpy()[order]
+        self.version = version
+        self.loaded_at = time.time()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def positions(self, customer_ids):
+        """
+        Row of each requested customer in the index
+
+        Args:
+            customer_ids (list): Customer ID strings
+
+        Returns:
+            np.ndarray: Row positions, -1 where the customer is unknown
+        """
+        numbers = np.full(len(customer_ids), -1, dtype=np.int64)
+        for i, customer_id in enumerate(customer_ids):
+            match = _ID_PATTERN.match(str(customer_id))
+            # Numbers beyond int64 cannot be in the index: left unknown (-1)
+            if (match and match.group(1) == self.prefix
+                    and len(match.group(2)) <= _MAX_DIGITS and int(match.group(2)) <= _MAX_NUMBER):
+                numbers[i] = int(match.group(2))
+        if len(self.keys) == 0:
+            return numbers
+        pos = np.searchsorted(self.keys, numbers)
+        pos = np.minimum(pos, len(self.keys) - 1)
+        found = (numbers >= 0) & (self.keys[pos] == numbers)
+        found &= self.ids[pos] == np.asarray([str(c) for c in customer_ids], dtype=object)
+        return np.where(found, pos, -1)
+
+    def records(self, customer_ids):
+        """
+        Results of the requested customers
+
+        Args:
+            customer_ids (list): Customer ID strings
+
+        Returns:
+            tuple: (list of result dicts for known customers, list of
+                unknown IDs)
+        """
+        pos = self.positions(customer_ids)
+        known = pos >= 0
+        hits = pos[known]
+        columns = {col: values[hits].tolist() for col, values in self.columns.items()}
+        found = [
+            {'customer_id': customer_id, **{col: columns[col][i] for col in columns}}
+            for i, customer_id in enumerate(np.asarray(customer_ids, dtype=object)[known])
+        ]
+        missing = [c for c, ok in zip(customer_ids, known) if not ok]
+        return found, missing
+
+
+def load_index(results_path):
+    """Read the results file into a SegmentIndex"""
+    version = _mtime(results_path)
+    return SegmentIndex(read_table(results_path), version=version)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class LatencyStats:
+    """Request count, errors and a window of recent latencies for one endpoint"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.count = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+
+    def record(self, seconds, error=False):
+        self.count += 1
+        self.errors += int(error)
+        self.latencies.append(seconds)
+
+    def summary(self):
+        summary = {'count': self.count, 'errors': self.errors}
+        if self.latencies:
+            p50, p95, p99 = np.percentile(np.fromiter(self.latencies, float), [50, 95, 99]) * 1000
+            summary.update(p50_ms=round(p50, 3), p95_ms=round(p95, 3), p99_ms=round(p99, 3))
+        return summary
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent scoring requests into vectorized batches
+
+    Each request's rows are queued with a future. The batch loop takes the
+    first waiting request, lets others queue for up to max_delay, scores
+    all queued rows with one call and resolves each future with its slice.
+    """
+
+    def __init__(self, score_fn, max_rows=MAX_BATCH_ROWS, max_delay=MAX_BATCH_DELAY):
+        self.score_fn = score_fn
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.batches = 0
+        self.rows = 0
+        self._queue = asyncio.Queue()
+
+    async def submit(self, X):
+        """Queue rows and wait for their (clusters, segments)"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((X, future))
+        return await future
+
+    def _drain(self, items, rows):
+        while rows < self.max_rows and not self._queue.empty():
+            item = self._queue.get_nowait()
+            items.append(item)
+            rows += len(item[0])
+        return rows
+
+    async def run(self):
+        """Batch loop; run as a task for the lifetime of the service"""
+        while True:
+            items = [await self._queue.get()]
+            rows = self._drain(items, len(items[0][0]))
+            if rows < self.max_rows and self.max_delay > 0:
+                await asyncio.sleep(self.max_delay)
+                rows = self._drain(items, rows)
+
+            try:
+                clusters, segments = self.score_fn(np.concatenate([X for X, _ in items]))
+            except Exception as exc:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            self.batches += 1
+            self.rows += rows
+            start = 0
+            for X, future in items:
+                end = start + len(X)
+                if not future.done():
+                    future.set_result((clusters[start:end], segments[start:end]))
+                start = end
+
+    def summary(self):
+        return {'batches': self.batches, 'rows': self.rows,
+                'mean_batch_rows': round(self.rows / self.batches, 2) if self.batches else 0}
+
+
+class SegmentService:
+    """
+    HTTP front end over a SegmentIndex and a SegmentationModel
+
+    Args:
+        results_path (str): RFM results file to serve
+        model_dir (str): Segmentation model directory used by /score
+        reload_interval (float): Seconds between change checks (0 disables
+            hot reload)
+        max_batch_rows (int): Rows per scoring micro-batch
+        max_batch_delay (float): Seconds a batch waits for more requests
+    """
+
+    def __init__(self, results_path=RESULTS_FILE, model_dir=MODEL_DIR,
+                 reload_interval=RELOAD_INTERVAL, max_batch_rows=MAX_BATCH_ROWS,
+                 max_batch_delay=MAX_BATCH_DELAY):
+        self.results_path = results_path
+        self.model_dir = model_dir
+        self.reload_interval = reload_interval
+        self.index = load_index(results_path)
+        self.model = load_model(model_dir) if model_dir and model_exists(model_dir) else None
+        self._model_mtime = self._model_version_stamp()
+        self.batcher = MicroBatcher(self._score, max_batch_rows, max_batch_delay)
+        self.stats = {}
+        self.reloads = 0
+        self.reload_errors = 0
+        self.started_at = time.time()
+        self._tasks = []
+
+    def _model_version_stamp(self):
+        return _mtime(os.path.join(self.model_dir, 'metadata.json')) if self.model_dir else None
+
+    def _score(self, X):
+        return self.model.assign_segments(X)
+
+    # -- request handling -------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one keep-alive connection"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, _ = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'malformed request line'}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # The body cannot be framed, so the connection is closed
+                    await self._respond(writer, 400, {'error': 'malformed Content-Length header'}, False)
+                    break
+                body = b''
+                if length:
+                    try:
+                        body = await reader.readexactly(length)
+                    except (asyncio.IncompleteReadError, ConnectionError):
+                        break
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                start = time.perf_counter()
+                endpoint, status, payload = await self._dispatch(method, target.split('?', 1)[0], body)
+                stats = self.stats.setdefault(endpoint, LatencyStats())
+                stats.record(time.perf_counter() - start, error=status >= 400)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=_json_default).encode()
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                  405: 'Method Not Allowed', 503: 'Service Unavailable'}.get(status, 'Error')
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def _dispatch(self, method, path, body):
+        """Route a request; returns (endpoint name, status, JSON payload)"""
+        try:
+            if path.startswith('/customers/') and path != '/customers/lookup':
+                if method != 'GET':
+                    return 'customer', 405, {'error': 'use GET'}
+                customer_id = unquote(path[len('/customers/'):])
+                found, _ = self.index.records([customer_id])
+                if not found:
+                    return 'customer', 404, {'error': f"unknown customer '{customer_id}'"}
+                return 'customer', 200, found[0]
+
+            if path == '/customers/lookup':
+                if method != 'POST':
+                    return 'lookup', 405, {'error': 'use POST'}
+                payload = json.loads(body or b'{}')
+                customer_ids = payload.get('customer_ids') if isinstance(payload, dict) else None
+                if not isinstance(customer_ids, list):
+                    return 'lookup', 400, {'error': "body must contain a 'customer_ids' list"}
+                found, missing = self.index.records(customer_ids)
+                return 'lookup', 200, {'customers': found, 'missing': missing}
+
+            if path == '/score':
+                if method != 'POST':
+                    return 'score', 405, {'error': 'use POST'}
+                if self.model is None:
+                    return 'score', 503, {'error': f"no segmentation model in '{self.model_dir}'"}
+                X = _score_rows(json.loads(body or b'{}'))
+                clusters, segments = await self.batcher.submit(X)
+                return 'score', 200, {
+                    'model_version': self.model.version,
+                    'results': [{'cluster': int(c), 'segment': s}
+                                for c, s in zip(clusters, np.asarray(segments))],
+                }
+
+            if path == '/metrics':
+                return 'metrics', 200, self.metrics()
+
+            if path == '/health':
+                return 'health', 200, {
+                    'status': 'ok',
+                    'customers': len(self.index),
+                    'model_version': self.model.version if self.model else None,
+                }
+        except (ValueError, KeyError, TypeError) as exc:
+            return path.strip('/').split('/')[0] or 'root', 400, {'error': str(exc)}
+
+        return 'not_found', 404, {'error': f"no route for {method} {path}"}
+
+    def metrics(self):
+        """Counters and latency percentiles per endpoint"""
+        return {
+            'uptime_s': round(time.time() - self.started_at, 1),
+            'customers': len(self.index),
+            'results_loaded_at': self.index.loaded_at,
+            'model_version': self.model.version if self.model else None,
+            'reloads': self.reloads,
+            'reload_errors': self.reload_errors,
+            'micro_batches': self.batcher.summary(),
+            'endpoints': {name: stats.summary() for name, stats in sorted(self.stats.items())},
+        }
+
+    # -- hot reload -------------------------------------------------------
+
+    async def watch(self):
+        """Poll the results file and model directory; swap in new versions"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                if _mtime(self.results_path) not in (None, self.index.version):
+                    # Parse in a worker thread; requests keep using the old index
+                    self.index = await loop.run_in_executor(None, load_index, self.results_path)
+                    self.reloads += 1
+                    print(f"✓ Reloaded {len(self.index):,} customers from '{self.results_path}'")
+                stamp = self._model_version_stamp()
+                if stamp is not None and stamp != self._model_mtime:
+                    self.model = await loop.run_in_executor(None, load_model, self.model_dir)
+                    self._model_mtime = stamp
+                    self.reloads += 1
+                    print(f"✓ Reloaded segmentation model {self.model.version}")
+            except Exception as exc:
+                self.reload_errors += 1
+                print(f"⚠ Reload failed, keeping the previous version: {exc}")
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        """
+        Run until cancelled
+
+        Args:
+            host (str): Interface to bind
+            port (int): Port to bind (0 picks a free port)
+            ready (asyncio.Future): Resolved with the bound port once listening
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        self._tasks = [asyncio.create_task(self.batcher.run())]
+        if self.reload_interval:
+            self._tasks.append(asyncio.create_task(self.watch()))
+        bound_port = server.sockets[0].getsockname()[1]
+        if ready is not None:
+            ready.set_result(bound_port)
+        print(f"✓ Serving {len(self.index):,} customers on http://{host}:{bound_port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+
+
+def _score_rows(payload):
+    """Parse a /score body into an (n, 3) float array"""
+    if 'rows' in payload:
+        X = np.asarray(payload['rows'], dtype=np.float64)
+    else:
+        X = np.asarray([[payload['recency'], payload['frequency'], payload['monetary']]],
+                       dtype=np.float64)
+    if X.ndim != 2 or X.shape[1] != 3:
+        raise ValueError("rows must be [recency, frequency, monetary] triples")
+    return X
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Serve customer segments over HTTP'
+    )
+    parser.add_argument('--results', type=str, default=RESULTS_FILE,
+                        help=f'RFM results file (default: {RESULTS_FILE})')
+    parser.add_argument('--model', type=str, default=MODEL_DIR,
+                        help=f'Segmentation model directory for /score (default: {MODEL_DIR})')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST,
+                        help=f'Interface to bind (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f'Port (default: {DEFAULT_PORT})')
+    parser.add_argument('--reload-interval', type=float, default=RELOAD_INTERVAL,
+                        help=f'Seconds between checks for new files, 0 to disable (default: {RELOAD_INTERVAL})')
+    parser.add_argument('--batch-delay-ms', type=float, default=MAX_BATCH_DELAY * 1000,
+                        help=f'Micro-batch wait in milliseconds (default: {MAX_BATCH_DELAY * 1000:g})')
+    args = parser.parse_args()
+
+    service = SegmentService(args.results, args.model, args.reload_interval,
+                             max_batch_delay=args.batch_delay_ms / 1000)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n✓ Service stopped")
+
+
+if __name__ == "__main__":
+    main()
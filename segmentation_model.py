@@ -0,0 +1,314 @@
+"""
+Segmentation Model Artifact
+Saves the fitted segmentation and scores new RFM rows without refitting
+
+A model is a directory holding small NumPy arrays and a JSON metadata file:
+
+    segmentation_model/
+        metadata.json       format/model version, analysis date, features,
+                            segment names, creation time
+        scaler.npy          (2, 3) StandardScaler mean and scale
+        centers.npy         (K, 3) cluster centroids in scaled space
+        cluster_segment.npy (K,)   segment index of each cluster
+        score_edges.npy     (3, 4) quintile cut points of R, F and M
+
+Arrays are loaded memory-mapped, so loading costs a few file opens rather
+than unpickling a pipeline. Scoring is a vectorized nearest-centroid
+search plus np.searchsorted on the cut points.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from rfm import RFM_SCORE_LABELS, rfm_score_index
+from storage import TableWriter, iter_table
+
+MODEL_DIR = 'segmentation_model'
+FORMAT_VERSION = 1
+FEATURES = ['recency', 'frequency', 'monetary']
+ARRAYS = ('scaler', 'centers', 'cluster_segment', 'score_edges')
+
+
+def quintile_edges(rfm_df):
+    """
+    Cut points that reproduce the 1-5 scores of a scored RFM table
+
+    Recency uses the qcut quantiles of the values. Frequency and monetary
+    are scored on ranks, so their cut point for score s is the largest
+    value that received score s; new rows equal to a cut point get the
+    lower score.
+
+    Args:
+        rfm_df (pd.DataFrame): RFM table with r_score, f_score, m_score
+
+    Returns:
+        np.ndarray: (3, 4) cut points for recency, frequency, monetary
+    """
+    recency = np.quantile(rfm_df['recency'].to_numpy(dtype=float), [0.2, 0.4, 0.6, 0.8])
+    rank_based = [
+        rfm_df.groupby(score)[metric].max().reindex([1, 2, 3, 4]).to_numpy(dtype=float)
+        for metric, score in (('frequency', 'f_score'), ('monetary', 'm_score'))
+    ]
+    return np.vstack([recency, *rank_based])
+
+
+def build_model(rfm_df, scaler, centers, segment_mapping, analysis_date):
+    """
+    Collect the parts of a fitted segmentation into a model dict
+
+    Args:
+        rfm_df (pd.DataFrame): Scored RFM table the model was fitted on
+        scaler (StandardScaler): Fitted scaler
+        centers (np.ndarray): Cluster centroids in scaled space
+        segment_mapping (dict): Cluster ID -> segment name
+        analysis_date (datetime): Analysis date of the fit
+
+    Returns:
+        dict: Model ready for save_model
+    """
+    segments = sorted(set(segment_mapping.values()))
+    cluster_segment = np.array([segments.index(segment_mapping[c]) for c in range(len(centers))],
+                               dtype=np.int16)
+    return {
+        'scaler': np.vstack([scaler.mean_, scaler.scale_]).astype(np.float64),
+        'centers': np.asarray(centers, dtype=np.float64),
+        'cluster_segment': cluster_segment,
+        'score_edges': quintile_edges(rfm_df),
+        'segments': segments,
+        'analysis_date': str(pd.Timestamp(analysis_date).date()),
+        'num_customers': int(len(rfm_df)),
+    }
+
+
+def save_model(model, model_dir=MODEL_DIR):
+    """
+    Write a model directory
+
+    The model version is a hash of the arrays and segment names, so saving
+    the same fit twice gives the same version.
+
+    Args:
+        model (dict): Output of build_model
+        model_dir (str): Directory to write
+
+    Returns:
+        str: Model version
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    digest = hashlib.sha1()
+    for name in ARRAYS:
+        array = np.ascontiguousarray(model[name])
+        np.save(os.path.join(model_dir, f'{name}.npy'), array)
+        digest.update(array.tobytes())
+    digest.update(json.dumps(model['segments']).encode())
+
+    metadata = {
+        'format_version': FORMAT_VERSION,
+        'model_version': digest.hexdigest()[:12],
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'analysis_date': model['analysis_date'],
+        'num_customers': model['num_customers'],
+        'features': FEATURES,
+        'n_clusters': int(len(model['centers'])),
+        'segments': model['segments'],
+    }
+    # Metadata last: a directory without it is an incomplete model
+    with open(os.path.join(model_dir, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata['model_version']
+
+
+def load_model(model_dir=MODEL_DIR):
+    """
+    Load a model directory written by save_model
+
+    Args:
+        model_dir (str): Model directory
+
+    Returns:
+        SegmentationModel: Loaded model
+    """
+    with open(os.path.join(model_dir, 'metadata.json')) as f:
+        metadata = json.load(f)
+    if metadata.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format {metadata.get('format_version')} "
+                         f"in '{model_dir}' (expected {FORMAT_VERSION})")
+    arrays = {name: np.load(os.path.join(model_dir, f'{name}.npy'), mmap_mode='r')
+              for name in ARRAYS}
+    return SegmentationModel(metadata, **arrays)
+
+
+def model_exists(model_dir=MODEL_DIR):
+    """Whether a complete model is stored in model_dir"""
+    return os.path.exists(os.path.join(model_dir, 'metadata.json'))
+
+
+class SegmentationModel:
+    """
+    Fitted segmentation: scaler, centroids, segment names and score cut points
+
+    Scaling is folded into the centroid search: for raw features x the
+    scaled point is x * w - b with w = 1 / scale and b = mean / scale, and
+    the nearest centroid minimizes |c|^2 - 2 (x * w - b) . c.
+    """
+
+    def __init__(self, metadata, scaler, centers, cluster_segment, score_edges):
+        self.metadata = metadata
+        self.version = metadata['model_version']
+        self.analysis_date = pd.Timestamp(metadata['analysis_date'])
+        self.segments = list(metadata['segments'])
+        self.centers = np.asarray(centers)
+        self.cluster_segment = np.asarray(cluster_segment)
+        self.score_edges = np.asarray(score_edges)
+
+        mean, scale = np.asarray(scaler)
+        # Raw features -> -2 * scaled . c, then add |c|^2
+        self._weights = -2 * (self.centers / scale).T
+        self._offset = (self.centers ** 2).sum(axis=1) + 2 * (mean / scale) @ self.centers.T
+
+    @property
+    def n_clusters(self):
+        return len(self.centers)
+
+    def assign_clusters(self, X):
+        """
+        Nearest centroid of each row of raw recency/frequency/monetary
+
+        Args:
+            X (np.ndarray): (n, 3) unscaled features
+
+        Returns:
+            np.ndarray: Cluster ID per row (int8)
+        """
+        return (np.asarray(X, dtype=np.float64) @ self._weights + self._offset).argmin(axis=1).astype(np.int8)
+
+    def assign_segments(self, X):
+        """
+        Cluster and segment name of each row of raw features
+
+        Args:
+            X (np.ndarray): (n, 3) unscaled recency, frequency, monetary
+
+        Returns:
+            tuple: (cluster IDs, segment names as pd.Categorical)
+        """
+        clusters = self.assign_clusters(X)
+        return clusters, pd.Categorical.from_codes(self.cluster_segment[clusters],
+                                                   categories=self.segments)
+
+    def rfm_scores(self, X):
+        """
+        1-5 recency, frequency and monetary scores from the stored cut points
+
+        Args:
+            X (np.ndarray): (n, 3) unscaled features
+
+        Returns:
+            tuple: r_score, f_score, m_score arrays (int8)
+        """
+        X = np.asarray(X)
+        scores = [
+            (np.searchsorted(self.score_edges[i], X[:, i], side='left') + 1).astype(np.int8)
+            for i in range(3)
+        ]
+        scores[0] = 6 - scores[0]
+        return tuple(scores)
+
+    def score(self, rfm_df):
+        """
+        Score RFM rows with the stored model
+
+        Args:
+            rfm_df (pd.DataFrame): Rows with recency, frequency, monetary
+                (and any other columns, which are kept)
+
+        Returns:
+            pd.DataFrame: Copy of rfm_df with r_score, f_score, m_score,
+                rfm_score, rfm_score_numeric, cluster and segment columns
+        """
+        X = rfm_df[FEATURES].to_numpy(dtype=np.float64)
+        r_score, f_score, m_score = self.rfm_scores(X)
+        clusters, segments = self.assign_segments(X)
+
+        scored = rfm_df.copy()
+        scored['r_score'] = r_score
+        scored['f_score'] = f_score
+        scored['m_score'] = m_score
+        scored['rfm_score'] = pd.Categorical.from_codes(rfm_score_index(r_score, f_score, m_score),
+                                                        categories=RFM_SCORE_LABELS)
+        scored['rfm_score_numeric'] = r_score + f_score + m_score
+        scored['cluster'] = clusters
+        scored['segment'] = segments
+        return scored
+
+
+def score_file(input_path, output_path, model_dir=MODEL_DIR, chunksize=1_000_000):
+    """
+    Score an RFM file chunk by chunk with a stored model
+
+    Args:
+        input_path (str): File with recency, frequency, monetary columns
+        output_path (str): Output file (.csv or .parquet)
+        model_dir (str): Model directory
+        chunksize (int): Rows per chunk
+
+    Returns:
+        tuple: (rows scored, seconds spent scoring)
+    """
+    model = load_model(model_dir)
+    rows, seconds = 0, 0.0
+    with TableWriter(output_path) as writer:
+        for chunk in iter_table(input_path, chunksize=chunksize):
+            start = time.perf_counter()
+            scored = model.score(chunk)
+            seconds += time.perf_counter() - start
+            writer.write(scored)
+            rows += len(scored)
+    return rows, seconds
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Score RFM rows with a stored segmentation model'
+    )
+    parser.add_argument('--model', type=str, default=MODEL_DIR,
+                        help=f'Model directory (default: {MODEL_DIR})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    score_parser = subparsers.add_parser('score', help='Assign scores and segments to RFM rows')
+    score_parser.add_argument('--input', type=str, required=True,
+                              help='File with recency, frequency and monetary columns')
+    score_parser.add_argument('--output', type=str, default='scored_customers.csv',
+                              help='Output file (default: scored_customers.csv)')
+    score_parser.add_argument('--chunksize', type=int, default=1_000_000,
+                              help='Rows per chunk (default: 1,000,000)')
+
+    subparsers.add_parser('info', help='Show the model metadata')
+
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        model = load_model(args.model)
+        print(json.dumps(model.metadata, indent=2))
+        for cluster, segment in enumerate(model.cluster_segment):
+            print(f"  Cluster {cluster}: {model.segments[segment]}")
+        return
+
+    rows, seconds = score_file(args.input, args.output, args.model, args.chunksize)
+    rate = rows / seconds if seconds else float('inf')
+    print(f"✓ Scored {rows:,} rows in {seconds:.3f}s ({rate:,.0f} rows/s); saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+SQLite Transaction Store
+Keeps transactions in a local SQLite database and aggregates RFM inside it
+
+An optional storage backend for .db / .sqlite paths (see storage.py), so
+the generator writes to it and the pipeline reads from it like any other
+format. Rows are bulk-inserted with batched executemany calls inside one
+transaction per write, and the index on (customer_id, transaction_date)
+is built once after the load. The index also carries total_amount, so
+the RFM query below is answered from the index alone, already in
+customer order:
+
+    SELECT customer_id, MAX(transaction_date), COUNT(transaction_id),
+           SUM(CAST(ROUND(total_amount * 100) AS INTEGER))
+    FROM transactions GROUP BY customer_id
+
+Revenue is summed in integer cents, so monetary is exact to the cent
+whatever order SQLite visits the rows in.
+
+Only one row per customer comes back, fetched in batches, instead of
+every transaction being parsed into pandas. Connections come from a small
+per-database pool, so repeated queries (the RFM stage, per-customer
+lookups) reuse open connections.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+TABLE = 'transactions'
+INDEX = 'idx_transactions_customer_date'
+
+# Column -> SQLite type of the transactions table
+SCHEMA = {
+    'transaction_id': 'INTEGER PRIMARY KEY',
+    'customer_id': 'TEXT NOT NULL',
+    'transaction_date': 'TEXT NOT NULL',
+    'product_category': 'TEXT',
+    'quantity': 'INTEGER',
+    'unit_price': 'REAL',
+    'total_amount': 'REAL NOT NULL',
+    'true_segment': 'TEXT',
+}
+
+# Rows per executemany call and per fetchmany batch
+DEFAULT_BATCH_ROWS = 100_000
+DEFAULT_POOL_SIZE = 4
+
+RFM_QUERY = f"""
+    SELECT customer_id, MAX(transaction_date), COUNT(transaction_id),
+           SUM(CAST(ROUND(total_amount * 100) AS INTEGER))
+    FROM {TABLE}
+    GROUP BY customer_id
+    ORDER BY customer_id
+"""
+
+
+def connect(path):
+    """
+    Open a connection tuned for analytical reads and bulk loads
+
+    Args:
+        path (str): Database file
+
+    Returns:
+        sqlite3.Connection: Connection usable from any thread
+    """
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -262144')  # 256 MB page cache
+    return conn
+
+
+class ConnectionPool:
+    """
+    Small pool of connections to one database
+
+    Args:
+        path (str): Database file
+        size (int): Maximum number of open connections
+    """
+
+    def __init__(self, path, size=DEFAULT_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; waits while all of them are in use"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                opened = self._opened < self.size
+                if opened:
+                    self._opened += 1
+            conn = connect(self.path) if opened else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """Close the idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    """Shared connection pool of a database file"""
+    key = os.path.abspath(path)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(path)
+        return _pools[key]
+
+
+def close_pool(path):
+    """Close and forget the pool of a database file (before replacing the file)"""
+    with _pools_lock:
+        pool = _pools.pop(os.path.abspath(path), None)
+    if pool is not None:
+        pool.close()
+
+
+def _sql_values(df, columns):
+    """Rows of df as tuples of plain Python values, dates as ISO text"""
+    values = []
+    for col in columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values.append(np.datetime_as_string(series.to_numpy(dtype='datetime64[D]')).tolist())
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            values.append(series.astype(series.cat.categories.dtype).tolist())
+        else:
+            values.append(series.tolist())
+    return zip(*values)
+
+
+def create_table(conn, columns, replace=False):
+    """
+    Create the transactions table for the given columns
+
+    Args:
+        conn (sqlite3.Connection): Connection
+        columns (list): Column names; unknown columns are stored untyped
+        replace (bool): Drop an existing table first
+    """
+    if replace:
+        conn.execute(f'DROP TABLE IF EXISTS {TABLE}')
+    definition = ', '.join(f'{col} {SCHEMA.get(col, "")}'.strip() for col in columns)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} ({definition})')
+
+
+def insert_transactions(conn, df, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    Bulk-insert transactions with batched executemany in one transaction
+
+    Args:
+        conn (sqlite3.Connection): Connection with the table created
+        df (pd.DataFrame): Transactions
+        batch_rows (int): Rows per executemany call
+    """
+    columns = list(df.columns)
+    sql = f'INSERT INTO {TABLE} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+    # Bulk load: no fsync per commit, rollback journal kept in memory
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    with conn:
+        for start in range(0, len(df), batch_rows):
+            conn.executemany(sql, _sql_values(df.iloc[start:start + batch_rows], columns))
+
+
+def create_indexes(conn):
+    """Build the (customer_id, transaction_date) index after a load"""
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({TABLE})')}
+    if {'customer_id', 'transaction_date'} <= columns:
+        covered = ', total_amount' if 'total_amount' in columns else ''
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {INDEX} '
+                     f'ON {TABLE} (customer_id, transaction_date{covered})')
+    conn.execute('ANALYZE')
+    conn.commit()
+
+
+def write_sqlite(df, path):
+    """
+    Replace the transactions table of a database with df
+
+    Args:
+        df (pd.DataFrame): Transactions
+        path (str): Database file
+    """
+    close_pool(path)
+    conn = connect(path)
+    try:
+        create_table(conn, list(df.columns), replace=True)
+        insert_transactions(conn, df)
+        create_indexes(conn)
+    finally:
+        conn.close()
+
+
+class SqliteWriter:
+    """
+    Append transaction blocks to a database (storage.TableWriter backend)
+
+    The table is recreated on the first block and indexed on close.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def write(self, df):
+        """Append one block"""
+        if self._conn is None:
+            close_pool(self.path)
+            self._conn = connect(self.path)
+            create_table(self._conn, list(df.columns), replace=True)
+        insert_transactions(self._conn, df)
+
+    def close(self):
+        """Build the index and close the connection"""
+        if self._conn is not None:
+            create_indexes(self._conn)
+            self._conn.close()
+            self._conn = None
+
+
+def _select(columns):
+    return f'SELECT {", ".join(columns) if columns else "*"} FROM {TABLE} ORDER BY rowid'
+
+
+def _read_options(path, columns):
+    from storage import CATEGORICAL_COLUMNS, DATE_COLUMNS
+    with get_pool(path).connection() as conn:
+        names = [row[1] for row in conn.execute(f'PRAGMA table_info({TABLE})')]
+    wanted = names if columns is None else list(columns)
+    missing = set(wanted) - set(names)
+    if missing:
+        raise KeyError(f"Columns not found in '{path}': {sorted(missing)}")
+    return wanted, {
+        'parse_dates': [c for c in DATE_COLUMNS if c in wanted],
+        'dtype': {c: 'category' for c in CATEGORICAL_COLUMNS if c in wanted},
+    }
+
+
+def read_sqlite(path, columns=None):
+    """
+    Read the transactions table (storage.read_table backend)
+
+    Args:
+        path (str): Database file
+        columns (list): Columns to load (all if None)
+
+    Returns:
+        pd.DataFrame: Transactions in insertion order, dates parsed
+    """
+    wanted, options = _read_options(path, columns)
+    with get_pool(path).connection() as conn:
+        return pd.read_sql_query(_select(wanted), conn, **options)[wanted]
+
+
+def iter_sqlite(path, columns=None, chunksize=1_000_000):
+    """
+    Read the transactions table in chunks (storage.iter_table backend)
+
+    Yields:
+        pd.DataFrame: Consecutive chunks, dates parsed
+    """
+    wanted, options = _read_options(path, columns)
+    with get_pool(path).connection() as conn:
+        for chunk in pd.read_sql_query(_select(wanted), conn, chunksize=chunksize, **options):
+            yield chunk[wanted]
+
+
+def aggregate_rfm_sql(path, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    Per-customer RFM state computed by one grouped query in SQLite
+
+    Args:
+        path (str): Database file
+        batch_rows (int): Customers per fetchmany batch
+
+    Returns:
+        pd.DataFrame: State in the rfm_state layout (indexed by
+            customer_id; last_purchase, frequency, monetary), ordered by
+            customer_id; monetary is summed in exact cents, so it can
+            differ from pandas' floating-point sums in the last bit
+    """
+    ids, last, frequency, monetary = [], [], [], []
+    with get_pool(path).connection() as conn:
+        cursor = conn.execute(RFM_QUERY)
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            batch_ids, batch_last, batch_frequency, batch_monetary = zip(*rows)
+            ids.extend(batch_ids)
+            last.append(np.array(batch_last, dtype='datetime64[D]'))
+            frequency.append(np.array(batch_frequency, dtype=np.int64))
+            monetary.append(np.array(batch_monetary, dtype=np.int64) / 100)
+
+    if not ids:
+        last, frequency, monetary = [np.array([], dtype='datetime64[D]')], [np.array([], np.int64)], [np.array([])]
+    return pd.DataFrame({
+        'last_purchase': np.concatenate(last).astype('datetime64[ns]'),
+        'frequency': np.concatenate(frequency),
+        'monetary': np.concatenate(monetary),
+    }, index=pd.Index(ids, name='customer_id', dtype='str'))
+
+
+def compute_rfm_sql(path, analysis_date=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    RFM table from a SQLite database with the aggregation pushed down
+
+    Args:
+        path (str): Database file
+        analysis_date (datetime): Reference date (default: the day after
+            the last transaction)
+        batch_rows (int): Customers per fetchmany batch
+
+    Returns:
+        tuple: (rfm_df in the compute_rfm layout, analysis date)
+    """
+    from rfm import finalize_rfm
+    state = aggregate_rfm_sql(path, batch_rows)
+    date = pd.Timestamp(analysis_date or state['last_purchase'].max() + timedelta(days=1))
+    return finalize_rfm(state, date), date
+
+
+def customer_transactions(path, customer_id):
+    """
+    All transactions of one customer, by date (an index range scan)
+
+    Args:
+        path (str): Database file
+        customer_id (str): Customer ID
+
+    Returns:
+        pd.DataFrame: The customer's transactions
+    """
+    with get_pool(path).connection() as conn:
+        return pd.read_sql_query(
+            f'SELECT * FROM {TABLE} WHERE customer_id = ? ORDER BY transaction_date',
+            conn, params=(customer_id,), parse_dates=['transaction_date'])
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Load transactions into SQLite and compute RFM inside the database'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    load = subparsers.add_parser('load', help='Bulk-load a transaction file into a database')
+    load.add_argument('--input', type=str, default='ecommerce_transactions.csv',
+                      help='Transaction file (default: ecommerce_transactions.csv)')
+    load.add_argument('--db', type=str, default='transactions.db',
+                      help='Database file (default: transactions.db)')
+
+    rfm = subparsers.add_parser('rfm', help='Compute RFM with the pushed-down grouped query')
+    rfm.add_argument('--db', type=str, default='transactions.db',
+                     help='Database file (default: transactions.db)')
+    rfm.add_argument('--output', type=str, default=None,
+                     help='Optional RFM output file')
+
+    customer = subparsers.add_parser('customer', help="List one customer's transactions")
+    customer.add_argument('customer_id', type=str, help='Customer ID')
+    customer.add_argument('--db', type=str, default='transactions.db',
+                          help='Database file (default: transactions.db)')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("SQLITE TRANSACTION STORE")
+    print("="*70)
+
+    if args.command == 'load':
+        from storage import TableWriter, iter_table
+        start = time.perf_counter()
+        rows = 0
+        with TableWriter(args.db) as writer:
+            for chunk in iter_table(args.input):
+                writer.write(chunk)
+                rows += len(chunk)
+        print(f"\n✓ Loaded {rows:,} transactions into '{args.db}' "
+              f"in {time.perf_counter() - start:.2f}s")
+    elif args.command == 'rfm':
+        start = time.perf_counter()
+        rfm_df, date = compute_rfm_sql(args.db)
+        print(f"\n{len(rfm_df):,} customers as of {date.date()} in {time.perf_counter() - start:.2f}s")
+        print(rfm_df.describe().round(2))
+        if args.output:
+            from storage import write_table
+            write_table(rfm_df, args.output)
+            print(f"\n✓ RFM table saved to '{args.output}'")
+    else:
+        print(customer_transactions(args.db, args.customer_id).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Stage Cache for the RFM Pipeline
+Content-addressed on-disk cache of pipeline stage outputs
+
+Each stage output is stored under a key that hashes the stage name, its
+parameters and the keys of the stages it consumed, so changing any input
+(a data file, the analysis date, K, random_state, a rule) only recomputes
+the stages downstream of that change. Input files are identified by a
+fingerprint (size, modification time and a hash of their first and last
+megabyte) rather than a full content hash, so large files are cheap to
+check.
+
+Outputs are pickled to <cache_dir>/<key>.pkl. An index file records each
+entry's stage, size, compute time and last access; when the cache grows
+beyond its size limit the least recently used entries are evicted.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+from collections import namedtuple
+
+CACHE_DIR = '.rfm_cache'
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+INDEX_FILE = 'index.json'
+
+# Bytes hashed from each end of an input file for its fingerprint
+FINGERPRINT_BYTES = 1024 ** 2
+
+# Output of a cached stage: its cache key (passed on to downstream
+# stages) and its value
+Stage = namedtuple('Stage', ['key', 'value'])
+
+
+def fingerprint(path):
+    """
+    Cheap identity of an input file or directory
+
+    Args:
+        path (str): File or directory path
+
+    Returns:
+        dict: Absolute path, size, modification time and a hash of the
+            first and last FINGERPRINT_BYTES (for a directory, the same for
+            each file in it)
+    """
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        return {'path': path,
+                'files': [fingerprint(os.path.join(path, name)) for name in sorted(os.listdir(path))]}
+
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if stat.st_size > FINGERPRINT_BYTES:
+            f.seek(max(stat.st_size - FINGERPRINT_BYTES, FINGERPRINT_BYTES))
+            digest.update(f.read())
+    return {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'sample_sha1': digest.hexdigest()}
+
+
+def _canonical(value):
+    """JSON-serializable form of a key parameter"""
+    if isinstance(value, Stage):
+        return {'stage_key': value.key}
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, range):
+        return {'range': [value.start, value.stop, value.step]}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Cannot use {type(value).__name__} as a cache key parameter")
+
+
+class StageCache:
+    """
+    On-disk cache of stage outputs with LRU eviction and hit/miss counters
+
+    Args:
+        cache_dir (str): Cache directory (created on first write)
+        max_bytes (int): Size limit; least recently used entries are
+            evicted beyond it
+        enabled (bool): If False every lookup is a miss and nothing is stored
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.stats = {}
+        self._index = self._load_index()
+
+    # -- index ------------------------------------------------------------
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def _load_index(self):
+        try:
+            with open(self._index_path()) as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        # Drop entries whose file has disappeared
+        return {key: entry for key, entry in index.items() if os.path.exists(self._entry_path(key))}
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self._index_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp, self._index_path())
+
+    # -- keys and entries ---------------------------------------------------
+
+    @staticmethod
+    def key(stage, **params):
+        """
+        Cache key of a stage run
+
+        Args:
+            stage (str): Stage name
+            **params: Parameters; Stage values stand for their key
+
+        Returns:
+            str: Hex digest
+        """
+        payload = json.dumps({'stage': stage, 'params': _canonical(params)}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def _counter(self, stage):
+        return self.stats.setdefault(stage, {'hits': 0, 'misses': 0,
+                                             'seconds_computed': 0.0, 'seconds_saved': 0.0})
+
+    def get(self, key):
+        """
+        Look up a key
+
+        Returns:
+            tuple: (True, value) on a hit, (False, None) on a miss
+        """
+        if not self.enabled or key not in self._index:
+            return False, None
+        try:
+            with open(self._entry_path(key), 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self._remove(key)
+            return False, None
+        self._index[key]['last_access'] = time.time()
+        self._save_index()
+        return True, value
+
+    def put(self, key, stage, value, seconds=0.0):
+        """Store a stage output and evict old entries if over the size limit"""
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._entry_path(key)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        now = time.time()
+        self._index[key] = {'stage': stage, 'bytes': os.path.getsize(path),
+                            'seconds': round(seconds, 4), 'created': now, 'last_access': now}
+        self.evict(keep=key)
+
+    def run(self, stage, compute, **params):
+        """
+        Return a stage's cached output, computing and storing it on a miss
+
+        Args:
+            stage (str): Stage name
+            compute (callable): Function of no arguments producing the output
+            **params: Everything the output depends on (see key)
+
+        Returns:
+            Stage: (key, value)
+        """
+        key = self.key(stage, **params)
+        counter = self._counter(stage)
+        hit, value = self.get(key)
+        if hit:
+            counter['hits'] += 1
+            counter['seconds_saved'] += self._index[key].get('seconds', 0.0)
+            return Stage(key, value)
+
+        counter['misses'] += 1
+        start = time.perf_counter()
+        value = compute()
+        seconds = time.perf_counter() - start
+        counter['seconds_computed'] += seconds
+        self.put(key, stage, value, seconds)
+        return Stage(key, value)
+
+    def run_file(self, stage, path, compute, **params):
+        """
+        Like run, for a stage whose output is a file written by compute
+
+        The cached value is the file's fingerprint, so a hit also requires
+        the file to be unchanged since the stage wrote it.
+
+        Args:
+            stage (str): Stage name
+            path (str): File the stage writes
+            compute (callable): Function of no arguments that writes path
+            **params: Everything the file depends on
+
+        Returns:
+            Stage: (key, fingerprint of the file)
+        """
+        key = self.key(stage, output=os.path.abspath(path), **params)
+        counter = self._counter(stage)
+        hit, recorded = self.get(key)
+        if hit and os.path.exists(path) and fingerprint(path) == recorded:
+            counter['hits'] += 1
+            counter['seconds_saved'] += self._index[key].get('seconds', 0.0)
+            return Stage(key, recorded)
+
+        counter['misses'] += 1
+        start = time.perf_counter()
+        compute()
+        seconds = time.perf_counter() - start
+        counter['seconds_computed'] += seconds
+        recorded = fingerprint(path)
+        self.put(key, stage, recorded, seconds)
+        return Stage(key, recorded)
+
+    # -- maintenance --------------------------------------------------------
+
+    def _remove(self, key):
+        self._index.pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits max_bytes
+
+        Args:
+            keep (str): Key that must not be evicted (the entry just written)
+        """
+        total = self.total_bytes()
+        for key in sorted(self._index, key=lambda k: self._index[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._index[key]['bytes']
+            self._remove(key)
+        self._save_index()
+
+    def invalidate(self, stage=None):
+        """
+        Remove cached outputs
+
+        Args:
+            stage (str): Only remove this stage's entries (default: all)
+
+        Returns:
+            int: Number of entries removed
+        """
+        keys = [key for key, entry in self._index.items() if stage is None or entry['stage'] == stage]
+        for key in keys:
+            self._remove(key)
+        self._save_index()
+        return len(keys)
+
+    def entries(self):
+        """Index entries, most recently used first"""
+        return sorted(({'key': key, **entry} for key, entry in self._index.items()),
+                      key=lambda entry: entry['last_access'], reverse=True)
+
+    def total_bytes(self):
+        return sum(entry['bytes'] for entry in self._index.values())
+
+    def print_report(self):
+        """Print hit/miss counts of this session"""
+        print("\nStage cache:")
+        for stage, counter in self.stats.items():
+            status = 'hit' if counter['hits'] and not counter['misses'] else 'miss'
+            print(f"  {stage:10s} {status:4s}  hits={counter['hits']} misses={counter['misses']}  "
+                  f"computed {counter['seconds_computed']:.2f}s, saved {counter['seconds_saved']:.2f}s")
+        print(f"  {len(self._index)} entries, {self.total_bytes() / 1e6:.1f} MB "
+              f"(limit {self.max_bytes / 1e6:,.0f} MB) in '{self.cache_dir}'")
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Inspect or invalidate the pipeline stage cache'
+    )
+    parser.add_argument('--cache-dir', type=str, default=CACHE_DIR,
+                        help=f'Cache directory (default: {CACHE_DIR})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('info', help='List cached stage outputs')
+    invalidate_parser = subparsers.add_parser('invalidate', help='Remove cached outputs')
+    invalidate_parser.add_argument('--stage', type=str, default=None,
+                                   help='Only remove this stage (default: everything)')
+    evict_parser = subparsers.add_parser('evict', help='Evict least recently used entries')
+    evict_parser.add_argument('--max-mb', type=float, required=True,
+                              help='Shrink the cache to at most this many megabytes')
+    args = parser.parse_args()
+
+    cache = StageCache(args.cache_dir)
+    if args.command == 'invalidate':
+        removed = cache.invalidate(args.stage)
+        target = f"stage '{args.stage}'" if args.stage else 'all stages'
+        print(f"✓ Removed {removed} cached output(s) for {target}")
+    elif args.command == 'evict':
+        before = len(cache.entries())
+        cache.max_bytes = int(args.max_mb * 1e6)
+        cache.evict()
+        print(f"✓ Evicted {before - len(cache.entries())} entries; "
+              f"{cache.total_bytes() / 1e6:.1f} MB remain")
+    else:
+        entries = cache.entries()
+        print(f"{len(entries)} entries, {cache.total_bytes() / 1e6:.1f} MB in '{args.cache_dir}'")
+        for entry in entries:
+            print(f"  {entry['key'][:12]}  {entry['stage']:10s} {entry['bytes'] / 1e6:9.2f} MB  "
+                  f"computed in {entry['seconds']:.2f}s  "
+                  f"last used {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_access']))}")
+
+
+if __name__ == "__main__":
+    main()
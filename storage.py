@@ -0,0 +1,345 @@
+"""
+Storage Layer for Transactions and RFM Results
+Reads and writes tables as CSV, Parquet or Feather (Arrow IPC)
+
+The format is picked from the file extension. Columnar formats store
+string labels as categoricals (dictionary-encoded, so customer_id is
+integer-coded on disk), dates as native datetime64 and integers in the
+smallest type that fits. CSV remains available as a fallback and needs no
+extra dependencies; Parquet and Feather require pyarrow. .db / .sqlite
+paths use the SQLite transaction store (sqlite_store.py, standard library
+only).
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# Columns stored as categoricals
+CATEGORICAL_COLUMNS = ['customer_id', 'product_category', 'true_segment',
+                       'segment', 'rfm_score']
+
+# Fixed compact types for known numeric columns, so that blocks written
+# separately share one schema
+COMPACT_DTYPES = {
+    'transaction_id': 'uint32',
+    'quantity': 'uint8',
+    'recency': 'int16',
+    'frequency': 'int32',
+    'r_score': 'int8',
+    'f_score': 'int8',
+    'm_score': 'int8',
+    'rfm_score_numeric': 'int8',
+    'cluster': 'int8',
+}
+
+# Columns parsed as dates
+DATE_COLUMNS = ['transaction_date', 'last_purchase']
+
+# Columns the RFM stage needs from the transaction table
+RFM_COLUMNS = ['customer_id', 'transaction_date', 'transaction_id', 'total_amount']
+
+FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+    '.ipc': 'feather',
+    '.db': 'sqlite',
+    '.sqlite': 'sqlite',
+    '.sqlite3': 'sqlite',
+}
+
+
+def detect_format(path, fmt=None):
+    """
+    Resolve the storage format of a path
+
+    Args:
+        path (str): File path
+        fmt (str): Explicit format overriding the extension
+
+    Returns:
+        str: 'csv', 'parquet', 'feather' or 'sqlite'
+    """
+    if fmt is not None:
+        if fmt not in set(FORMATS.values()):
+            raise ValueError(f"Unknown storage format '{fmt}'")
+        return fmt
+    ext = os.path.splitext(str(path))[1].lower()
+    return FORMATS.get(ext, 'csv')
+
+
+def _require_pyarrow(fmt):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            f"The {fmt} format requires pyarrow; install it with "
+            f"'pip install pyarrow' or use a .csv path"
+        ) from None
+
+
+def compact_dtypes(df):
+    """
+    Convert a frame to compact column types
+
+    String label columns become categoricals, known numeric columns take
+    their COMPACT_DTYPES type and other integer columns are downcast to the
+    smallest type that holds their values. Float columns keep float64 so
+    monetary values round-trip exactly.
+
+    Args:
+        df (pd.DataFrame): Transactions or RFM results
+
+    Returns:
+        pd.DataFrame: Frame with compact dtypes
+    """
+    out = df.copy()
+    for col in out.columns:
+        series = out[col]
+        if col in CATEGORICAL_COLUMNS:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                out[col] = series.astype('category')
+        elif col in DATE_COLUMNS:
+            if not pd.api.types.is_datetime64_any_dtype(series):
+                out[col] = pd.to_datetime(series)
+        elif col in COMPACT_DTYPES:
+            out[col] = series.astype(COMPACT_DTYPES[col])
+        elif pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            out[col] = pd.to_numeric(series, downcast='unsigned' if series.min() >= 0 else 'integer')
+    return out
+
+
+def read_table(path, columns=None, fmt=None):
+    """
+    Read a transaction or results table
+
+    Args:
+        path (str): Input file path
+        columns (list): Columns to load (all if None)
+        fmt (str): Explicit format overriding the extension
+
+    Returns:
+        pd.DataFrame: Loaded table with dates parsed and labels categorical
+    """
+    fmt = detect_format(path, fmt)
+
+    if fmt == 'csv':
+        header = pd.read_csv(path, nrows=0).columns
+        wanted = list(header) if columns is None else list(columns)
+        missing = set(wanted) - set(header)
+        if missing:
+            raise KeyError(f"Columns not found in '{path}': {sorted(missing)}")
+        df = pd.read_csv(
+            path,
+            usecols=wanted,
+            parse_dates=[c for c in DATE_COLUMNS if c in wanted],
+            dtype={c: 'category' for c in CATEGORICAL_COLUMNS if c in wanted}
+        )[wanted]
+    elif fmt == 'sqlite':
+        from sqlite_store import read_sqlite
+        df = read_sqlite(path, columns)
+    else:
+        _require_pyarrow(fmt)
+        if fmt == 'parquet':
+            df = pd.read_parquet(path, columns=columns)
+        else:
+            df = pd.read_feather(path, columns=columns)
+
+    return _sort_categories(df)
+
+
+def _sort_categories(df):
+    """
+    Put categorical labels in sorted order
+
+    The CSV parser unions categories chunk by chunk and columnar files keep
+    the order they were written in; sorting makes groupby results come out
+    in the same (sorted) key order as plain string columns.
+    """
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype) and not dtype.categories.is_monotonic_increasing:
+            order = dtype.categories.argsort()
+            recode = np.empty(len(order), dtype=np.int32)
+            recode[order] = np.arange(len(order), dtype=np.int32)
+            codes = df[col].cat.codes.to_numpy()
+            df[col] = pd.Categorical.from_codes(
+                np.where(codes >= 0, recode[codes], -1), dtype.categories[order]
+            )
+    return df
+
+
+def write_table(df, path, fmt=None):
+    """
+    Write a transaction or results table
+
+    Columnar formats are written with compact dtypes; CSV is written as is.
+
+    Args:
+        df (pd.DataFrame): Table to write
+        path (str): Output file path
+        fmt (str): Explicit format overriding the extension
+    """
+    fmt = detect_format(path, fmt)
+
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+        return
+    if fmt == 'sqlite':
+        from sqlite_store import write_sqlite
+        write_sqlite(df, path)
+        return
+
+    _require_pyarrow(fmt)
+    compact = compact_dtypes(df.reset_index(drop=True))
+    if fmt == 'parquet':
+        compact.to_parquet(path, index=False)
+    else:
+        compact.to_feather(path)
+
+
+def read_transactions(path, columns=None, fmt=None):
+    """
+    Read transactions, optionally projecting to a subset of columns
+
+    Args:
+        path (str): Input file path
+        columns (list): Columns to load, e.g. RFM_COLUMNS (all if None)
+        fmt (str): Explicit format overriding the extension
+
+    Returns:
+        pd.DataFrame: Transactions with native datetime64 dates
+    """
+    return read_table(path, columns=columns, fmt=fmt)
+
+
+def iter_table(path, columns=None, chunksize=1_000_000, fmt=None):
+    """
+    Read a table in chunks of rows
+
+    Args:
+        path (str): Input file path
+        columns (list): Columns to load (all if None)
+        chunksize (int): Rows per chunk (Parquet yields record batches of
+            at most this size; Feather yields the batches stored in the file)
+        fmt (str): Explicit format overriding the extension
+
+    Yields:
+        pd.DataFrame: Consecutive chunks with dates parsed
+    """
+    fmt = detect_format(path, fmt)
+
+    if fmt == 'csv':
+        header = pd.read_csv(path, nrows=0).columns
+        wanted = list(header) if columns is None else list(columns)
+        reader = pd.read_csv(
+            path,
+            usecols=wanted,
+            parse_dates=[c for c in DATE_COLUMNS if c in wanted],
+            dtype={c: 'category' for c in CATEGORICAL_COLUMNS if c in wanted},
+            chunksize=chunksize
+        )
+        with reader:
+            for chunk in reader:
+                yield chunk[wanted]
+        return
+    if fmt == 'sqlite':
+        from sqlite_store import iter_sqlite
+        yield from iter_sqlite(path, columns, chunksize)
+        return
+
+    _require_pyarrow(fmt)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield _batch_to_pandas(batch)
+        return
+
+    import pyarrow as pa
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            yield _batch_to_pandas(batch)
+
+
+def _batch_to_pandas(batch):
+    """
+    Convert an Arrow record batch, decoding dictionary columns
+
+    Every batch of a dictionary column carries the dictionary of its whole
+    row group, so building a categorical per batch would cost O(customers)
+    each time; plain labels keep the cost proportional to the batch.
+    """
+    import pyarrow as pa
+    columns = [
+        column.dictionary_decode() if pa.types.is_dictionary(column.type) else column
+        for column in batch.columns
+    ]
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names).to_pandas()
+
+
+class TableWriter:
+    """
+    Append frames to one output file block by block
+
+    CSV blocks are appended as text, Parquet blocks become row groups and
+    SQLite blocks are bulk-inserted (indexed on close). Feather files
+    cannot be appended to, so streaming to Feather is rejected up front.
+    """
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.fmt = detect_format(path, fmt)
+        self._writer = None
+        self._first = True
+        if self.fmt == 'feather':
+            raise ValueError("Feather output cannot be written in blocks; "
+                             "use a .parquet or .csv path")
+        if self.fmt == 'parquet':
+            _require_pyarrow(self.fmt)
+        if self.fmt == 'sqlite':
+            from sqlite_store import SqliteWriter
+            self._writer = SqliteWriter(path)
+
+    def write(self, df):
+        """Append one block"""
+        if self.fmt == 'sqlite':
+            self._writer.write(df)
+        elif self.fmt == 'csv':
+            df.to_csv(self.path, index=False,
+                      mode='w' if self._first else 'a',
+                      header=self._first)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(compact_dtypes(df.reset_index(drop=True)),
+                                         preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                table = table.cast(self._writer.schema)
+            self._writer.write_table(table)
+        self._first = False
+
+    def close(self):
+        """Finish the file"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
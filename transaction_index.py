@@ -0,0 +1,338 @@
+"""
+Customer Transaction Index
+Customer-sorted transaction store with per-customer offsets for direct history lookups
+
+Transactions are sorted by customer code once (a stable sort, so each
+customer's rows keep their file order) and every column is saved as a .npy
+file in that order, next to an offsets array in compressed-sparse-row
+layout: customer c owns rows offsets[c]:offsets[c + 1]. Opening the index
+memory-maps the columns, so fetching a customer's history is a binary
+search over the sorted customer IDs and one slice per column, with no scan
+of the transactions; a batch of customers is one gather.
+
+The same sort is what the RFM stage needs: with rows contiguous per
+customer, recency, frequency and monetary are reductions over the offset
+runs (TransactionIndex.rfm), so pipeline.stage_rfm builds the index and
+the metrics from a single sort. Monetary then agrees with compute_rfm up
+to floating-point summation order.
+
+    index = TransactionIndex('transaction_index')
+    index.history('CUST00042')                     # one customer's orders
+    index.histories(at_risk['customer_id'])        # a batch, one gather
+
+Labels are stored as categorical codes, other strings as UTF-8 bytes.
+
+Author: Data Analytics Team
+Date: November 2025
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from compact_schema import CustomerDictionary
+from storage import read_table, write_table
+
+INDEX_DIR = 'transaction_index'
+META_FILE = 'index.json'
+OFFSETS_FILE = 'offsets.npy'
+CUSTOMERS_FILE = 'customer_ids.npy'
+
+# Bump when the on-disk layout changes
+INDEX_VERSION = 1
+
+
+def _encode_strings(values):
+    """Strings as a fixed-width UTF-8 bytes array (sorts like the strings)"""
+    return np.char.encode(np.asarray(values, dtype=str), 'utf-8')
+
+
+def _column_path(index_dir, column):
+    return os.path.join(index_dir, f'{column}.npy')
+
+
+def _store_column(series):
+    """On-disk array and meta entry of one transaction column"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), {'kind': 'category',
+                                             'categories': series.cat.categories.tolist()}
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_dtype(series.dtype):
+        return series.to_numpy(), {'kind': 'native'}
+    return _encode_strings(series.to_numpy(dtype=str)), {'kind': 'bytes'}
+
+
+def build_transaction_index(transactions, index_dir=INDEX_DIR, source=None):
+    """
+    Sort transactions by customer and save the columns with CSR offsets
+
+    Args:
+        transactions (pd.DataFrame): Transactions with a customer_id column
+        index_dir (str): Directory for the index files
+        source (dict): Fingerprint of the transaction file, recorded so
+            index_is_current can tell when the index is stale
+
+    Returns:
+        TransactionIndex: The new index, opened
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    # Written last, so an interrupted build is never taken for a complete one
+    meta_path = os.path.join(index_dir, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    customer_ids = transactions['customer_id']
+    labels = customer_ids.cat.categories if isinstance(customer_ids.dtype, pd.CategoricalDtype) else customer_ids
+    if not pd.api.types.is_string_dtype(labels.dtype):
+        # Look-ups binary-search the IDs as strings, so they must sort as strings
+        customer_ids = customer_ids.astype(str)
+    customers = CustomerDictionary.from_series(customer_ids)
+    codes = customers.encode(customer_ids)
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(customers))
+    offsets = np.zeros(len(customers) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    np.save(os.path.join(index_dir, OFFSETS_FILE), offsets)
+    np.save(os.path.join(index_dir, CUSTOMERS_FILE), _encode_strings(customers.ids.to_numpy(dtype=str)))
+    columns = {}
+    for col in transactions.columns:
+        if col == 'customer_id':
+            continue
+        values, columns[col] = _store_column(transactions[col])
+        # One column sorted at a time, so only one sorted copy is in memory
+        np.save(_column_path(index_dir, col), values[order])
+
+    meta = {'version': INDEX_VERSION, 'rows': int(len(transactions)), 'customers': len(customers),
+            'columns': columns, 'column_order': list(transactions.columns), 'source': source}
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2, default=str)
+    return TransactionIndex(index_dir)
+
+
+def index_is_current(index_dir, source):
+    """
+    Whether index_dir holds a complete index built from this source
+
+    Args:
+        index_dir (str): Index directory
+        source (dict): Fingerprint of the transaction file
+
+    Returns:
+        bool: True if the recorded source matches
+    """
+    meta_path = os.path.join(index_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return (meta.get('version') == INDEX_VERSION
+            and meta.get('source') == json.loads(json.dumps(source, default=str)))
+
+
+class TransactionIndex:
+    """
+    Memory-mapped, customer-sorted transactions with CSR offsets
+
+    Args:
+        index_dir (str): Directory written by build_transaction_index
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        with open(os.path.join(index_dir, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Index in '{index_dir}' has layout version {self.meta.get('version')}, "
+                             f"expected {INDEX_VERSION}; rebuild it")
+        self.index_dir = index_dir
+        self.offsets = np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode='r')
+        self.customer_ids = np.load(os.path.join(index_dir, CUSTOMERS_FILE), mmap_mode='r')
+        self.columns = {col: np.load(_column_path(index_dir, col), mmap_mode='r')
+                        for col in self.meta['columns']}
+        self._dtypes = {col: pd.CategoricalDtype(info['categories'])
+                        for col, info in self.meta['columns'].items() if info['kind'] == 'category'}
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    def __contains__(self, customer_id):
+        return bool(self._find([customer_id])[0] >= 0)
+
+    @property
+    def num_transactions(self):
+        return int(self.offsets[-1])
+
+    def _find(self, customer_ids):
+        """Codes of customer IDs by binary search; -1 where unknown"""
+        keys = _encode_strings(customer_ids)
+        codes = np.searchsorted(self.customer_ids, keys)
+        codes = np.minimum(codes, len(self.customer_ids) - 1)
+        return np.where(self.customer_ids[codes] == keys, codes, -1)
+
+    def codes(self, customer_ids):
+        """
+        Customer codes (positions in the offsets array) of customer IDs
+
+        Args:
+            customer_ids (array-like): Customer IDs
+
+        Returns:
+            np.ndarray: int64 codes
+
+        Raises:
+            KeyError: If any ID is not in the index
+        """
+        codes = self._find(np.asarray(customer_ids))
+        missing = np.flatnonzero(codes < 0)
+        if len(missing):
+            raise KeyError(f"{len(missing)} customer ID(s) not in the index, "
+                           f"e.g. '{np.asarray(customer_ids)[missing[0]]}'")
+        return codes
+
+    def _decode(self, column, values):
+        """Stored array of one column back to its original type"""
+        if column in self._dtypes:
+            return pd.Categorical.from_codes(values, dtype=self._dtypes[column])
+        if self.meta['columns'][column]['kind'] == 'bytes':
+            return np.char.decode(values, 'utf-8')
+        return np.asarray(values)
+
+    def _frame(self, ids, rows):
+        data = {col: ids if col == 'customer_id' else self._decode(col, self.columns[col][rows])
+                for col in self.meta['column_order']}
+        return pd.DataFrame(data)
+
+    def history(self, customer_id):
+        """
+        All transactions of one customer, in file order
+
+        Args:
+            customer_id (str): Customer ID
+
+        Returns:
+            pd.DataFrame: The customer's rows (empty columns if none)
+        """
+        code = self.codes([customer_id])[0]
+        start, end = int(self.offsets[code]), int(self.offsets[code + 1])
+        return self._frame(np.full(end - start, customer_id, dtype=object), slice(start, end))
+
+    def histories(self, customer_ids):
+        """
+        Transactions of several customers, gathered in one pass
+
+        Args:
+            customer_ids (array-like): Customer IDs
+
+        Returns:
+            pd.DataFrame: Their rows, grouped by customer in the order given
+        """
+        customer_ids = np.asarray(customer_ids)
+        codes = self.codes(customer_ids)
+        starts = np.asarray(self.offsets[codes])
+        lengths = np.asarray(self.offsets[codes + 1]) - starts
+        # Row positions of all slices: each run counts up from its start
+        run_starts = np.zeros(len(codes), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=run_starts[1:])
+        rows = np.arange(lengths.sum()) + np.repeat(starts - run_starts, lengths)
+        return self._frame(np.repeat(customer_ids.astype(object), lengths), rows)
+
+    def default_analysis_date(self):
+        """The day after the last transaction"""
+        return pd.Timestamp(self.columns['transaction_date'].max()) + timedelta(days=1)
+
+    def rfm(self, analysis_date=None):
+        """
+        RFM metrics from the offset runs, in the compute_rfm layout
+
+        Frequency counts the customer's rows; monetary agrees with
+        compute_rfm up to floating-point summation order.
+
+        Args:
+            analysis_date (datetime): Reference date for recency (default:
+                the day after the last transaction)
+
+        Returns:
+            pd.DataFrame: customer_id, recency, frequency and monetary,
+                ordered by customer_id
+        """
+        if analysis_date is None:
+            analysis_date = self.default_analysis_date()
+        starts = np.asarray(self.offsets[:-1])
+        last_purchase = np.maximum.reduceat(self.columns['transaction_date'], starts)
+        ids = np.char.decode(self.customer_ids, 'utf-8')
+        return pd.DataFrame({
+            'customer_id': pd.Categorical.from_codes(np.arange(len(ids)), categories=ids),
+            'recency': (pd.Timestamp(analysis_date) - pd.DatetimeIndex(last_purchase)).days.to_numpy(dtype=np.int64),
+            'frequency': np.diff(self.offsets),
+            'monetary': np.add.reduceat(self.columns['total_amount'], starts),
+        })
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Build a customer transaction index or fetch order histories from it'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Sort a transaction file into an index')
+    build.add_argument('--input', type=str, default='ecommerce_transactions.csv',
+                       help='Transaction file (default: ecommerce_transactions.csv)')
+    build.add_argument('--index-dir', type=str, default=INDEX_DIR,
+                       help=f'Index directory (default: {INDEX_DIR})')
+
+    history = subparsers.add_parser('history', help='Order histories of customers or of a segment')
+    history.add_argument('customers', type=str, nargs='*', help='Customer IDs')
+    history.add_argument('--segment', type=str, default=None,
+                         help="All customers of this segment in --results (e.g. 'At Risk')")
+    history.add_argument('--results', type=str, default='rfm_analysis_results.csv',
+                         help='Results file for --segment (default: rfm_analysis_results.csv)')
+    history.add_argument('--index-dir', type=str, default=INDEX_DIR,
+                         help=f'Index directory (default: {INDEX_DIR})')
+    history.add_argument('--output', type=str, default=None,
+                         help='Write the histories to this file instead of printing them')
+    args = parser.parse_args()
+
+    print("="*70)
+    print("CUSTOMER TRANSACTION INDEX")
+    print("="*70)
+
+    if args.command == 'build':
+        from stage_cache import fingerprint
+        start = time.perf_counter()
+        index = build_transaction_index(read_table(args.input), args.index_dir,
+                                        source=fingerprint(args.input))
+        print(f"\n✓ {index.num_transactions:,} transactions of {len(index):,} customers indexed "
+              f"in '{args.index_dir}' ({time.perf_counter() - start:.2f}s)")
+        return
+
+    index = TransactionIndex(args.index_dir)
+    customer_ids = list(args.customers)
+    if args.segment:
+        results = read_table(args.results, columns=['customer_id', 'segment'])
+        members = results.loc[results['segment'] == args.segment, 'customer_id'].astype(str).tolist()
+        if not members:
+            print(f"\nNo customers in segment '{args.segment}' in '{args.results}'")
+        customer_ids += members
+    elif not customer_ids:
+        parser.error('give customer IDs or --segment')
+    if not customer_ids:
+        return
+
+    start = time.perf_counter()
+    rows = index.histories(customer_ids)
+    seconds = time.perf_counter() - start
+    print(f"\n{len(rows):,} transactions of {len(customer_ids):,} customers ({seconds * 1000:.1f} ms)")
+    if args.output:
+        write_table(rows, args.output)
+        print(f"✓ Histories saved to '{args.output}'")
+    else:
+        print(rows.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()